@@ -0,0 +1,140 @@
+"""
+CPU inference benchmark: live adapter vs merged vs bf16 vs int8
+───────────────────────────────────────────────────────────────
+Each variant runs in its own subprocess so its peak RSS is its own:
+
+  fp32+adapter   base model + PeftModel (what test_inference.py used to do)
+  merged-fp32    export_merged.py output
+  merged-bf16    the same weights loaded as bfloat16
+  merged-int8    merged fp32 + dynamic int8 quantization of nn.Linear
+
+Every variant greedily generates the same ``--tokens`` tokens for the same
+prompt (after one short warm-up run) and reports load time, tokens/sec,
+the current RSS after loading and after generating (``VmRSS``, Linux
+only) and the peak RSS. The peak includes the load itself: merged-int8
+loads the full fp32 model before quantizing, so only its current RSS
+shows what int8 saves.
+
+    python export_merged.py              # once
+    python bench_inference.py --tokens 128 --repeats 3
+"""
+import argparse
+import gc
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+VARIANTS = {
+    "fp32+adapter": {"dtype": "fp32", "merged": False, "int8": False},
+    "merged-fp32":  {"dtype": "fp32", "merged": True,  "int8": False},
+    "merged-bf16":  {"dtype": "bf16", "merged": True,  "int8": False},
+    "merged-int8":  {"dtype": "fp32", "merged": True,  "int8": True},
+}
+
+SAMPLE_METADATA = {
+    "Fandom": "Harry Potter - J. K. Rowling",
+    "Characters": "Harry Potter, Hermione Granger",
+    "Rating": "Mature",
+    "Language": "English",
+}
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / 1024   # bytes vs KiB
+
+
+def current_rss_mb():
+    """Resident set size right now (``VmRSS``), or ``None`` off Linux."""
+    gc.collect()
+    try:
+        with open("/proc/self/status", encoding="ascii") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _mb(value):
+    return None if value is None else round(value, 1)
+
+
+def run_variant(name, tokens, repeats, merged_path, threads):
+    import torch
+    from inference import DTYPES, load_model
+    from json_convert import build_prompt
+
+    if threads:
+        torch.set_num_threads(threads)
+    spec = VARIANTS[name]
+    started = time.perf_counter()
+    tokenizer, model = load_model(dtype=DTYPES[spec["dtype"]], int8=spec["int8"],
+                                  merged=merged_path if spec["merged"] else None)
+    load_s = time.perf_counter() - started
+    rss_loaded = current_rss_mb()
+
+    inputs = tokenizer(build_prompt(SAMPLE_METADATA), return_tensors="pt")
+    gen = dict(do_sample=False, pad_token_id=tokenizer.pad_token_id, eos_token_id=None)
+    with torch.inference_mode():
+        model.generate(**inputs, max_new_tokens=4, **gen)   # warm-up
+        timings = []
+        for _ in range(repeats):
+            t = time.perf_counter()
+            model.generate(**inputs, max_new_tokens=tokens, **gen)   # no EOS: exactly *tokens*
+            timings.append(time.perf_counter() - t)
+    best = min(timings)
+    rss_generated = current_rss_mb()
+    return {
+        "variant": name,
+        "load_s": round(load_s, 2),
+        "tokens": tokens,
+        "tokens_per_sec": round(tokens / best, 2),
+        "rss_loaded_mb": _mb(rss_loaded),
+        "rss_generated_mb": _mb(rss_generated),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+if __name__ == "__main__":
+    from inference import MERGED_PATH
+
+    parser = argparse.ArgumentParser(description="Benchmark CPU inference variants")
+    parser.add_argument("--variants", nargs="+", choices=VARIANTS, default=list(VARIANTS))
+    parser.add_argument("--tokens", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--merged", default=MERGED_PATH, help="export_merged.py output (fp32)")
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = default)")
+    parser.add_argument("--json", metavar="FILE", help="also write the results here")
+    parser.add_argument("--child", metavar="VARIANT", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(run_variant(args.child, args.tokens, args.repeats, args.merged, args.threads)))
+        sys.exit(0)
+
+    if any(VARIANTS[v]["merged"] for v in args.variants) and not os.path.isdir(args.merged):
+        sys.exit(f"❌ {args.merged} not found; run export_merged.py first")
+
+    results = []
+    for name in args.variants:
+        print(f"⏱️  {name}...", flush=True)
+        cmd = [sys.executable, os.path.abspath(__file__), "--child", name, "--tokens", str(args.tokens),
+               "--repeats", str(args.repeats), "--merged", args.merged, "--threads", str(args.threads)]
+        proc = subprocess.run(cmd, capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"   ❌ failed:\n{proc.stderr[-2000:]}")
+            continue
+        results.append(json.loads(proc.stdout.strip().splitlines()[-1]))
+
+    print(f"\n{'variant':<14} {'load s':>8} {'tok/s':>8} {'RSS loaded':>11} {'RSS gen':>9} {'peak RSS':>9}  (MB)")
+    for r in results:
+        print(f"{r['variant']:<14} {r['load_s']:>8} {r['tokens_per_sec']:>8} {str(r['rss_loaded_mb']):>11} "
+              f"{str(r['rss_generated_mb']):>9} {r['peak_rss_mb']:>9}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
@@ -0,0 +1,259 @@
+"""
+Corpus → training set in one streaming pass
+───────────────────────────────────────────
+Replaces the filter_hp.py → hp_mature_explicit.jsonl → json_convert.py
+round trip: every ``ao3/*.jsonl.zst`` shard is streamed once, works are kept
+by fandom / rating / language, rendered with json_convert's prompt template
+and written straight out. Shards are processed in parallel; outputs are
+combined in shard order, so the result doesn't depend on ``--workers``.
+
+Output formats (``--format``):
+  jsonl       one prompt/response file, what train.py reads (default; same
+              content as running filter_hp.py + json_convert.py)
+  jsonl.zst   one zstd-compressed prompt/response shard per input shard
+  tokens      a token_cache.py directory (tokens.bin / offsets.npy /
+              meta.json), tokenized inside the workers; pass it to
+              ``train.py --token-dir``
+
+With ``--index DIR`` (a metadata store built from the same shards, see
+build_metadata_store.py) the predicates run on the index and only the
+matching records are read, by seeking to their recorded offsets.
+
+Usage:
+    python build_train_set.py --workers 8
+    python build_train_set.py --index ../../ao3_meta --language English
+    python build_train_set.py --fandom "Naruto" --rating Teen\\ And\\ Up\\ Audiences \\
+        --language English --format tokens --output ../../files/naruto_tokens
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.fields import LIST_FIELDS, split_field  # noqa: E402
+from common.jsonl_zst import ReadStats, iter_jsonl_zst_file, list_shards  # noqa: E402
+
+from filter_hp import ALLOWED_FANDOMS, ALLOWED_RATINGS, is_wanted  # noqa: E402
+from json_convert import to_prompt_response  # noqa: E402
+
+INPUT_DIR = os.path.join("../..", "ao3")
+OUTPUT_PATH = os.path.join("../..", "files", "hp_train_data.jsonl")
+FORMATS = ("jsonl", "jsonl.zst", "tokens")
+ZSTD_LEVEL = 3
+
+
+# ─── Per-shard worker ─────────────────────────────────────────────────────────
+def matches(fandom_list, rating, language, fandoms, ratings, languages):
+    if not is_wanted(fandom_list, rating or "", fandoms, ratings):
+        return False
+    return not languages or (language or "") in languages
+
+
+def iter_pairs(path, fandoms, ratings, languages, stats):
+    for entry in iter_jsonl_zst_file(path, stats=stats):
+        meta = entry.get("metadata", {})
+        if not matches(split_field(meta, LIST_FIELDS["fandoms"]), meta.get("Rating"),
+                       meta.get("Language"), fandoms, ratings, languages):
+            continue
+        pair = to_prompt_response(entry)
+        if pair:
+            yield pair
+
+
+def iter_indexed_pairs(path, store_file, fandoms, ratings, languages, stats):
+    """Like iter_pairs, but the predicates run on the index; only matches are read."""
+    from common.metadata_store import select_locations
+    from common.seekable_zst import read_spans
+
+    def wanted(fandom_list, rating, language):
+        return matches(fandom_list, rating, language, fandoms, ratings, languages)
+
+    locations = select_locations(store_file, ["fandoms", "rating", "language"], wanted)
+    for line in read_spans(path, locations):
+        stats.bytes += len(line) + 1
+        stats.records += 1
+        pair = to_prompt_response(json.loads(line))
+        if pair:
+            yield pair
+
+
+_tokenizer = None
+
+
+def _get_tokenizer(model):
+    global _tokenizer
+    if _tokenizer is None:
+        from transformers import AutoTokenizer
+        _tokenizer = AutoTokenizer.from_pretrained(model)
+    return _tokenizer
+
+
+def build_shard(job):
+    """Filter + render one shard into ``job["out"]``; returns ``(pairs kept, ReadStats)``."""
+    path, out, fmt = job["path"], job["out"], job["format"]
+    stats = ReadStats()
+    filters = job["fandoms"], job["ratings"], job["languages"]
+    if job["store"]:
+        pairs = iter_indexed_pairs(path, job["store"], *filters, stats)
+    else:
+        pairs = iter_pairs(path, *filters, stats)
+    kept = 0
+
+    if fmt == "tokens":
+        import numpy as np
+        from packing import encode_pair
+        from token_cache import token_dtype
+
+        tokenizer = _get_tokenizer(job["model"])
+        dtype = token_dtype(tokenizer)
+        lengths = []
+        with open(out, "wb") as f:
+            for pair in pairs:
+                ids = encode_pair(tokenizer, pair["prompt"], pair["response"])
+                np.asarray(ids, dtype=dtype).tofile(f)
+                lengths.append(len(ids))
+        np.save(out + ".lengths.npy", np.asarray(lengths, dtype=np.int64))
+        kept = len(lengths)
+    elif fmt == "jsonl.zst":
+        import zstandard as zstd
+        tmp = out + ".tmp"
+        with open(tmp, "wb") as raw, zstd.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(raw) as f:
+            for pair in pairs:
+                f.write((json.dumps(pair) + "\n").encode("utf-8"))
+                kept += 1
+        os.replace(tmp, out)
+    else:
+        with open(out, "w", encoding="utf-8") as f:
+            for pair in pairs:
+                f.write(json.dumps(pair) + "\n")
+                kept += 1
+
+    return kept, stats
+
+
+# ─── Combining ────────────────────────────────────────────────────────────────
+def concat_parts(parts, output_path):
+    tmp = output_path + ".tmp"
+    with open(tmp, "wb") as out:
+        for part in parts:
+            with open(part, "rb") as f:
+                shutil.copyfileobj(f, out, 1 << 20)
+            os.remove(part)
+    os.replace(tmp, output_path)
+
+
+def merge_token_parts(parts, output_dir, model, filters):
+    import numpy as np
+    from token_cache import META_FILE, OFFSETS_FILE, TOKENS_FILE, token_dtype, tokenizer_fingerprint
+    from packing import TEXT_TEMPLATE
+
+    tokenizer = _get_tokenizer(model)
+    lengths = [np.load(part + ".lengths.npy") for part in parts]
+    offsets = np.zeros(sum(len(x) for x in lengths) + 1, dtype=np.int64)
+    if lengths:
+        np.cumsum(np.concatenate(lengths), out=offsets[1:])
+
+    tmp_dir = output_dir.rstrip(os.sep) + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    concat_parts(parts, os.path.join(tmp_dir, TOKENS_FILE))
+    for part in parts:
+        os.remove(part + ".lengths.npy")
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+    meta = {
+        "data": filters["input"],
+        "filters": {k: v for k, v in filters.items() if k != "input"},
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "template": TEXT_TEMPLATE,
+        "dtype": np.dtype(token_dtype(tokenizer)).name,
+        "samples": len(offsets) - 1,
+        "tokens": int(offsets[-1]),
+    }
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.replace(tmp_dir, output_dir)
+
+
+# ─── Driver ───────────────────────────────────────────────────────────────────
+def build_train_set(input_dir, output, fmt="jsonl", fandoms=ALLOWED_FANDOMS, ratings=ALLOWED_RATINGS,
+                    languages=(), workers=1, model="tiiuae/falcon-rw-1b", index=None):
+    shards = list_shards(input_dir)
+    if fmt == "jsonl.zst":
+        os.makedirs(output, exist_ok=True)
+        part_dir = output
+    else:
+        part_dir = os.path.dirname(os.path.abspath(output))
+        os.makedirs(part_dir, exist_ok=True)
+
+    jobs = []
+    for path in shards:
+        name = os.path.basename(path)
+        if fmt == "jsonl.zst":
+            out = os.path.join(part_dir, name)
+        else:
+            out = os.path.join(part_dir, f".{os.path.basename(output)}.{name}.part")
+        store = None
+        if index:
+            from common.metadata_store import store_name
+            store = os.path.join(index, store_name(path))
+            if not os.path.exists(store):
+                raise FileNotFoundError(f"{store} missing; build the index with build_metadata_store.py")
+        jobs.append({"path": path, "out": out, "format": fmt, "model": model, "store": store,
+                     "fandoms": set(fandoms), "ratings": set(ratings), "languages": set(languages)})
+
+    print(f"🔍 Streaming {len(shards)} shards from {input_dir} ({workers} worker(s))...")
+    start = time.perf_counter()
+    total = ReadStats()
+    kept = 0
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, len(jobs))) as pool:
+            results = list(pool.map(build_shard, jobs))
+    else:
+        results = [build_shard(job) for job in jobs]
+    for job, (n, stats) in zip(jobs, results):
+        print(f"   {os.path.basename(job['path'])}: kept {n:,} of {stats.records:,} read")
+        kept += n
+        total.merge(stats)
+    total.started = start
+
+    parts = [job["out"] for job in jobs]
+    if fmt == "jsonl":
+        concat_parts(parts, output)
+    elif fmt == "tokens":
+        filters = {"input": os.path.abspath(input_dir), "fandoms": sorted(fandoms),
+                   "ratings": sorted(ratings), "languages": sorted(languages)}
+        merge_token_parts(parts, output, model, filters)
+
+    print(f"📊 {total.summary()}")
+    print(f"✅ Saved {kept:,} training pairs to {output}")
+    return kept
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stream AO3 shards into a prompt/response training set.")
+    parser.add_argument("--input", default=INPUT_DIR, help="folder of .jsonl.zst shards")
+    parser.add_argument("--output", default=OUTPUT_PATH,
+                        help="output file (jsonl) or directory (jsonl.zst / tokens)")
+    parser.add_argument("--format", choices=FORMATS, default="jsonl")
+    parser.add_argument("--fandom", action="append", metavar="NAME",
+                        help="keep works tagged with this fandom (repeatable; default: Harry Potter)")
+    parser.add_argument("--rating", action="append", metavar="NAME",
+                        help="keep works with this rating (repeatable; default: Mature, Explicit)")
+    parser.add_argument("--language", action="append", metavar="NAME",
+                        help="keep works in this language (repeatable; default: any)")
+    parser.add_argument("--index", metavar="DIR",
+                        help="metadata store built from --input; select via the index and seek")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--model", default="tiiuae/falcon-rw-1b", help="tokenizer for --format tokens")
+    args = parser.parse_args()
+
+    build_train_set(args.input, args.output, args.format,
+                    fandoms=args.fandom or ALLOWED_FANDOMS,
+                    ratings=args.rating or ALLOWED_RATINGS,
+                    languages=args.language or (),
+                    workers=args.workers, model=args.model, index=args.index)
@@ -0,0 +1,201 @@
+"""
+Checkpoint evaluation: held-out perplexity, generation speed, loss curves
+─────────────────────────────────────────────────────────────────────────
+For every checkpoint (adapter directory) given:
+
+  perplexity      over ``--limit`` prompt/response samples of ``--data``
+                  (required: train.py trains on all of hp_train_data.jsonl,
+                  so pass works kept out of it),
+                  tokenized exactly like train.py (packing.encode_pair),
+                  over-long samples split into ``--max-length`` windows,
+                  sorted by length and evaluated in padded batches under
+                  ``torch.inference_mode``
+  generation      tokens/sec over ``--gen-prompts`` prompts of the same
+                  samples, batched through inference.generate_batch
+  peak RSS        of the process evaluating that checkpoint (each runs in
+                  its own subprocess so the numbers don't bleed together)
+  training log    ``trainer_state.json``'s ``log_history``: last logged
+                  train loss here, every logged step in ``<report>.loss.csv``
+
+    python eval_checkpoints.py ../../fanfic_model/checkpoint-300 ../../fanfic_model/checkpoint-324 \\
+        --data ../../files/hp_heldout.jsonl --limit 200 --report ../../files/eval.jsonl
+
+``--report`` ending in ``.csv`` writes CSV, anything else JSONL.
+"""
+import argparse
+import csv
+import json
+import math
+import os
+import subprocess
+import sys
+import time
+
+from bench_inference import peak_rss_mb
+
+REPORT_PATH = os.path.join("../..", "files", "eval_report.jsonl")
+LOSS_FIELDS = ["checkpoint", "step", "epoch", "loss", "learning_rate", "grad_norm",
+               "tokens_per_sec", "padding_ratio", "samples_per_sec"]
+
+
+# ─── Training log ─────────────────────────────────────────────────────────────
+def read_log_history(checkpoint):
+    """The ``log_history`` entries of a checkpoint's trainer_state.json ([] if none)."""
+    path = os.path.join(checkpoint, "trainer_state.json")
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding="utf-8") as f:
+        return json.load(f).get("log_history", [])
+
+
+def loss_rows(checkpoint, history):
+    return [{"checkpoint": checkpoint, **{k: entry.get(k) for k in LOSS_FIELDS[1:]}}
+            for entry in history if "loss" in entry]
+
+
+# ─── Per-checkpoint measurements (run in a child process) ─────────────────────
+def load_samples(path, limit):
+    samples = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if len(samples) >= limit:
+                break
+            samples.append(json.loads(line))
+    return samples
+
+
+def perplexity(model, tokenizer, samples, max_length, batch_size):
+    import torch
+    import torch.nn.functional as F
+    from packing import IGNORE_INDEX, PadCollator, encode_pair, split_windows
+
+    ids = [encode_pair(tokenizer, s["prompt"], s["response"]) for s in samples]
+    rows = split_windows(max_length)({"input_ids": ids})["input_ids"]
+    rows.sort(key=len)                              # length bucketing: little padding per batch
+    collate = PadCollator(tokenizer.pad_token_id)
+    device = next(model.parameters()).device
+
+    nll, tokens = 0.0, 0
+    started = time.perf_counter()
+    with torch.inference_mode():
+        for i in range(0, len(rows), batch_size):
+            batch = collate([{"input_ids": r} for r in rows[i:i + batch_size]])
+            batch = {k: v.to(device) for k, v in batch.items()}
+            logits = model(input_ids=batch["input_ids"], attention_mask=batch["attention_mask"]).logits
+            labels = batch["labels"][:, 1:]
+            nll += F.cross_entropy(logits[:, :-1].float().reshape(-1, logits.shape[-1]),
+                                   labels.reshape(-1), ignore_index=IGNORE_INDEX,
+                                   reduction="sum").item()
+            tokens += int((labels != IGNORE_INDEX).sum())
+    elapsed = time.perf_counter() - started
+    return {
+        "eval_samples": len(samples),
+        "eval_rows": len(rows),
+        "eval_tokens": tokens,
+        "eval_loss": round(nll / tokens, 4) if tokens else None,
+        "perplexity": round(math.exp(nll / tokens), 3) if tokens else None,
+        "eval_tokens_per_sec": round(tokens / elapsed, 1) if elapsed else None,
+    }
+
+
+def generation_speed(model, tokenizer, samples, n_prompts, new_tokens):
+    from inference import generate_batch
+
+    requests = [{"prompt": s["prompt"], "max_new_tokens": new_tokens, "temperature": 0}
+                for s in samples[:n_prompts]]
+    if not requests:
+        return {}
+    started = time.perf_counter()
+    results = generate_batch(model, tokenizer, requests)
+    elapsed = time.perf_counter() - started
+    generated = sum(r["tokens"] for r in results)
+    return {
+        "gen_prompts": len(requests),
+        "gen_tokens": generated,
+        "gen_tokens_per_sec": round(generated / elapsed, 2) if elapsed else None,
+        "gen_ttft_s": round(sum(r["ttft_s"] for r in results) / len(results), 4),
+    }
+
+
+def evaluate_checkpoint(checkpoint, args):
+    import torch
+    from inference import BASE_MODEL, load_model
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    samples = load_samples(args.data, args.limit)
+    tokenizer, model = load_model(BASE_MODEL, checkpoint)
+    result = {"checkpoint": checkpoint}
+    result.update(perplexity(model, tokenizer, samples, args.max_length, args.batch_size))
+    result.update(generation_speed(model, tokenizer, samples, args.gen_prompts, args.gen_tokens))
+    result["peak_rss_mb"] = round(peak_rss_mb(), 1)
+    if torch.cuda.is_available():
+        result["peak_cuda_mb"] = round(torch.cuda.max_memory_allocated() / (1 << 20), 1)
+    return result
+
+
+# ─── Report ───────────────────────────────────────────────────────────────────
+def write_report(results, path):
+    if path.endswith(".csv"):
+        fields = list(dict.fromkeys(k for r in results for k in r))
+        with open(path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(results)
+    else:
+        with open(path, "w", encoding="utf-8") as f:
+            for r in results:
+                f.write(json.dumps(r) + "\n")
+
+
+def write_loss_curves(rows, path):
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=LOSS_FIELDS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare fanfic LoRA checkpoints")
+    parser.add_argument("checkpoints", nargs="+", help="adapter / checkpoint directories")
+    parser.add_argument("--data", required=True,
+                        help="held-out prompt/response .jsonl (not the training file)")
+    parser.add_argument("--limit", type=int, default=200, help="samples to evaluate")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--gen-prompts", type=int, default=4)
+    parser.add_argument("--gen-tokens", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = default)")
+    parser.add_argument("--report", default=REPORT_PATH, help=".jsonl or .csv")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(evaluate_checkpoint(args.checkpoints[0], args)))
+        sys.exit(0)
+
+    results, curves = [], []
+    passthrough = ["--data", args.data, "--limit", str(args.limit), "--max-length", str(args.max_length),
+                   "--batch-size", str(args.batch_size), "--gen-prompts", str(args.gen_prompts),
+                   "--gen-tokens", str(args.gen_tokens), "--threads", str(args.threads)]
+    for checkpoint in args.checkpoints:
+        print(f"🔍 Evaluating {checkpoint}...", flush=True)
+        history = read_log_history(checkpoint)
+        curves.extend(loss_rows(checkpoint, history))
+        proc = subprocess.run([sys.executable, os.path.abspath(__file__), checkpoint, "--child", *passthrough],
+                              capture_output=True, text=True)
+        if proc.returncode != 0:
+            print(f"   ❌ failed:\n{proc.stderr[-2000:]}")
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        losses = [e["loss"] for e in history if "loss" in e]
+        result["train_steps"] = max((e.get("step", 0) for e in history), default=None)
+        result["last_train_loss"] = losses[-1] if losses else None
+        results.append(result)
+        print(f"   perplexity {result['perplexity']}, {result.get('gen_tokens_per_sec')} gen tok/s, "
+              f"peak RSS {result['peak_rss_mb']:,} MB")
+
+    write_report(results, args.report)
+    loss_path = os.path.splitext(args.report)[0] + ".loss.csv"
+    write_loss_curves(curves, loss_path)
+    print(f"✅ Saved {len(results)} checkpoint results to {args.report} and loss curves to {loss_path}")
@@ -0,0 +1,44 @@
+"""
+Merge the LoRA adapter into the base weights
+────────────────────────────────────────────
+Inference with ``PeftModel`` runs the r=8 LoRA matmuls next to every
+``query_key_value`` projection on each token.  This folds the adapter into
+the base weights once and saves a standalone model (plus tokenizer) that
+test_inference.py / serve.py load with ``--merged``:
+
+    python export_merged.py                      # fp32 → ../../fanfic_model_merged
+    python export_merged.py --dtype bf16 --output ../../fanfic_model_merged_bf16
+
+int8 is not an export format: dynamic quantization takes seconds, so it is
+applied at load time (``--int8``) on top of the fp32 export.
+"""
+import argparse
+import time
+
+import torch
+from peft import PeftModel
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from inference import ADAPTER_PATH, BASE_MODEL, DTYPES, MERGED_PATH
+
+
+def export_merged(base=BASE_MODEL, adapter=ADAPTER_PATH, output=MERGED_PATH, dtype="fp32"):
+    started = time.perf_counter()
+    tokenizer = AutoTokenizer.from_pretrained(base)
+    # Merge in fp32 so the folded-in LoRA delta isn't rounded twice.
+    model = AutoModelForCausalLM.from_pretrained(base, torch_dtype=torch.float32)
+    model = PeftModel.from_pretrained(model, adapter).merge_and_unload()
+    model = model.to(DTYPES[dtype])
+    model.save_pretrained(output, safe_serialization=True)
+    tokenizer.save_pretrained(output)
+    print(f"✅ Merged {adapter} into {base} ({dtype}) in {time.perf_counter() - started:,.1f}s → {output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Merge the LoRA adapter into a standalone model")
+    parser.add_argument("--base", default=BASE_MODEL)
+    parser.add_argument("--adapter", default=ADAPTER_PATH)
+    parser.add_argument("--output", default=MERGED_PATH)
+    parser.add_argument("--dtype", choices=DTYPES, default="fp32")
+    args = parser.parse_args()
+    export_merged(args.base, args.adapter, args.output, args.dtype)
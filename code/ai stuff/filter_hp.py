@@ -1,5 +1,7 @@
+import argparse
 import json
 import os
+import sys
 
 INPUT_PATH = os.path.join("../..", "files", "ao3_9900001-10000000.jsonl")
 OUTPUT_PATH = os.path.join("../..", "files", "hp_mature_explicit.jsonl")
@@ -7,6 +9,9 @@ OUTPUT_PATH = os.path.join("../..", "files", "hp_mature_explicit.jsonl")
 ALLOWED_FANDOMS = {"Harry Potter - Fandom", "Harry Potter - J. K. Rowling"}
 ALLOWED_RATINGS = {"Mature", "Explicit"}
 
+def is_wanted(fandoms, rating, allowed_fandoms=ALLOWED_FANDOMS, allowed_ratings=ALLOWED_RATINGS):
+    return any(f in allowed_fandoms for f in fandoms) and rating in allowed_ratings
+
 def filter_hp_entries(input_file, output_file):
     count = 0
 
@@ -20,7 +25,7 @@ def filter_hp_entries(input_file, output_file):
 
                 # Split and check all fandoms
                 fandoms = [f.strip() for f in fandom_raw.split(",")]
-                if any(f in ALLOWED_FANDOMS for f in fandoms) and rating in ALLOWED_RATINGS:
+                if is_wanted(fandoms, rating):
                     f_out.write(json.dumps(entry) + "\n")
                     count += 1
             except json.JSONDecodeError:
@@ -28,5 +33,33 @@ def filter_hp_entries(input_file, output_file):
 
     print(f"✅ Saved {count} filtered Harry Potter fanfics to {output_file}")
 
+def filter_hp_entries_with_store(input_file, store_file, output_file):
+    """
+    Same output as filter_hp_entries, but the fandom/rating check runs on the
+    Arrow metadata store built from *input_file*; the matching records are
+    then read straight from their byte offsets, nothing else is parsed.
+    """
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+    from common.metadata_store import select_locations
+    from common.seekable_zst import read_spans
+
+    wanted = select_locations(store_file, ["fandoms", "rating"], is_wanted)
+
+    count = 0
+    with open(output_file, "w", encoding="utf-8") as f_out:
+        for line in read_spans(input_file, wanted):
+            f_out.write(json.dumps(json.loads(line)) + "\n")
+            count += 1
+
+    print(f"✅ Saved {count} filtered Harry Potter fanfics to {output_file}")
+
 if __name__ == "__main__":
-    filter_hp_entries(INPUT_PATH, OUTPUT_PATH)
+    parser = argparse.ArgumentParser(description="Keep Harry Potter Mature/Explicit works.")
+    parser.add_argument("--store", metavar="FILE",
+                        help="Arrow store file built from INPUT_PATH (build_metadata_store.py --input ...)")
+    args = parser.parse_args()
+
+    if args.store:
+        filter_hp_entries_with_store(INPUT_PATH, args.store, OUTPUT_PATH)
+    else:
+        filter_hp_entries(INPUT_PATH, OUTPUT_PATH)
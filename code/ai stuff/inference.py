@@ -0,0 +1,272 @@
+"""
+Shared model loading and batched generation for the fanfic LoRA model
+──────────────────────────────────────────────────────────────────────
+``load_model`` loads the base model + adapter once; ``generate_batch`` runs
+one left-padded batch through a hand-rolled decode loop with the KV cache,
+so every row can have its own sampling settings and stream its tokens out
+as they are produced (see serve.py). An optional ``PrefixCache`` skips
+prefilling template prefixes that earlier prompts already went through.
+
+Prompts come either verbatim (``"prompt"``) or from AO3-style metadata
+(``"metadata": {"Fandom": ..., "Characters": ...}``) rendered with the same
+template json_convert.py used for the training data.
+"""
+import inspect
+import math
+import os
+import time
+
+import torch
+from transformers import AutoModelForCausalLM, AutoTokenizer
+
+from json_convert import build_prompt
+from prefix_cache import encode_with_boundaries, left_pad_stack, to_legacy, to_model_cache
+
+BASE_MODEL = "tiiuae/falcon-rw-1b"
+ADAPTER_PATH = os.path.join("../..", "fanfic_model")
+MERGED_PATH = os.path.join("../..", "fanfic_model_merged")
+DTYPES = {"fp32": torch.float32, "bf16": torch.bfloat16}
+
+DEFAULTS = {"max_new_tokens": 600, "temperature": 0.9, "top_p": 0.95}
+
+
+# ─── Loading ──────────────────────────────────────────────────────────────────
+def load_model(base=BASE_MODEL, adapter=ADAPTER_PATH, dtype=torch.float32, merged=None, int8=False):
+    """
+    ``(tokenizer, model)`` ready for batched generation (left padding, eval mode).
+
+    *merged* loads a standalone model written by export_merged.py instead of
+    base + live adapter.  *int8* applies dynamic int8 quantization to every
+    ``nn.Linear`` (CPU only, needs fp32 weights).
+    """
+    if merged:
+        tokenizer = AutoTokenizer.from_pretrained(merged)
+        model = AutoModelForCausalLM.from_pretrained(merged, torch_dtype=dtype)
+    else:
+        tokenizer = AutoTokenizer.from_pretrained(base)
+        model = AutoModelForCausalLM.from_pretrained(base, torch_dtype=dtype)
+        if adapter:
+            from peft import PeftModel
+            model = PeftModel.from_pretrained(model, adapter)
+    if int8:
+        if dtype != torch.float32:
+            raise ValueError("int8 dynamic quantization needs fp32 weights")
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    if tokenizer.pad_token is None:
+        tokenizer.pad_token = tokenizer.eos_token
+    tokenizer.padding_side = "left"
+    model.eval()
+    return tokenizer, model
+
+
+def request_prompt(request):
+    """The prompt text of a request dict: ``prompt`` as-is, or ``metadata`` rendered."""
+    if isinstance(request.get("prompt"), str) and request["prompt"]:
+        return request["prompt"]
+    if isinstance(request.get("metadata"), dict):
+        return build_prompt(request["metadata"])
+    raise ValueError("request needs a 'prompt' string or a 'metadata' object")
+
+
+def request_params(request):
+    """``DEFAULTS`` overridden by the request's own values; ``ValueError`` if one is out of range."""
+    params = dict(DEFAULTS)
+    for key in DEFAULTS:
+        value = request.get(key)
+        if value is None:
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not math.isfinite(value):
+            raise ValueError(f"{key!r} must be a finite number")
+        params[key] = value
+    if params["max_new_tokens"] != int(params["max_new_tokens"]) or params["max_new_tokens"] < 1:
+        raise ValueError("'max_new_tokens' must be a positive integer")
+    if params["temperature"] < 0:
+        raise ValueError("'temperature' must be >= 0 (0 = greedy)")
+    if not 0 < params["top_p"] <= 1:
+        raise ValueError("'top_p' must be in (0, 1]")
+    return params
+
+
+# ─── Sampling ─────────────────────────────────────────────────────────────────
+def sample_next(logits, temperature, top_p):
+    """
+    One token per row of *logits* with per-row *temperature* / *top_p*
+    tensors; a temperature of 0 means greedy.
+    """
+    greedy = temperature <= 0
+    scaled = logits / temperature.clamp(min=1e-5).unsqueeze(1)
+    probs = torch.softmax(scaled.float(), dim=-1)
+    sorted_probs, order = probs.sort(dim=-1, descending=True)
+    # drop tokens once the mass before them already reaches top_p
+    drop = sorted_probs.cumsum(dim=-1) - sorted_probs >= top_p.unsqueeze(1)
+    sorted_probs = sorted_probs.masked_fill(drop, 0.0)
+    picked = torch.multinomial(sorted_probs, 1).squeeze(1)
+    tokens = order.gather(1, picked.unsqueeze(1)).squeeze(1)
+    return torch.where(greedy, logits.argmax(dim=-1), tokens)
+
+
+class TextStream:
+    """Turns a growing list of token IDs into text deltas (no half characters)."""
+
+    def __init__(self, tokenizer):
+        self.tokenizer = tokenizer
+        self.ids = []
+        self.sent = 0
+
+    def push(self, token_id):
+        self.ids.append(token_id)
+        text = self.tokenizer.decode(self.ids, skip_special_tokens=True)
+        if text.endswith("�"):       # incomplete multi-byte character
+            return ""
+        delta, self.sent = text[self.sent:], len(text)
+        return delta
+
+
+# ─── Batched decode loop ──────────────────────────────────────────────────────
+def _accepts_position_ids(model):
+    try:
+        return "position_ids" in inspect.signature(model.forward).parameters
+    except (TypeError, ValueError):
+        return False
+
+
+def _select_rows(past, keep):
+    """Drop finished rows from the KV cache when the cache type allows it."""
+    if hasattr(past, "batch_select_indices"):
+        past.batch_select_indices(keep)
+        return past
+    return None
+
+
+def _prefill(model, tokenizer, prompts, device, with_positions):
+    """Batched prefill: ``(past, attention_mask, last-position logits)``."""
+    enc = tokenizer(prompts, return_tensors="pt", padding=True)
+    input_ids = enc["input_ids"].to(device)
+    attention_mask = enc["attention_mask"].to(device)
+    kwargs = {"attention_mask": attention_mask, "use_cache": True}
+    if with_positions:
+        kwargs["position_ids"] = (attention_mask.cumsum(dim=1) - 1).clamp(min=0)
+    out = model(input_ids=input_ids, **kwargs)
+    return out.past_key_values, attention_mask, out.logits[:, -1, :]
+
+
+def _prefill_cached(model, tokenizer, prompts, device, with_positions, prefix_cache):
+    """
+    Prefill through *prefix_cache*: every row resumes from its longest cached
+    prefix, new prefixes are cached, and the per-row caches are left-padded
+    into one batch.
+    """
+    rows, logits, lengths = [], [], []
+    for prompt in prompts:
+        ids, boundaries = encode_with_boundaries(tokenizer, prompt)
+        hit, cached = prefix_cache.lookup(ids, boundaries)
+        rest = torch.tensor([ids[hit:]], device=device)
+        kwargs = {"attention_mask": torch.ones((1, len(ids)), dtype=torch.long, device=device),
+                  "use_cache": True}
+        if cached is not None:
+            kwargs["past_key_values"] = to_model_cache(cached, prefix_cache.dynamic)
+        if with_positions:
+            kwargs["position_ids"] = torch.arange(hit, len(ids), device=device).unsqueeze(0)
+        out = model(input_ids=rest, **kwargs)
+        prefix_cache.store(ids, boundaries, out.past_key_values)
+        rows.append(to_legacy(out.past_key_values))
+        logits.append(out.logits[:, -1, :])
+        lengths.append(len(ids))
+
+    width = max(lengths)
+    attention_mask = torch.zeros((len(prompts), width), dtype=torch.long, device=device)
+    for row, n in enumerate(lengths):
+        attention_mask[row, width - n:] = 1
+    past = to_model_cache(left_pad_stack(rows), prefix_cache.dynamic)
+    return past, attention_mask, torch.cat(logits, dim=0)
+
+
+@torch.inference_mode()
+def generate_batch(model, tokenizer, requests, on_token=None, prefix_cache=None):
+    """
+    Generate for a list of request dicts (``prompt`` / ``metadata`` plus
+    optional ``max_new_tokens``, ``temperature``, ``top_p``) in one batch.
+
+    ``on_token(i, text_delta)`` is called as request *i* produces text.
+    With a ``prefix_cache.PrefixCache`` the prompts' shared template prefixes
+    are reused instead of prefilled again.
+    Returns one dict per request with the text, token count, time to first
+    token and total latency.
+    """
+    params = [request_params(r) for r in requests]
+    prompts = [request_prompt(r) for r in requests]
+    device = next(model.parameters()).device
+    with_positions = _accepts_position_ids(model)
+
+    n = len(requests)
+    temperature = torch.tensor([p["temperature"] for p in params], device=device)
+    top_p = torch.tensor([p["top_p"] for p in params], device=device)
+    limits = [int(p["max_new_tokens"]) for p in params]
+    streams = [TextStream(tokenizer) for _ in range(n)]
+    first_token = [None] * n
+    started = time.perf_counter()
+
+    if prefix_cache is not None:
+        past, attention_mask, logits = _prefill_cached(model, tokenizer, prompts, device,
+                                                       with_positions, prefix_cache)
+    else:
+        past, attention_mask, logits = _prefill(model, tokenizer, prompts, device, with_positions)
+
+    rows = list(range(n))               # request index of each live batch row
+    done = [False] * n
+    finished_at = [None] * n
+    eos = tokenizer.eos_token_id
+    for step in range(max(limits)):
+        if step:
+            kwargs = {"attention_mask": attention_mask, "past_key_values": past, "use_cache": True}
+            if with_positions:
+                kwargs["position_ids"] = (attention_mask.cumsum(dim=1) - 1).clamp(min=0)[:, -1:]
+            out = model(input_ids=step_ids, **kwargs)
+            past = out.past_key_values
+            logits = out.logits[:, -1, :]
+        next_ids = sample_next(logits, temperature, top_p)
+
+        now = time.perf_counter()
+        for b, i in enumerate(rows):
+            if done[i]:
+                continue
+            token = int(next_ids[b])
+            if first_token[i] is None:
+                first_token[i] = now - started
+            if token != eos:
+                delta = streams[i].push(token)
+                if delta and on_token is not None:
+                    on_token(i, delta)
+            if token == eos or len(streams[i].ids) >= limits[i]:
+                done[i] = True
+                finished_at[i] = now - started
+
+        keep = [b for b, i in enumerate(rows) if not done[i]]
+        if not keep:
+            break
+        if len(keep) < len(rows):
+            keep_idx = torch.tensor(keep, device=device)
+            pruned = _select_rows(past, keep_idx)
+            if pruned is not None:      # otherwise finished rows just ride along
+                past = pruned
+                rows = [rows[b] for b in keep]
+                next_ids = next_ids[keep_idx]
+                attention_mask = attention_mask[keep_idx]
+                temperature, top_p = temperature[keep_idx], top_p[keep_idx]
+
+        step_ids = next_ids.unsqueeze(1)
+        attention_mask = torch.cat([attention_mask, attention_mask.new_ones((len(rows), 1))], dim=1)
+
+    total = time.perf_counter() - started
+    results = []
+    for i in range(n):
+        latency = finished_at[i] if finished_at[i] is not None else total
+        tokens = len(streams[i].ids)
+        results.append({
+            "text": tokenizer.decode(streams[i].ids, skip_special_tokens=True),
+            "tokens": tokens,
+            "ttft_s": round(first_token[i] or 0.0, 4),
+            "latency_s": round(latency, 4),
+            "tokens_per_sec": round(tokens / latency, 2) if latency else 0.0,
+        })
+    return results
@@ -8,43 +8,48 @@ INPUT_PATH = os.path.join("../..", "files", "hp_mature_explicit.jsonl")
 OUTPUT_PATH = os.path.join("../..", "files", "hp_train_data.jsonl")
 
 
+def build_prompt(meta):
+    # === Extract relevant metadata fields ===
+    fandom = meta.get("Fandom", "Unknown")
+    characters = meta.get("Characters", "Unknown")
+    tags = meta.get("Additional Tags", "")
+    rating = meta.get("Rating", "Unknown")
+    relationship = meta.get("Relationship", "None")
+    warning = meta.get("Archive Warning", "")
+    language = meta.get("Language", "English")
+
+    # === Build the prompt ===
+    return (
+        f"Fandom: {fandom}\n"
+        f"Characters: {characters}\n"
+        f"Tags: {tags}\n"
+        f"Rating: {rating}\n"
+        f"Relationship: {relationship}\n"
+        f"Warning: {warning}\n"
+        f"Language: {language}\n\n"
+        "Write a fanfiction scene:"
+    )
+
+
+def to_prompt_response(entry):
+    """A work record → ``{"prompt", "response"}``, or None if it has no text."""
+    response = entry.get("text", "").strip()
+    if not response:
+        return None
+    return {
+        "prompt": build_prompt(entry.get("metadata", {})),
+        "response": response
+    }
+
+
 def convert_to_prompt_response(input_file, output_file):
     with open(input_file, "r", encoding="utf-8") as f_in, open(output_file, "w", encoding="utf-8") as f_out:
         printed = False  # Print only one sample
 
         for line in f_in:
-            entry = json.loads(line)
-            meta = entry.get("metadata", {})
-
-            # === Extract relevant metadata fields ===
-            fandom = meta.get("Fandom", "Unknown")
-            characters = meta.get("Characters", "Unknown")
-            tags = meta.get("Additional Tags", "")
-            rating = meta.get("Rating", "Unknown")
-            relationship = meta.get("Relationship", "None")
-            warning = meta.get("Archive Warning", "")
-            language = meta.get("Language", "English")
-
-            # === Build the prompt ===
-            prompt = (
-                f"Fandom: {fandom}\n"
-                f"Characters: {characters}\n"
-                f"Tags: {tags}\n"
-                f"Rating: {rating}\n"
-                f"Relationship: {relationship}\n"
-                f"Warning: {warning}\n"
-                f"Language: {language}\n\n"
-                "Write a fanfiction scene:"
-            )
-
-            response = entry.get("text", "").strip()
-
-            if response:
-                formatted = {
-                    "prompt": prompt,
-                    "response": response
-                }
+            formatted = to_prompt_response(json.loads(line))
 
+            if formatted:
                 # ✅ Print first example for verification
                 if not printed:
                     print("🔍 Sample Prompt-Response Pair:")
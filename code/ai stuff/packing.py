@@ -0,0 +1,273 @@
+"""
+Packing / dynamic padding for the LoRA training data
+─────────────────────────────────────────────────────
+train.py used to pad every ``prompt\\nresponse`` pair to 512 tokens and cut
+off everything past that. This module lays the tokenized samples out in one
+of two ways instead:
+
+  bucket  one sample per row; samples longer than ``max_length`` are split
+          into consecutive windows rather than truncated. The Trainer groups
+          rows of similar length (``group_by_length``) and the collator pads
+          each batch only up to its longest row.
+  pack    samples are EOS-terminated and concatenated into ``max_length``
+          blocks, so almost no step is spent on pad tokens. The label of the
+          first token of every sample is masked, so no sample is trained to
+          continue the previous one. Falcon's ALiBi attention can't take a
+          block-diagonal mask, so tokens can still *attend* back into the
+          previous sample of the block (like run_clm / TRL packing). Use
+          ``bucket`` when exact per-sample attention matters.
+
+Pad positions are always masked out of the loss (labels = -100).
+``MeteredTrainer`` + ``ThroughputCallback`` add tokens/sec, samples/sec, the
+live padding ratio and the optimizer step time to every log line.
+"""
+import time
+
+import torch
+from transformers import Trainer, TrainerCallback
+from transformers.trainer_pt_utils import LengthGroupedSampler
+
+IGNORE_INDEX = -100
+LAYOUTS = ("bucket", "pack")
+TEXT_TEMPLATE = "{prompt}\n{response}"
+
+
+# ─── Tokenizing ───────────────────────────────────────────────────────────────
+def encode_pair(tokenizer, prompt, response):
+    """``prompt\\nresponse`` → token IDs, always ending in EOS."""
+    ids = tokenizer(TEXT_TEMPLATE.format(prompt=prompt, response=response))["input_ids"]
+    eos = tokenizer.eos_token_id
+    if eos is not None and (not ids or ids[-1] != eos):
+        ids.append(eos)
+    return ids
+
+
+def tokenize_batch(tokenizer):
+    """``datasets.map(batched=True)`` function: prompt/response → ``input_ids``."""
+    def fn(batch):
+        return {"input_ids": [encode_pair(tokenizer, p, r)
+                              for p, r in zip(batch["prompt"], batch["response"])]}
+    return fn
+
+
+# ─── Layouts ──────────────────────────────────────────────────────────────────
+def split_windows(max_length):
+    """
+    ``bucket`` layout: one row per sample, over-long samples split into windows.
+
+    Consecutive windows overlap by one token, so every token of the sample is
+    still predicted exactly once.
+    """
+    def fn(batch):
+        rows = {"input_ids": [], "labels": [], "length": []}
+        for ids in batch["input_ids"]:
+            for start in range(0, max(len(ids) - 1, 1), max_length - 1):
+                window = ids[start:start + max_length]
+                rows["input_ids"].append(window)
+                rows["labels"].append(list(window))
+                rows["length"].append(len(window))
+        return rows
+    return fn
+
+
+def pack_blocks(block_size):
+    """
+    ``pack`` layout: concatenate samples into ``block_size`` blocks.
+
+    Only the last block of each call can be short, so map it over the whole
+    dataset in one batch.
+    """
+    def fn(batch):
+        rows = {"input_ids": [], "labels": [], "length": []}
+        ids_buf, labels_buf = [], []
+
+        def emit(n):
+            rows["input_ids"].append(ids_buf[:n])
+            rows["labels"].append(labels_buf[:n])
+            rows["length"].append(n)
+            del ids_buf[:n], labels_buf[:n]
+
+        for ids in batch["input_ids"]:
+            labels = list(ids)
+            if ids_buf:
+                # Don't train on predicting this sample's first token from the
+                # previous sample's EOS.
+                labels[0] = IGNORE_INDEX
+            ids_buf.extend(ids)
+            labels_buf.extend(labels)
+            while len(ids_buf) >= block_size:
+                emit(block_size)
+        if len(ids_buf) > 1:  # short tail block, padded by the collator
+            emit(len(ids_buf))
+        return rows
+    return fn
+
+
+def check_layout(layout):
+    if layout not in LAYOUTS:
+        raise ValueError(f"unknown layout {layout!r} (expected one of {', '.join(LAYOUTS)})")
+
+
+def tokenize_dataset(dataset, tokenizer, num_proc=None):
+    """prompt/response dataset → ``input_ids`` column."""
+    return dataset.map(tokenize_batch(tokenizer), batched=True, num_proc=num_proc,
+                       remove_columns=dataset.column_names, desc="Tokenizing")
+
+
+def build_dataset(dataset, tokenizer, layout="bucket", max_length=512, num_proc=None):
+    """prompt/response dataset → rows of ``input_ids``/``labels``/``length``."""
+    check_layout(layout)
+    tokenized = tokenize_dataset(dataset, tokenizer, num_proc)
+    if layout == "pack":
+        # One batch over the whole stream: a per-batch buffer would end every
+        # batch in a short padded block (token_cache.block_rows packs globally too).
+        rows = tokenized.map(pack_blocks(max_length), batched=True, batch_size=None,
+                             remove_columns=tokenized.column_names, desc="Laying out (pack)")
+    else:
+        rows = tokenized.map(split_windows(max_length), batched=True, num_proc=num_proc,
+                             remove_columns=tokenized.column_names, desc="Laying out (bucket)")
+    report_layout([len(ids) for ids in tokenized["input_ids"]], len(rows), max_length)
+    return rows
+
+
+def report_layout(lengths, n_rows, max_length):
+    """Compare a layout with the old pad-to-``max_length`` one; *lengths* are per sample."""
+    lengths = [int(n) for n in lengths]
+    tokens = sum(lengths)
+    truncated = sum(n > max_length for n in lengths)
+    old_kept = sum(min(n, max_length) for n in lengths)
+    old_total = max_length * len(lengths)
+    print(f"📦 {len(lengths):,} samples → {n_rows:,} rows, {tokens:,} tokens")
+    if old_total:
+        print(f"   max_length={max_length} padding would have been "
+              f"{1 - old_kept / old_total:.1%} pad tokens and truncated {truncated:,} samples "
+              f"({tokens - old_kept:,} tokens dropped)")
+
+
+# ─── Collator ─────────────────────────────────────────────────────────────────
+class TokenMeter:
+    """Rows and real vs padded tokens fed to the model since the last ``reset``."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.started = time.perf_counter()
+        self.real = 0
+        self.padded = 0
+        self.rows = 0
+
+    def add(self, real, padded, rows=0):
+        self.real += real
+        self.padded += padded
+        self.rows += rows
+
+    def add_batch(self, inputs):
+        """Count a collated batch (``input_ids`` / ``attention_mask`` tensors)."""
+        mask = inputs.get("attention_mask")
+        ids = inputs["input_ids"]
+        real = int(mask.sum()) if mask is not None else ids.numel()
+        self.add(real, ids.numel(), ids.shape[0])
+
+    def snapshot(self):
+        elapsed = max(time.perf_counter() - self.started, 1e-9)
+        return {
+            "tokens_per_sec": round(self.real / elapsed, 1),
+            "samples_per_sec": round(self.rows / elapsed, 3),
+            "padding_ratio": round(1 - self.real / self.padded, 4) if self.padded else 0.0,
+        }
+
+
+class PadCollator:
+    """Pad a batch to its longest row (rounded up to ``multiple``)."""
+
+    def __init__(self, pad_token_id, multiple=8, meter=None):
+        self.pad_token_id = pad_token_id
+        self.multiple = multiple
+        self.meter = meter
+
+    def __call__(self, features):
+        longest = max(len(f["input_ids"]) for f in features)
+        width = -(-longest // self.multiple) * self.multiple
+        input_ids = torch.full((len(features), width), self.pad_token_id, dtype=torch.long)
+        labels = torch.full((len(features), width), IGNORE_INDEX, dtype=torch.long)
+        attention_mask = torch.zeros((len(features), width), dtype=torch.long)
+        real = 0
+        for row, f in enumerate(features):
+            n = len(f["input_ids"])
+            input_ids[row, :n] = torch.as_tensor(f["input_ids"])
+            labels[row, :n] = torch.as_tensor(f.get("labels", f["input_ids"]))
+            attention_mask[row, :n] = 1
+            real += n
+        if self.meter is not None:
+            self.meter.add(real, input_ids.numel(), len(features))
+        return {"input_ids": input_ids, "attention_mask": attention_mask, "labels": labels}
+
+
+class MeteredTrainer(Trainer):
+    """
+    ``Trainer`` that feeds every training batch to a ``TokenMeter``.
+
+    Counting here rather than in the collator keeps the numbers right when
+    batches are collated in DataLoader worker processes. With
+    ``group_by_length`` it also takes the row lengths of a token cache
+    directly instead of reading every row.
+    """
+
+    def __init__(self, *args, meter, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.meter = meter
+
+    def training_step(self, model, inputs, *args, **kwargs):
+        self.meter.add_batch(inputs)
+        return super().training_step(model, inputs, *args, **kwargs)
+
+    def _get_train_sampler(self, *args, **kwargs):
+        # Trainer only finds lengths in a datasets.Dataset column; otherwise its
+        # LengthGroupedSampler reads every row to measure it. Token caches
+        # (token_cache.TokenCacheDataset) know their row lengths already.
+        dataset = args[0] if args else kwargs.get("train_dataset")
+        if dataset is None:
+            dataset = self.train_dataset
+        if self.args.group_by_length and hasattr(dataset, "row_lengths"):
+            return LengthGroupedSampler(self.args.train_batch_size * self.args.gradient_accumulation_steps,
+                                        lengths=dataset.row_lengths().tolist())
+        return super()._get_train_sampler(*args, **kwargs)
+
+
+class ThroughputCallback(TrainerCallback):
+    """
+    Add ``tokens_per_sec`` / ``samples_per_sec`` / ``padding_ratio`` and the
+    mean optimizer ``step_time_s`` since the previous log to each log entry,
+    and print them.  The meter is reset at every log, so each entry is that
+    interval's rate rather than a run-wide average that hides slowdowns.
+    """
+
+    def __init__(self, meter):
+        self.meter = meter
+        self._step_started = None
+        self._step_times = []
+
+    def on_train_begin(self, args, state, control, **kwargs):
+        self.meter.reset()
+
+    def on_step_begin(self, args, state, control, **kwargs):
+        self._step_started = time.perf_counter()
+
+    def on_step_end(self, args, state, control, **kwargs):
+        if self._step_started is not None:
+            self._step_times.append(time.perf_counter() - self._step_started)
+
+    def on_log(self, args, state, control, logs=None, **kwargs):
+        stats = self.meter.snapshot()
+        self.meter.reset()
+        if self._step_times:
+            stats["step_time_s"] = round(sum(self._step_times) / len(self._step_times), 3)
+            self._step_times = []
+        if state.log_history:
+            state.log_history[-1].update(stats)
+        if state.is_world_process_zero:
+            step_time = f", {stats['step_time_s']:.2f}s/step" if "step_time_s" in stats else ""
+            print(f"⚡ step {state.global_step}: {stats['tokens_per_sec']:,.0f} tokens/s, "
+                  f"{stats['samples_per_sec']:,.2f} samples/s, "
+                  f"{stats['padding_ratio']:.1%} padding{step_time}")
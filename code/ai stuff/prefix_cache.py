@@ -0,0 +1,144 @@
+"""
+Prompt-prefix KV cache
+──────────────────────
+Generation prompts are all the same metadata template (json_convert.py's
+``build_prompt``): ``Fandom:`` / ``Characters:`` / ``Tags:`` / ... lines and a
+fixed ``Write a fanfiction scene:`` tail, and runs of requests share the
+same fandom, characters or even the whole header. ``PrefixCache`` keeps the
+past key/values of such prefixes so the shared part is prefilled once:
+
+  * prefixes are cut at the end of every prompt line, plus the whole prompt
+    minus its last token (so an identical prompt only prefills one token)
+  * a lookup returns the longest cached prefix of the new prompt
+  * entries live in an LRU that is trimmed to ``max_bytes`` of tensor memory
+
+Cached key/values are stored in the legacy per-layer ``(key, value)`` tuple
+layout, cloned down to the prefix length; ``to_model_cache`` wraps them
+back into a ``DynamicCache`` when that is what the model returned, without
+touching the stored copy.
+"""
+from collections import OrderedDict
+
+import torch
+
+try:
+    from transformers import DynamicCache
+except ImportError:         # old transformers: tuples all the way
+    DynamicCache = None
+
+DEFAULT_MAX_MB = 512
+MIN_PREFIX_TOKENS = 8       # shorter prefixes aren't worth an entry
+
+
+# ─── Cache layouts ────────────────────────────────────────────────────────────
+def to_legacy(past):
+    """``((key, value), ...)`` per layer from a model's ``past_key_values``."""
+    if hasattr(past, "to_legacy_cache"):
+        return past.to_legacy_cache()
+    return tuple(tuple(layer) for layer in past)
+
+
+def is_dynamic(past):
+    return DynamicCache is not None and isinstance(past, DynamicCache)
+
+
+def to_model_cache(legacy, dynamic):
+    """*legacy* tuples as the model wants them back (a fresh ``DynamicCache`` if *dynamic*)."""
+    return DynamicCache.from_legacy_cache(legacy) if dynamic else legacy
+
+
+def crop(legacy, length):
+    """The first *length* positions of every key/value, as fresh tensors."""
+    return tuple(tuple(t[..., :length, :].clone() for t in layer) for layer in legacy)
+
+
+def left_pad_stack(rows):
+    """
+    One batched legacy cache from single-row caches of different lengths;
+    shorter rows are left-padded with zeros (mask those positions out).
+    """
+    longest = max(r[0][0].shape[-2] for r in rows)
+    layers = []
+    for per_row in zip(*rows):
+        layer = []
+        for tensors in zip(*per_row):
+            padded = [torch.nn.functional.pad(t, (0, 0, longest - t.shape[-2], 0)) for t in tensors]
+            layer.append(torch.cat(padded, dim=0))
+        layers.append(tuple(layer))
+    return tuple(layers)
+
+
+def nbytes(legacy):
+    return sum(t.numel() * t.element_size() for layer in legacy for t in layer)
+
+
+# ─── Prefix boundaries ────────────────────────────────────────────────────────
+def encode_with_boundaries(tokenizer, prompt):
+    """
+    ``(ids, boundaries)``: the prompt's token IDs and the prefix lengths worth
+    caching (after each ``\\n``, and the whole prompt but its last token).
+    """
+    try:
+        enc = tokenizer(prompt, return_offsets_mapping=True)
+        offsets = enc["offset_mapping"]
+    except NotImplementedError:     # slow tokenizer: no offsets, whole-prompt prefix only
+        enc, offsets = tokenizer(prompt), None
+    ids = enc["input_ids"]
+    boundaries = set()
+    if offsets is not None:
+        for i, (_, end) in enumerate(offsets[:-1]):
+            if end and prompt[end - 1] == "\n" and prompt[end:end + 1] != "\n":
+                boundaries.add(i + 1)
+    boundaries.add(len(ids) - 1)
+    return ids, sorted(b for b in boundaries if b >= MIN_PREFIX_TOKENS)
+
+
+# ─── LRU ──────────────────────────────────────────────────────────────────────
+class PrefixCache:
+    """LRU of ``token-ID prefix → legacy past key/values``, capped at *max_bytes*."""
+
+    def __init__(self, max_bytes=DEFAULT_MAX_MB << 20):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.bytes = 0
+        self.dynamic = False            # the model returns DynamicCache, not tuples
+        self.stats = {"hits": 0, "misses": 0, "tokens_reused": 0, "evictions": 0}
+
+    def lookup(self, ids, boundaries):
+        """``(length, past)`` of the longest cached prefix among *boundaries*, or ``(0, None)``."""
+        for b in reversed(boundaries):
+            key = tuple(ids[:b])
+            past = self.entries.get(key)
+            if past is not None:
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                self.stats["tokens_reused"] += b
+                return b, past
+        self.stats["misses"] += 1
+        return 0, None
+
+    def store(self, ids, boundaries, past):
+        """Cache the prefixes of *ids* at *boundaries* from *past*, the model's cache of all of *ids*."""
+        self.dynamic = is_dynamic(past)
+        legacy = to_legacy(past)
+        for b in boundaries:
+            key = tuple(ids[:b])
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                continue
+            past = crop(legacy, b)
+            size = nbytes(past)
+            if size > self.max_bytes:
+                continue
+            self.entries[key] = past
+            self.bytes += size
+        self._trim()
+
+    def _trim(self):
+        while self.bytes > self.max_bytes and self.entries:
+            _, past = self.entries.popitem(last=False)
+            self.bytes -= nbytes(past)
+            self.stats["evictions"] += 1
+
+    def snapshot(self):
+        return {**self.stats, "entries": len(self.entries), "mb": round(self.bytes / (1 << 20), 1)}
@@ -0,0 +1,120 @@
+"""
+Training profiles for train.py
+──────────────────────────────
+A profile bundles the knobs that trade memory for throughput on a CPU box:
+
+  batch_size          rows per forward pass
+  grad_accum          micro-batches per optimizer step (effective batch =
+                      batch_size × grad_accum)
+  grad_checkpointing  recompute activations in the backward pass instead of
+                      keeping them (much less memory, ~30% more compute)
+  bf16                bfloat16 autocast (weights and LoRA state stay fp32)
+  workers             DataLoader worker processes (0 = collate in the main one)
+  threads             ``torch.set_num_threads`` (0 = torch's default)
+  compile             ``torch.compile`` the model, where this torch has it
+
+Use a preset by name or a YAML file; a YAML file may start from a preset
+with ``base: <preset>`` and only list what it changes:
+
+    python train.py --profile cpu-lowmem
+    python train.py --profile my_box.yaml --grad-accum 8
+
+    # my_box.yaml
+    base: cpu-fast
+    threads: 16
+    workers: 4
+
+Explicit command-line flags win over the profile.
+"""
+import argparse
+import os
+
+import torch
+
+PRESETS = {
+    # train.py's settings just before profiles: batch 4 came with dynamic padding /
+    # packing (packing.py); the original pad-to-512 script used batch 1
+    "default": {"batch_size": 4, "grad_accum": 1, "grad_checkpointing": False, "bf16": False,
+                "workers": 0, "threads": 0, "compile": False},
+    # bigger steps, bf16 matmuls, collation off the main process
+    "cpu-fast": {"batch_size": 8, "grad_accum": 2, "grad_checkpointing": False, "bf16": True,
+                 "workers": 2, "threads": os.cpu_count() or 0, "compile": True},
+    # smallest footprint: one row at a time, recomputed activations
+    "cpu-lowmem": {"batch_size": 1, "grad_accum": 16, "grad_checkpointing": True, "bf16": True,
+                   "workers": 0, "threads": 0, "compile": False},
+}
+FIELDS = tuple(PRESETS["default"])
+
+
+def load_profile(name):
+    """Preset *name*, or the YAML file at *name* layered over its ``base`` preset."""
+    if name in PRESETS:
+        return dict(PRESETS[name])
+    if not os.path.exists(name):
+        raise ValueError(f"unknown profile {name!r} (presets: {', '.join(PRESETS)}, or a .yaml file)")
+    import yaml
+    with open(name, encoding="utf-8") as f:
+        spec = yaml.safe_load(f) or {}
+    base = spec.pop("base", "default")
+    if base not in PRESETS:
+        raise ValueError(f"{name}: unknown base profile {base!r}")
+    unknown = set(spec) - set(FIELDS)
+    if unknown:
+        raise ValueError(f"{name}: unknown profile keys {', '.join(sorted(unknown))}")
+    return {**PRESETS[base], **spec}
+
+
+def add_profile_args(parser):
+    """``--profile`` plus one override flag per profile field (None = keep the profile's)."""
+    group = parser.add_argument_group("training profile")
+    group.add_argument("--profile", default="default",
+                       help=f"preset ({', '.join(PRESETS)}) or a YAML file")
+    group.add_argument("--batch-size", type=int)
+    group.add_argument("--grad-accum", type=int, help="micro-batches per optimizer step")
+    group.add_argument("--grad-checkpointing", action=argparse.BooleanOptionalAction)
+    group.add_argument("--bf16", action=argparse.BooleanOptionalAction, help="bfloat16 autocast")
+    group.add_argument("--workers", type=int, help="DataLoader worker processes")
+    group.add_argument("--threads", type=int, help="torch CPU threads (0 = default)")
+    group.add_argument("--compile", action=argparse.BooleanOptionalAction, help="torch.compile the model")
+
+
+def resolve_profile(args):
+    """The profile named by ``args.profile`` with every explicitly passed flag applied."""
+    profile = load_profile(args.profile)
+    for field in FIELDS:
+        value = getattr(args, field, None)
+        if value is not None:
+            profile[field] = value
+    if profile["compile"] and not hasattr(torch, "compile"):
+        print(f"⚠️  torch {torch.__version__} has no torch.compile; training uncompiled")
+        profile["compile"] = False
+    if profile["grad_accum"] < 1 or profile["batch_size"] < 1:
+        raise ValueError("batch_size and grad_accum must be at least 1")
+    return profile
+
+
+def apply_profile(profile, model):
+    """Process-wide / model-side settings; call after the PEFT model is built."""
+    if profile["threads"]:
+        torch.set_num_threads(profile["threads"])
+    if profile["grad_checkpointing"]:
+        model.config.use_cache = False          # the KV cache is useless while training
+        model.enable_input_require_grads()      # frozen embeddings: give checkpoints a grad path
+
+
+def training_kwargs(profile):
+    """The ``TrainingArguments`` keywords a profile controls."""
+    return {
+        "per_device_train_batch_size": profile["batch_size"],
+        "gradient_accumulation_steps": profile["grad_accum"],
+        "gradient_checkpointing": profile["grad_checkpointing"],
+        "gradient_checkpointing_kwargs": {"use_reentrant": False},
+        "bf16": profile["bf16"],
+        "dataloader_num_workers": profile["workers"],
+        "dataloader_persistent_workers": profile["workers"] > 0,
+        "torch_compile": profile["compile"],
+    }
+
+
+def describe(profile):
+    return ", ".join(f"{k}={v}" for k, v in profile.items())
@@ -0,0 +1,246 @@
+"""
+Long-lived generation service for the fanfic LoRA model
+────────────────────────────────────────────────────────
+Loads the model once and serves generation requests, batching together the
+requests that arrive while the model is busy (up to ``--max-batch``, waiting
+at most ``--max-wait-ms`` to fill a batch). Tokens are streamed back as they
+are generated.
+
+A request is a JSON object with either ``"prompt"`` or ``"metadata"`` (AO3
+fields, rendered with json_convert.py's template), plus optional
+``max_new_tokens``, ``temperature``, ``top_p`` and ``id``.
+
+HTTP (default):
+    python serve.py --port 8000
+    curl -N localhost:8000/generate -d '{"metadata": {"Fandom": "Harry Potter - J. K. Rowling",
+                                                      "Rating": "Mature"}}'
+  The reply is NDJSON: ``{"token": "..."}`` lines, then one
+  ``{"done": true, "text": ..., "latency_s": ..., "tokens_per_sec": ...}``.
+  ``GET /stats`` returns the running totals (including prefix-cache hits).
+
+JSONL over stdin/stdout:
+    python serve.py --stdin < requests.jsonl > samples.jsonl
+  Every request line is answered with token events and a final ``done`` line,
+  all tagged with the request's ``id`` (its line number if it has none).
+"""
+import argparse
+import json
+import queue
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import torch
+
+from inference import (ADAPTER_PATH, BASE_MODEL, DTYPES, generate_batch, load_model, request_params,
+                       request_prompt)
+from prefix_cache import DEFAULT_MAX_MB, PrefixCache
+
+_END = object()
+
+
+class Job:
+    """One request plus the queue its events are streamed through."""
+
+    def __init__(self, request):
+        self.request = request
+        self.events = queue.Queue()
+        self.submitted = time.perf_counter()
+
+    def __iter__(self):
+        while True:
+            event = self.events.get()
+            if event is _END:
+                return
+            yield event
+
+
+class BatchScheduler:
+    """Collects queued jobs into batches and runs them on one model, one batch at a time."""
+
+    def __init__(self, tokenizer, model, max_batch=8, max_wait_ms=20, prefix_cache=None):
+        self.tokenizer = tokenizer
+        self.model = model
+        self.prefix_cache = prefix_cache
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000
+        self.jobs = queue.Queue()
+        self.stats = {"requests": 0, "batches": 0, "tokens": 0, "busy_s": 0.0}
+        self.lock = threading.Lock()
+        threading.Thread(target=self._run, daemon=True).start()
+
+    def submit(self, request):
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+        request_prompt(request)         # reject bad requests before queueing, so they
+        request_params(request)         # can't fail the batch they would join
+        job = Job(request)
+        self.jobs.put(job)
+        return job
+
+    def _next_batch(self):
+        batch = [self.jobs.get()]
+        deadline = time.perf_counter() + self.max_wait
+        while len(batch) < self.max_batch:
+            timeout = deadline - time.perf_counter()
+            try:
+                job = self.jobs.get(timeout=timeout) if timeout > 0 else self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(job)
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            started = time.perf_counter()
+
+            def on_token(i, delta):
+                batch[i].events.put({"token": delta})
+
+            try:
+                results = generate_batch(self.model, self.tokenizer,
+                                         [job.request for job in batch], on_token, self.prefix_cache)
+            except Exception as exc:  # report to every caller, keep serving
+                for job in batch:
+                    job.events.put({"done": True, "error": str(exc)})
+                    job.events.put(_END)
+                continue
+
+            busy = time.perf_counter() - started
+            for job, result in zip(batch, results):
+                result["queue_s"] = round(started - job.submitted, 4)
+                result["latency_s"] = round(result["queue_s"] + result["latency_s"], 4)
+                result["batch_size"] = len(batch)
+                job.events.put({"done": True, **result})
+                job.events.put(_END)
+            with self.lock:
+                self.stats["requests"] += len(batch)
+                self.stats["batches"] += 1
+                self.stats["tokens"] += sum(r["tokens"] for r in results)
+                self.stats["busy_s"] += busy
+            print(f"⚡ batch of {len(batch)}: {sum(r['tokens'] for r in results):,} tokens "
+                  f"in {busy:,.1f}s", file=sys.stderr)
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.stats)
+        stats["tokens_per_sec"] = round(stats["tokens"] / stats["busy_s"], 2) if stats["busy_s"] else 0.0
+        stats["queued"] = self.jobs.qsize()
+        if self.prefix_cache is not None:
+            stats["prefix_cache"] = self.prefix_cache.snapshot()
+        return stats
+
+
+# ─── HTTP ─────────────────────────────────────────────────────────────────────
+def make_handler(scheduler):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def _send_json(self, status, obj):
+            body = json.dumps(obj).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._send_json(200, scheduler.snapshot())
+            else:
+                self._send_json(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/generate":
+                self._send_json(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                job = scheduler.submit(json.loads(self.rfile.read(length)))
+            except ValueError as exc:
+                self._send_json(400, {"error": str(exc)})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for event in job:
+                    data = (json.dumps(event) + "\n").encode("utf-8")
+                    self.wfile.write(b"%x\r\n%s\r\n" % (len(data), data))
+                    self.wfile.flush()
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass                    # client went away; the batch finishes regardless
+
+        def log_message(self, fmt, *args):
+            pass
+
+    return Handler
+
+
+# ─── stdin / stdout ───────────────────────────────────────────────────────────
+def serve_stdin(scheduler):
+    out_lock = threading.Lock()
+
+    def relay(req_id, job):
+        for event in job:
+            line = json.dumps({"id": req_id, **event}, ensure_ascii=False)
+            with out_lock:
+                sys.stdout.write(line + "\n")
+                sys.stdout.flush()
+
+    relays = []
+    for line_no, line in enumerate(sys.stdin):
+        if not line.strip():
+            continue
+        try:
+            request = json.loads(line)
+            job = scheduler.submit(request)
+        except ValueError as exc:
+            with out_lock:
+                print(json.dumps({"id": line_no, "done": True, "error": str(exc)}), flush=True)
+            continue
+        t = threading.Thread(target=relay, args=(request.get("id", line_no), job))
+        t.start()
+        relays.append(t)
+    for t in relays:
+        t.join()
+    print(f"📊 {json.dumps(scheduler.snapshot())}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Batched generation service for the fanfic model")
+    parser.add_argument("--base", default=BASE_MODEL)
+    parser.add_argument("--adapter", default=ADAPTER_PATH, help="LoRA adapter dir ('' for none)")
+    parser.add_argument("--merged", metavar="DIR", help="standalone model from export_merged.py")
+    parser.add_argument("--dtype", choices=DTYPES, default="fp32")
+    parser.add_argument("--int8", action="store_true", help="dynamic int8 quantization (CPU)")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=20)
+    parser.add_argument("--threads", type=int, default=0, help="torch CPU threads (0 = default)")
+    parser.add_argument("--prefix-cache-mb", type=int, default=DEFAULT_MAX_MB,
+                        help="memory cap of the prompt-prefix KV cache (0 = no cache)")
+    parser.add_argument("--stdin", action="store_true", help="read JSONL requests from stdin")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    started = time.perf_counter()
+    tokenizer, model = load_model(args.base, args.adapter, DTYPES[args.dtype], args.merged, args.int8)
+    print(f"✅ Model loaded in {time.perf_counter() - started:,.1f}s", file=sys.stderr)
+    prefix_cache = PrefixCache(args.prefix_cache_mb << 20) if args.prefix_cache_mb else None
+    scheduler = BatchScheduler(tokenizer, model, args.max_batch, args.max_wait_ms, prefix_cache)
+
+    if args.stdin:
+        serve_stdin(scheduler)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), make_handler(scheduler))
+        print(f"🚀 Serving on http://{args.host}:{args.port} (POST /generate, GET /stats)",
+              file=sys.stderr)
+        server.serve_forever()
@@ -1,22 +1,21 @@
-from transformers import AutoTokenizer, AutoModelForCausalLM
-from peft import PeftModel
-import torch
-import os
+import argparse
 
-# === Paths ===
-BASE_MODEL = "tiiuae/falcon-rw-1b"
-ADAPTER_PATH = os.path.join("../..", "fanfic_model")
+from inference import BASE_MODEL, ADAPTER_PATH, DTYPES, generate_batch, load_model
+from prefix_cache import DEFAULT_MAX_MB, PrefixCache
 
-# === Load tokenizer and base model ===
-tokenizer = AutoTokenizer.from_pretrained(BASE_MODEL)
-model = AutoModelForCausalLM.from_pretrained(BASE_MODEL, torch_dtype=torch.float32)
+parser = argparse.ArgumentParser(description="Generate one sample from the fanfic model")
+parser.add_argument("--merged", metavar="DIR",
+                    help="load a merged model from export_merged.py instead of base + adapter")
+parser.add_argument("--dtype", choices=DTYPES, default="fp32")
+parser.add_argument("--int8", action="store_true", help="dynamic int8 quantization (CPU)")
+parser.add_argument("--variants", type=int, default=1, help="samples to generate from the prompt")
+parser.add_argument("--max-new-tokens", type=int, default=600)
+parser.add_argument("--prefix-cache-mb", type=int, default=DEFAULT_MAX_MB,
+                    help="memory cap of the prompt-prefix KV cache (0 = no cache)")
+args = parser.parse_args()
 
-# === Load LoRA adapter ===
-model = PeftModel.from_pretrained(model, ADAPTER_PATH)
-
-# === Set pad token if missing ===
-if tokenizer.pad_token is None:
-    tokenizer.pad_token = tokenizer.eos_token
+# === Load tokenizer and model (base + LoRA adapter, or the merged export) ===
+tokenizer, model = load_model(BASE_MODEL, ADAPTER_PATH, DTYPES[args.dtype], args.merged, args.int8)
 
 # === Sample prompt ===
 prompt = (
@@ -30,25 +29,16 @@ prompt = (
     "Write a fanfiction scene:"
 )
 
-# === Tokenize with attention mask ===
-inputs = tokenizer(prompt, return_tensors="pt", padding=True, truncation=True)
-input_ids = inputs["input_ids"]
-attention_mask = inputs["attention_mask"]
+# === Generate output (the prompt header is prefilled once, then reused) ===
+prefix_cache = PrefixCache(args.prefix_cache_mb << 20) if args.prefix_cache_mb else None
+request = {"prompt": prompt, "max_new_tokens": args.max_new_tokens, "temperature": 0.9, "top_p": 0.95}
+for variant in range(args.variants):
+    result = generate_batch(model, tokenizer, [request], prefix_cache=prefix_cache)[0]
 
-# === Generate output ===
-model.eval()
-with torch.no_grad():
-    output_ids = model.generate(
-        input_ids=input_ids,
-        attention_mask=attention_mask,
-        max_new_tokens=600,
-        temperature=0.9,
-        top_p=0.95,
-        do_sample=True,
-        eos_token_id=tokenizer.eos_token_id
-    )
+    # === Print ===
+    print(f"\n📝 Generated Fanfic ({variant + 1}/{args.variants}, "
+          f"first token after {result['ttft_s'] * 1000:,.0f} ms, {result['tokens_per_sec']} tokens/s):\n")
+    print(prompt + result["text"])
 
-# === Decode and print ===
-output_text = tokenizer.decode(output_ids[0], skip_special_tokens=True)
-print("\n📝 Generated Fanfic:\n")
-print(output_text)
\ No newline at end of file
+if prefix_cache is not None:
+    print(f"\n🗄️  Prefix cache: {prefix_cache.snapshot()}")
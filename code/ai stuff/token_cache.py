@@ -0,0 +1,216 @@
+"""
+Pre-tokenized, memory-mapped training data
+──────────────────────────────────────────
+Tokenizes a prompt/response ``.jsonl`` once (in parallel with ``--num-proc``)
+and stores the result under files/token_cache/<key>/:
+
+  tokens.bin     every sample's token IDs back to back (uint16, or uint32
+                 for vocabularies over 65,535 tokens)
+  offsets.npy    int64, sample i is ``tokens[offsets[i]:offsets[i + 1]]``
+  rows-<layout>-<max_length>.npy
+                 (start, end) token ranges of the training rows for one
+                 packing.py layout, derived from the offsets on first use
+  meta.json      what the key was built from
+
+The key hashes the tokenizer (its serialized vocab/merges and special
+tokens), the ``packing.TEXT_TEMPLATE`` and the data file's path, size and
+mtime, so changing any of them gets a fresh cache. ``max_length``/layout
+only select the rows file, so trying another block size doesn't
+re-tokenize anything.
+
+``TokenCacheDataset`` serves rows straight from the memory map, so
+train.py starts without re-tokenizing and without holding the corpus in RAM.
+
+Usage:
+    python token_cache.py --num-proc 8            # build for train.py's data
+    python token_cache.py --data other.jsonl --layout pack --max-length 1024
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import time
+
+import numpy as np
+
+from packing import IGNORE_INDEX, LAYOUTS, TEXT_TEMPLATE, check_layout, report_layout, tokenize_dataset
+
+CACHE_DIR = os.path.join("../..", "files", "token_cache")
+TOKENS_FILE = "tokens.bin"
+OFFSETS_FILE = "offsets.npy"
+META_FILE = "meta.json"
+WRITE_BATCH = 10_000
+
+
+# ─── Cache key ────────────────────────────────────────────────────────────────
+def tokenizer_fingerprint(tokenizer):
+    h = hashlib.blake2b(digest_size=16)
+    backend = getattr(tokenizer, "backend_tokenizer", None)
+    if backend is not None:
+        h.update(backend.to_str().encode("utf-8"))
+    else:
+        h.update(json.dumps(sorted(tokenizer.get_vocab().items())).encode("utf-8"))
+    h.update(json.dumps([type(tokenizer).__name__, tokenizer.eos_token_id,
+                         tokenizer.bos_token_id]).encode("utf-8"))
+    return h.hexdigest()
+
+
+def cache_key(data_path, tokenizer):
+    st = os.stat(data_path)
+    parts = {
+        "data": os.path.abspath(data_path),
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "tokenizer": tokenizer_fingerprint(tokenizer),
+        "template": TEXT_TEMPLATE,
+    }
+    digest = hashlib.blake2b(json.dumps(parts, sort_keys=True).encode("utf-8"), digest_size=8)
+    return digest.hexdigest(), parts
+
+
+def token_dtype(tokenizer):
+    return np.uint16 if len(tokenizer) <= np.iinfo(np.uint16).max else np.uint32
+
+
+# ─── Building ─────────────────────────────────────────────────────────────────
+def build_cache(data_path, tokenizer, cache_dir=CACHE_DIR, num_proc=None):
+    """Tokenize *data_path* into a new cache directory (written to .tmp, then renamed)."""
+    from datasets import load_dataset
+
+    key, parts = cache_key(data_path, tokenizer)
+    out_dir = os.path.join(cache_dir, key)
+    tmp_dir = out_dir + ".tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    start = time.perf_counter()
+    dataset = load_dataset("json", data_files={"train": data_path})["train"]
+    tokenized = tokenize_dataset(dataset, tokenizer, num_proc)
+
+    dtype = token_dtype(tokenizer)
+    offsets = np.zeros(len(tokenized) + 1, dtype=np.int64)
+    with open(os.path.join(tmp_dir, TOKENS_FILE), "wb") as f:
+        for i in range(0, len(tokenized), WRITE_BATCH):
+            batch = tokenized[i:i + WRITE_BATCH]["input_ids"]
+            offsets[i + 1:i + 1 + len(batch)] = [len(ids) for ids in batch]
+            np.concatenate([np.asarray(ids, dtype=dtype) for ids in batch]).tofile(f)
+    np.cumsum(offsets, out=offsets)
+    np.save(os.path.join(tmp_dir, OFFSETS_FILE), offsets)
+
+    meta = {**parts, "dtype": np.dtype(dtype).name, "samples": len(tokenized),
+            "tokens": int(offsets[-1])}
+    with open(os.path.join(tmp_dir, META_FILE), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=2)
+
+    shutil.rmtree(out_dir, ignore_errors=True)
+    os.replace(tmp_dir, out_dir)
+    print(f"💾 Cached {meta['samples']:,} samples / {meta['tokens']:,} tokens "
+          f"({meta['dtype']}) in {time.perf_counter() - start:,.1f}s → {out_dir}")
+    return out_dir
+
+
+def cache_dir_for(data_path, tokenizer, cache_dir=CACHE_DIR, num_proc=None, rebuild=False):
+    """The cache directory for *data_path*, building it first if needed."""
+    key, _ = cache_key(data_path, tokenizer)
+    out_dir = os.path.join(cache_dir, key)
+    if rebuild or not os.path.exists(os.path.join(out_dir, META_FILE)):
+        return build_cache(data_path, tokenizer, cache_dir, num_proc)
+    print(f"♻️  Reusing token cache {out_dir}")
+    return out_dir
+
+
+# ─── Row ranges ───────────────────────────────────────────────────────────────
+def window_rows(offsets, max_length):
+    """``bucket`` rows: same windows as packing.split_windows, as token ranges."""
+    rows = []
+    for start, end in zip(offsets[:-1].tolist(), offsets[1:].tolist()):
+        for s in range(start, max(end - 1, start + 1), max_length - 1):
+            rows.append((s, min(s + max_length, end)))
+    return np.asarray(rows, dtype=np.int64).reshape(-1, 2)
+
+
+def block_rows(offsets, block_size):
+    """``pack`` rows: the whole token stream cut into ``block_size`` blocks."""
+    total = int(offsets[-1])
+    starts = np.arange(0, total, block_size, dtype=np.int64)
+    rows = np.stack([starts, np.minimum(starts + block_size, total)], axis=1)
+    return rows[rows[:, 1] - rows[:, 0] > 1]
+
+
+def load_rows(cache_path, offsets, layout, max_length):
+    check_layout(layout)
+    path = os.path.join(cache_path, f"rows-{layout}-{max_length}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+    rows = block_rows(offsets, max_length) if layout == "pack" else window_rows(offsets, max_length)
+    tmp = path + ".tmp.npy"
+    np.save(tmp, rows)
+    os.replace(tmp, path)
+    return rows
+
+
+# ─── Dataset ──────────────────────────────────────────────────────────────────
+class TokenCacheDataset:
+    """Map-style dataset of ``{"input_ids", "labels"}`` rows read from the memory map."""
+
+    def __init__(self, cache_path, layout="bucket", max_length=512):
+        with open(os.path.join(cache_path, META_FILE), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        self.layout = layout
+        self.offsets = np.load(os.path.join(cache_path, OFFSETS_FILE), mmap_mode="r")
+        self.tokens = np.memmap(os.path.join(cache_path, TOKENS_FILE),
+                                dtype=self.meta["dtype"], mode="r")
+        self.rows = load_rows(cache_path, self.offsets, layout, max_length)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, i):
+        if i >= len(self.rows):
+            raise IndexError(i)
+        start, end = (int(x) for x in self.rows[i])
+        input_ids = self.tokens[start:end].astype(np.int64)
+        if self.layout != "pack":
+            return {"input_ids": input_ids}
+        # Mask the first label of every sample that starts inside the block
+        # (see packing.pack_blocks).
+        labels = input_ids.copy()
+        lo, hi = np.searchsorted(self.offsets, [start + 1, end])
+        labels[np.asarray(self.offsets[lo:hi]) - start] = IGNORE_INDEX
+        return {"input_ids": input_ids, "labels": labels}
+
+    def sample_lengths(self):
+        return np.diff(self.offsets)
+
+    def row_lengths(self):
+        """Token count of every row, for length-grouped sampling without reading the rows."""
+        return self.rows[:, 1] - self.rows[:, 0]
+
+
+def load_dataset_cached(data_path, tokenizer, layout="bucket", max_length=512, num_proc=None,
+                        cache_dir=CACHE_DIR, rebuild=False):
+    """train.py entry point: cached rows for *data_path*, building the cache if needed."""
+    path = cache_dir_for(data_path, tokenizer, cache_dir, num_proc, rebuild)
+    dataset = TokenCacheDataset(path, layout, max_length)
+    report_layout(dataset.sample_lengths(), len(dataset), max_length)
+    return dataset
+
+
+if __name__ == "__main__":
+    from transformers import AutoTokenizer
+
+    parser = argparse.ArgumentParser(description="Pre-tokenize prompt/response data into a memory-mapped cache")
+    parser.add_argument("--data", default=os.path.join("../..", "files", "hp_train_data.jsonl"))
+    parser.add_argument("--model", default="tiiuae/falcon-rw-1b", help="tokenizer to use")
+    parser.add_argument("--num-proc", type=int, default=os.cpu_count(),
+                        help="tokenizer processes (default: all cores)")
+    parser.add_argument("--layout", choices=LAYOUTS, default="bucket")
+    parser.add_argument("--max-length", type=int, default=512)
+    parser.add_argument("--cache-dir", default=CACHE_DIR)
+    parser.add_argument("--rebuild", action="store_true", help="re-tokenize even if a cache exists")
+    args = parser.parse_args()
+
+    tokenizer = AutoTokenizer.from_pretrained(args.model)
+    load_dataset_cached(args.data, tokenizer, args.layout, args.max_length, args.num_proc,
+                        args.cache_dir, args.rebuild)
@@ -1,14 +1,35 @@
 from datasets import load_dataset
-from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments, Trainer
+from transformers import AutoTokenizer, AutoModelForCausalLM, TrainingArguments
 from peft import get_peft_model, LoraConfig, TaskType
+import argparse
 import torch
 import os
 
+from packing import (LAYOUTS, MeteredTrainer, PadCollator, ThroughputCallback, TokenMeter, build_dataset,
+                     report_layout)
+from profiles import add_profile_args, apply_profile, describe, resolve_profile, training_kwargs
+from token_cache import TokenCacheDataset, load_dataset_cached
+
 # === Config === #
 MODEL_ID = "tiiuae/falcon-rw-1b"  # Smaller, Mac-friendly model
 # DATA_PATH = os.path.join("..", "files", "train_data.jsonl")
 DATA_PATH = os.path.join("../..", "files", "hp_train_data.jsonl")
 
+parser = argparse.ArgumentParser(description="LoRA fine-tune on prompt/response pairs")
+parser.add_argument("--layout", choices=LAYOUTS, default="bucket",
+                    help="bucket: length-grouped dynamic padding; pack: concatenate into full blocks")
+parser.add_argument("--max-length", type=int, default=512,
+                    help="block size (pack) or window size for over-long samples (bucket)")
+parser.add_argument("--num-proc", type=int, default=os.cpu_count(),
+                    help="tokenizer processes when (re)building the token cache")
+parser.add_argument("--token-dir", metavar="DIR",
+                    help="train on a pre-tokenized directory (build_train_set.py --format tokens)")
+parser.add_argument("--no-token-cache", dest="token_cache", action="store_false",
+                    help="tokenize in memory instead of using files/token_cache/")
+add_profile_args(parser)
+args = parser.parse_args()
+profile = resolve_profile(args)
+print(f"🏋️  Training profile {args.profile}: {describe(profile)}")
 
 # === Load tokenizer & model === #
 tokenizer = AutoTokenizer.from_pretrained(MODEL_ID)
@@ -32,35 +53,42 @@ lora_config = LoraConfig(
     bias="none"
 )
 model = get_peft_model(model, lora_config)
+apply_profile(profile, model)
 
 # === Load dataset === #
-dataset = load_dataset("json", data_files={"train": DATA_PATH})["train"]
-
-def tokenize(example):
-    full_text = f"{example['prompt']}\n{example['response']}"
-    tokens = tokenizer(full_text, truncation=True, padding="max_length", max_length=512)
-    tokens["labels"] = tokens["input_ids"].copy()
-    return tokens
-
-
-tokenized_dataset = dataset.map(tokenize, remove_columns=["prompt", "response"])
+if args.token_dir:
+    tokenized_dataset = TokenCacheDataset(args.token_dir, args.layout, args.max_length)
+    report_layout(tokenized_dataset.sample_lengths(), len(tokenized_dataset), args.max_length)
+elif args.token_cache:
+    tokenized_dataset = load_dataset_cached(DATA_PATH, tokenizer, args.layout, args.max_length,
+                                            args.num_proc)
+else:
+    dataset = load_dataset("json", data_files={"train": DATA_PATH})["train"]
+    tokenized_dataset = build_dataset(dataset, tokenizer, args.layout, args.max_length,
+                                      args.num_proc)
+meter = TokenMeter()
 
 # === Training setup === #
 training_args = TrainingArguments(
     output_dir="../../fanfic_model",
-    per_device_train_batch_size=1,
+    group_by_length=args.layout == "bucket",
+    length_column_name="length",
     num_train_epochs=1,
     logging_steps=5,
     save_steps=50,
     save_total_limit=2,
     logging_dir="../logs",
+    **training_kwargs(profile),
 )
 
-trainer = Trainer(
+trainer = MeteredTrainer(
     model=model,
     tokenizer=tokenizer,
     args=training_args,
     train_dataset=tokenized_dataset,
+    data_collator=PadCollator(tokenizer.pad_token_id),
+    callbacks=[ThroughputCallback(meter)],
+    meter=meter,
 )
 
 trainer.train()
@@ -1,67 +1,113 @@
 import os
 import json
-from collections import defaultdict, Counter
-import zstandard as zstd
+import argparse
+from collections import Counter
+from extract_utils import iter_field
+from common.vocab import load_vocab, save_vocab, pair_key, group_pairs
+from common.id_cache import IdListCache
+
+# Sparse engine (numpy/scipy): one read, co-occurrence as Aᵀ·A
+try:
+    import numpy as np
+    import cooccurrence_engine as engine
+    HAVE_SPARSE = True
+except ImportError:
+    HAVE_SPARSE = False
 
 INPUT_DIR = "../../ao3_filtered"
 OUTPUT_FILE = "../../files/relationship_cooccurrence.jsonl"
+NPZ_FILE = "../../files/relationship_cooccurrence.npz"
 MIN_COUNT = 20
 
-def iter_jsonl_zst(folder_path):
-    for filename in sorted(os.listdir(folder_path)):
-        if filename.endswith(".jsonl.zst"):
-            path = os.path.join(folder_path, filename)
-            with open(path, "rb") as compressed:
-                dctx = zstd.ZstdDecompressor()
-                with dctx.stream_reader(compressed) as reader:
-                    buffer = b""
-                    while True:
-                        chunk = reader.read(65536)
-                        if not chunk:
-                            break
-                        buffer += chunk
-                        while b"\n" in buffer:
-                            line, buffer = buffer.split(b"\n", 1)
-                            try:
-                                yield json.loads(line.decode("utf-8"))
-                            except json.JSONDecodeError:
-                                continue
+parser = argparse.ArgumentParser(description="Relationship co-occurrence counts.")
+parser.add_argument("--store", metavar="DIR",
+                    help="Arrow metadata store built from ao3_filtered (build_metadata_store.py)")
+parser.add_argument("--engine", choices=["sparse", "python"],
+                    default="sparse" if HAVE_SPARSE else "python",
+                    help="sparse Aᵀ·A (needs numpy/scipy) or the pure-Python loop")
+parser.add_argument("--cache", choices=["memory", "disk", "none"], default="memory",
+                    help="replay pass two from a cache of relationship IDs held in RAM or "
+                         "spilled to a temp file, or re-read the corpus (none)")
+args = parser.parse_args()
+
+# Relationships are counted by integer ID; names are decoded on output
+vocab = load_vocab("relationships")
+
+# works with 2+ relationships, as ID lists, so step 2 needn't re-read the corpus
+cache = None if args.cache == "none" else IdListCache(spill=args.cache == "disk")
+
+
+def first_pass():
+    """Every work's relationship IDs, caching the works step 2 needs."""
+    for rels in iter_field(INPUT_DIR, "relationships", args.store):
+        ids = vocab.encode(rels)
+        if cache is not None and len(ids) > 1:
+            cache.append(ids)
+        yield ids
 
-# Step 1: Count all relationships
-rel_counter = Counter()
 
+def second_pass():
+    """The works again, from the cache or by re-reading the corpus."""
+    if cache is not None:
+        print(f"🔁 Second pass: Building co-occurrence matrix from {len(cache):,} cached works "
+              f"({cache.nbytes / 1e6:,.1f} MB)...")
+        return cache
+    print("🔁 Second pass: Building co-occurrence matrix...")
+    return (vocab.encode(rels) for rels in iter_field(INPUT_DIR, "relationships", args.store))
+
+
+# Step 1: Count all relationships
 print("🔍 First pass: Counting relationship frequencies...")
-for entry in iter_jsonl_zst(INPUT_DIR):
-    rels_raw = entry.get("metadata", {}).get("Relationship", "")
-    rels = [r.strip() for r in rels_raw.split(",") if r.strip()]
-    rel_counter.update(rels)
+if args.engine == "sparse":
+    # streamed as works × relationships CSR chunks, never the whole incidence matrix
+    rel_counts = engine.column_counts(engine.iter_incidence_chunks(first_pass()), len(vocab))
+    valid_rels = set(np.flatnonzero(rel_counts > MIN_COUNT).tolist())
+else:
+    rel_counter = Counter()
+    for ids in first_pass():
+        rel_counter.update(ids)
+    valid_rels = {rel for rel, count in rel_counter.items() if count > MIN_COUNT}
 
 # Keep only relationships with > MIN_COUNT occurrences
-valid_rels = {rel for rel, count in rel_counter.items() if count > MIN_COUNT}
 print(f"✅ Found {len(valid_rels)} relationships with >{MIN_COUNT} occurrences.")
 
 # Step 2: Build co-occurrence counts
-co_occurrence = defaultdict(Counter)
+if args.engine == "sparse":
+    # Aᵀ·A chunk by chunk (neighbours largest first)
+    C = engine.cooccurrence(engine.iter_incidence_chunks(second_pass()), valid_rels, valid_rels,
+                            self_pairs="positional")
+    rows = ((r, engine.row_items(C, r)) for r in range(C.shape[0]) if C.indptr[r] != C.indptr[r + 1])
+else:
+    co_occurrence = {}   # pair_key(r1, r2) → count
 
-print("🔁 Second pass: Building co-occurrence matrix...")
-for entry in iter_jsonl_zst(INPUT_DIR):
-    rels_raw = entry.get("metadata", {}).get("Relationship", "")
-    rels = [r.strip() for r in rels_raw.split(",") if r.strip()]
-    rels = [r for r in rels if r in valid_rels]
+    for ids in second_pass():
+        rels = [r for r in ids if r in valid_rels]
 
-    for i, r1 in enumerate(rels):
-        for j, r2 in enumerate(rels):
-            if i != j:
-                co_occurrence[r1][r2] += 1
+        for i, r1 in enumerate(rels):
+            for j, r2 in enumerate(rels):
+                if i != j:
+                    key = pair_key(r1, r2)
+                    co_occurrence[key] = co_occurrence.get(key, 0) + 1
+
+    rows = group_pairs(co_occurrence).items()
+
+if cache is not None:
+    cache.close()
 
 # Step 3: Save to file
 os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
 with open(OUTPUT_FILE, "w", encoding="utf-8") as f_out:
-    for rel, neighbors in co_occurrence.items():
+    names = vocab.names
+    for rel, neighbors in rows:
         json.dump({
-            "relationship": rel,
-            "co_occurs_with": dict(neighbors)
+            "relationship": names[rel],
+            "co_occurs_with": {names[r2]: n for r2, n in neighbors}
         }, f_out)
         f_out.write("\n")
 
 print(f"📁 Done. Saved co-occurrence data to {OUTPUT_FILE}")
+
+if args.engine == "sparse":
+    engine.save_npz(NPZ_FILE, C, len(vocab))
+    save_vocab(vocab, "relationships")
+    print(f"📁 Saved sparse matrix to {NPZ_FILE}")
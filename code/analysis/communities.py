@@ -0,0 +1,254 @@
+"""
+communities.py
+──────────────
+Community detection for the character graph, with the partition cached
+next to the GraphML.
+
+Methods (``auto`` picks the first one installed):
+
+    leiden    leidenalg + python-igraph (C++, fastest and best quality)
+    louvain   python-louvain (``community`` package)
+    plm       parallel Louvain on a SciPy CSR adjacency: modularity-gain
+              label propagation (every node moves at once, each sweep a few
+              array operations) and sparse aggregation ``Pᵀ·A·P`` between
+              levels; no extra dependency
+    greedy    networkx greedy modularity (slow past a few thousand nodes)
+
+``cached_partition`` stores ``{node: community}`` as
+``<graph>.communities.json`` keyed by the GraphML content hash and the
+method.  When the GraphML changed, the stored partition seeds the new run
+(leiden / louvain / plm all take an initial partition), so communities
+keep their IDs and converge in a few sweeps.  Community IDs are renumbered
+by size, 0 being the largest.
+"""
+
+import hashlib, json, os
+
+import numpy as np
+import scipy.sparse as sp
+
+try:
+    import igraph as ig
+    import leidenalg
+    HAVE_LEIDEN = True
+except ImportError:
+    HAVE_LEIDEN = False
+
+try:
+    import community as community_louvain
+    HAVE_LOUVAIN = True
+except ImportError:
+    HAVE_LOUVAIN = False
+
+METHODS = ("auto", "leiden", "louvain", "plm", "greedy")
+PLM_MAX_SWEEPS = 50        # local-move sweeps per level
+SEED = 42
+
+
+# ─── Graph → CSR ──────────────────────────────────────────────────────────────
+def adjacency(G, nodes):
+    """Symmetric weighted CSR adjacency of *G* in the order of *nodes*."""
+    index = {n: i for i, n in enumerate(nodes)}
+    edges = [(index[u], index[v], float(w)) for u, v, w in G.edges(data="weight", default=1)]
+    n = len(nodes)
+    if not edges:
+        return sp.csr_matrix((n, n))
+    u, v, w = (np.array(col) for col in zip(*edges))
+    loop = u == v
+    rows = np.concatenate([u, v[~loop]])
+    cols = np.concatenate([v, u[~loop]])
+    return sp.csr_matrix((np.concatenate([w, w[~loop]]), (rows, cols)), shape=(n, n))
+
+
+def modularity(A, labels):
+    """Newman modularity of integer *labels* on the symmetric adjacency *A*."""
+    two_m = A.sum()
+    if not two_m:
+        return 0.0
+    coo = A.tocoo()
+    inside = coo.data[labels[coo.row] == labels[coo.col]].sum()
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    per_comm = np.bincount(labels, degree)
+    return float(inside / two_m - ((per_comm / two_m) ** 2).sum())
+
+
+# ─── Algorithms ───────────────────────────────────────────────────────────────
+def _local_moves(A, labels, rng, max_sweeps):
+    """
+    Modularity label propagation: every node looks at the communities of its
+    neighbours and picks the one with the best modularity gain
+    ``w(i→c) − k_i·K_c / 2m`` (its own community wins ties).  A random half
+    of the nodes that want to move do so per sweep, which keeps the
+    simultaneous moves from undoing each other.
+    """
+    n = A.shape[0]
+    coo = A.tocoo()
+    off = coo.row != coo.col
+    rows, cols, w = coo.row[off].astype(np.int64), coo.col[off].astype(np.int64), coo.data[off]
+    degree = np.asarray(A.sum(axis=1)).ravel()
+    two_m = degree.sum()
+    own = np.arange(n, dtype=np.int64)
+    weights = np.concatenate([w, np.zeros(n)])
+    for _ in range(max_sweeps):
+        K = np.bincount(labels, degree, minlength=n)
+        key = np.concatenate([rows * n + labels[cols], own * n + labels])   # own community always a candidate
+        uniq, inv = np.unique(key, return_inverse=True)
+        w_ic = np.bincount(inv, weights)
+        r, c = uniq // n, uniq % n
+        current = c == labels[r]
+        gain = w_ic - degree[r] * (K[c] - np.where(current, degree[r], 0)) / two_m
+        order = np.lexsort((~current, -gain, r))
+        best = c[order[np.r_[True, r[order][1:] != r[order][:-1]]]]
+        want = best != labels
+        if not want.any():
+            break
+        move = want & (rng.random(n) < 0.5)
+        labels = np.where(move, best, labels)
+    return labels
+
+
+def _compact(labels):
+    return np.unique(labels, return_inverse=True)[1].astype(np.int64)
+
+
+def parallel_louvain(A, init=None, max_sweeps=PLM_MAX_SWEEPS, seed=SEED):
+    """
+    Louvain with vectorized local moves: move nodes (``_local_moves``),
+    collapse every community into one node (``Pᵀ·A·P``), repeat until a
+    level merges nothing.  *init* seeds the first level.
+    """
+    rng = np.random.default_rng(seed)
+    n = A.shape[0]
+    membership = np.arange(n, dtype=np.int64)
+    labels = membership.copy() if init is None else np.array(init, dtype=np.int64)
+    level = A.tocsr()
+    while True:
+        labels = _compact(_local_moves(level, labels, rng, max_sweeps))
+        membership = labels[membership]
+        k = int(labels.max()) + 1 if len(labels) else 0
+        if k == level.shape[0]:
+            return membership
+        P = sp.csr_matrix((np.ones(len(labels)), (np.arange(len(labels)), labels)), shape=(len(labels), k))
+        level = (P.T @ level @ P).tocsr()
+        labels = np.arange(k, dtype=np.int64)
+
+
+def _leiden(G, nodes, A, init):
+    coo = sp.triu(A).tocoo()
+    graph = ig.Graph(n=len(nodes), edges=list(zip(coo.row.tolist(), coo.col.tolist())))
+    graph.es["weight"] = coo.data.tolist()
+    part = leidenalg.find_partition(graph, leidenalg.ModularityVertexPartition, weights="weight",
+                                    initial_membership=None if init is None else init.tolist(),
+                                    seed=SEED)
+    return np.array(part.membership, dtype=np.int64)
+
+
+def _louvain(G, nodes, A, init):
+    start = None if init is None else dict(zip(nodes, init.tolist()))
+    part = community_louvain.best_partition(G, partition=start, random_state=SEED)
+    return np.array([part[n] for n in nodes], dtype=np.int64)
+
+
+def _greedy(G, nodes, A, init):
+    import networkx as nx
+    index = {n: i for i, n in enumerate(nodes)}
+    labels = np.zeros(len(nodes), dtype=np.int64)
+    for cid, comm in enumerate(nx.algorithms.community.greedy_modularity_communities(G, weight="weight")):
+        labels[[index[n] for n in comm]] = cid
+    return labels
+
+
+def resolve_method(method):
+    if method != "auto":
+        if method == "leiden" and not HAVE_LEIDEN:
+            raise ValueError("leiden needs leidenalg and python-igraph")
+        if method == "louvain" and not HAVE_LOUVAIN:
+            raise ValueError("louvain needs python-louvain")
+        return method
+    return "leiden" if HAVE_LEIDEN else "louvain" if HAVE_LOUVAIN else "plm"
+
+
+def by_size(labels):
+    """Renumber communities by size, largest first (ties by first appearance)."""
+    uniq, first, counts = np.unique(labels, return_index=True, return_counts=True)
+    order = np.lexsort((first, -counts))
+    remap = np.empty(len(uniq), dtype=np.int64)
+    remap[order] = np.arange(len(uniq))
+    return remap[np.searchsorted(uniq, labels)]
+
+
+def detect_communities(G, method="auto", init=None):
+    """``{node: community}``; *init* is a (possibly partial) previous partition."""
+    method = resolve_method(method)
+    nodes = list(G.nodes())
+    if not nodes:
+        return {}
+    A = adjacency(G, nodes)
+    start = _initial_labels(nodes, init) if init else None
+    if method == "plm":
+        labels = parallel_louvain(A, start)
+    else:
+        labels = {"leiden": _leiden, "louvain": _louvain, "greedy": _greedy}[method](G, nodes, A, start)
+    labels = by_size(labels)
+    return dict(zip(nodes, labels.tolist()))
+
+
+def _initial_labels(nodes, previous):
+    """Previous community IDs compacted to 0..k-1; nodes without one get their own."""
+    ids = {}
+    labels = np.empty(len(nodes), dtype=np.int64)
+    fresh = []
+    for i, n in enumerate(nodes):
+        if n in previous:
+            labels[i] = ids.setdefault(previous[n], len(ids))
+        else:
+            fresh.append(i)
+    labels[fresh] = len(ids) + np.arange(len(fresh))
+    return labels
+
+
+# ─── Cache ────────────────────────────────────────────────────────────────────
+def partition_path(graphml_path):
+    return os.path.splitext(graphml_path)[0] + ".communities.json"
+
+
+def _graph_hash(graphml_path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(graphml_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def cached_partition(G, graphml_path, method="auto", use_cache=True):
+    """
+    ``(partition, source)`` for *G*, the graph stored at *graphml_path*;
+    *source* is ``"cache"``, ``"warm"`` (seeded from the previous partition)
+    or ``"cold"``.
+    """
+    method = resolve_method(method)
+    path = partition_path(graphml_path)
+    key = _graph_hash(graphml_path)
+    previous = None
+    if use_cache and os.path.exists(path):
+        with open(path, encoding="utf-8") as f:
+            stored = json.load(f)
+        if stored.get("graph") == key and stored.get("method") == method:
+            return stored["partition"], "cache"
+        previous = stored.get("partition")
+
+    partition = detect_communities(G, method, previous)
+    if use_cache:
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"graph": key, "method": method, "partition": partition}, f, ensure_ascii=False)
+        os.replace(tmp, path)
+    return partition, "warm" if previous else "cold"
+
+
+def summary(G, partition):
+    """``"k communities, modularity Q"`` for printing."""
+    nodes = list(G.nodes())
+    labels = np.array([partition[n] for n in nodes], dtype=np.int64)
+    q = modularity(adjacency(G, nodes), labels) if nodes else 0.0
+    return f"{len(set(labels.tolist())):,} communities, modularity {q:.3f}"
@@ -0,0 +1,116 @@
+"""
+cooccurrence_engine.py
+──────────────────────
+Sparse-matrix co-occurrence counting.
+
+Works are turned into a works × tags incidence matrix ``A`` (CSR, columns
+are vocab IDs from common/vocab.py, ``A[w, t]`` = times tag *t* is listed on
+work *w*) and co-occurrence is ``Aᵀ·A``, accumulated chunk by chunk so only
+``CHUNK_WORKS`` rows are ever expanded at once.
+
+Rows of the result can be restricted to popular "source" tags and columns to
+"target" tags.  ``self_pairs`` picks how a tag pairs with itself:
+
+    "skip"        drop the diagonal (``c2 == c1`` is never counted)
+    "positional"  count ``n·(n-1)`` for a tag listed *n* times on a work,
+                  like an ``i != j`` double loop over list positions
+"""
+
+from array import array
+
+import numpy as np
+import scipy.sparse as sp
+
+CHUNK_WORKS = 200_000
+
+
+def iter_incidence_chunks(id_lists, chunk_works=CHUNK_WORKS):
+    """Group per-work ID lists into works × tags CSR chunks of *chunk_works* rows."""
+    indptr, indices = [0], array("i")
+    for ids in id_lists:
+        indices.extend(ids)
+        indptr.append(len(indices))
+        if len(indptr) > chunk_works:
+            yield _chunk(indptr, indices)
+            indptr, indices = [0], array("i")
+    if len(indptr) > 1:
+        yield _chunk(indptr, indices)
+
+
+def _chunk(indptr, indices):
+    cols = np.frombuffer(indices, dtype=np.int32).astype(np.int64)
+    n_cols = int(cols.max()) + 1 if len(cols) else 0
+    A = sp.csr_matrix((np.ones(len(cols), dtype=np.int64), cols, np.asarray(indptr, dtype=np.int64)),
+                      shape=(len(indptr) - 1, n_cols))
+    A.sum_duplicates()
+    return A
+
+
+def _pad_columns(A, n):
+    if A.shape[1] == n:
+        return A
+    return sp.csr_matrix((A.data, A.indices, A.indptr), shape=(A.shape[0], n))
+
+
+def pad_square(M, n):
+    """Grow an ``m × m`` CSR matrix to ``n × n`` with empty rows/columns."""
+    rows = M.shape[0]
+    if rows == n and M.shape[1] == n:
+        return M
+    indptr = np.concatenate([M.indptr, np.full(n - rows, M.indptr[-1], dtype=M.indptr.dtype)])
+    return sp.csr_matrix((M.data, M.indices, indptr), shape=(n, n))
+
+
+def _select(ids, n):
+    """Diagonal 0/1 matrix keeping the columns in *ids*."""
+    mask = np.zeros(n, dtype=np.int64)
+    idx = np.fromiter(ids, dtype=np.int64)
+    mask[idx[idx < n]] = 1
+    return sp.diags(mask, format="csr", dtype=np.int64)
+
+
+def column_counts(chunks, n=0):
+    """
+    Per-tag totals (``Counter.update`` semantics) over *chunks*, consumed as
+    they stream; grows past *n* when later chunks are wider (vocab growth).
+    """
+    counts = np.zeros(n, dtype=np.int64)
+    for A in chunks:
+        if A.shape[1] > len(counts):
+            counts = np.concatenate([counts, np.zeros(A.shape[1] - len(counts), dtype=np.int64)])
+        counts[: A.shape[1]] += np.asarray(A.sum(axis=0)).ravel()
+    return counts
+
+
+def cooccurrence(chunks, source_ids=None, target_ids=None, self_pairs="skip"):
+    """``Σ (A·S)ᵀ·(A·T)`` over *chunks* as a square int64 CSR matrix."""
+    C = sp.csr_matrix((0, 0), dtype=np.int64)
+    for A in chunks:
+        n = max(A.shape[1], C.shape[0])
+        A = _pad_columns(A, n)
+        if target_ids is not None:
+            A = A @ _select(target_ids, n)
+        S = A if source_ids is None else A @ _select(source_ids, n)
+        part = (S.T @ A).tocsr()
+        if self_pairs == "positional":
+            part = part - sp.diags(np.asarray(S.sum(axis=0)).ravel(), format="csr", dtype=np.int64)
+        C = pad_square(C, n) + part
+    if self_pairs == "skip":
+        C = C - sp.diags(C.diagonal(), format="csr", dtype=np.int64)
+    C.eliminate_zeros()
+    return C.tocsr()
+
+
+def row_items(C, i):
+    """``(col_id, count)`` pairs of row *i*, largest count first (ties by ID)."""
+    if i >= C.shape[0]:
+        return []
+    start, end = C.indptr[i], C.indptr[i + 1]
+    cols, vals = C.indices[start:end], C.data[start:end]
+    order = np.lexsort((cols, -vals))
+    return list(zip(cols[order].tolist(), vals[order].tolist()))
+
+
+def save_npz(path, C, n):
+    """Save *C* padded to the full vocab size *n* (IDs as in files/vocab/)."""
+    sp.save_npz(path, pad_square(C, n))
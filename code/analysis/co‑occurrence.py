@@ -5,21 +5,43 @@ build_character_cooccurrence.py
 For every character that appears in > MIN_COUNT works, list every other
 character they appear with in the same work and how many works contain the pair.
 
+With SciPy installed the counts come from the sparse engine
+(cooccurrence_engine.py: works × characters incidence, ``Aᵀ·A``) and each
+character's neighbours are written largest count first; ``--engine python``
+keeps the original per-work double loop and first-seen neighbour order.
+
 INPUT  :  ../../ao3_filtered/*.jsonl.zst
 COUNTS :  ../../files/characters_list.jsonl
 OUTPUT :  ../../files/character_cooccurrence.jsonl
+          ../../files/character_cooccurrence.npz   (sparse engine; IDs = files/vocab/characters.json)
 """
 
-import os, json, zstandard as zstd
-from collections import defaultdict
+import os, json, argparse
+from extract_utils import iter_field
+from common.vocab import load_vocab, save_vocab, pair_key, group_pairs
+
+try:
+    import cooccurrence_engine as engine
+    HAVE_SPARSE = True
+except ImportError:
+    HAVE_SPARSE = False
 
 # ─── Config ──────────────────────────────────────────────────────────────────
 BASE        = os.path.join("..", "..")                      # repo root
 CHAR_LIST   = os.path.join(BASE, "files", "characters_list.jsonl")
 INPUT_DIR   = os.path.join(BASE, "ao3_filtered")
 OUTPUT_FILE = os.path.join(BASE, "files", "character_cooccurrence.jsonl")
+NPZ_FILE    = os.path.join(BASE, "files", "character_cooccurrence.npz")
 MIN_COUNT   = 20            # “source” character must appear in > 20 works
 
+parser = argparse.ArgumentParser(description="Character co-occurrence counts.")
+parser.add_argument("--store", metavar="DIR",
+                    help="Arrow metadata store built from ao3_filtered (build_metadata_store.py)")
+parser.add_argument("--engine", choices=["sparse", "python"],
+                    default="sparse" if HAVE_SPARSE else "python",
+                    help="sparse Aᵀ·A (needs numpy/scipy) or the pure-Python loop")
+args = parser.parse_args()
+
 # ─── 1. Load frequent characters from characters_list.jsonl ──────────────────
 print("📚 Loading characters_list.jsonl …")
 popular_chars = set()
@@ -32,55 +54,54 @@ with open(CHAR_LIST, encoding="utf-8") as f:
 
 print(f"✅  {len(popular_chars):,} characters have > {MIN_COUNT} works.")
 
-# ─── 2. Helper: iterate through *.jsonl.zst works ────────────────────────────
-def iter_jsonl_zst(folder):
-    for fname in sorted(os.listdir(folder)):
-        if not fname.endswith(".jsonl.zst"):
-            continue
-        with open(os.path.join(folder, fname), "rb") as fh:
-            reader = zstd.ZstdDecompressor().stream_reader(fh)
-            buf = b""
-            while True:
-                chunk = reader.read(65536)
-                if not chunk:
-                    break
-                buf += chunk
-                while b"\n" in buf:
-                    line, buf = buf.split(b"\n", 1)
-                    if not line.strip():
-                        continue
-                    try:
-                        yield json.loads(line)
-                    except json.JSONDecodeError:
-                        continue
-
-# ─── 3. Build co‑occurrence counts ───────────────────────────────────────────
-print("🔁  Building co‑occurrence matrix …")
-cooc = defaultdict(lambda: defaultdict(int))    # char → neighbour → count
-
-for work in iter_jsonl_zst(INPUT_DIR):
-    char_raw = work.get("metadata", {}).get("Characters", "")
-    chars = [c.strip() for c in char_raw.split(",") if c.strip()]
-    # skip single‑character works
-    if len(chars) < 2:
-        continue
-
-    for c1 in chars:
-        if c1 not in popular_chars:
-            continue          # only count from “source” popular characters
-        for c2 in chars:
-            if c2 == c1:
-                continue
-            cooc[c1][c2] += 1
-
-# ─── 4. Write output ─────────────────────────────────────────────────────────
+# count on integer IDs; names are only decoded when writing
+vocab = load_vocab("characters")
+popular_ids = set(vocab.encode(popular_chars))
+
+# ─── 2. Build co‑occurrence counts ───────────────────────────────────────────
+# skip single‑character works
+works = (vocab.encode(chars) for chars in iter_field(INPUT_DIR, "characters", args.store)
+         if len(chars) >= 2)
+
+if args.engine == "sparse":
+    print("🧮  Building sparse co‑occurrence matrix …")
+    C = engine.cooccurrence(engine.iter_incidence_chunks(works), source_ids=popular_ids)
+
+    def neighbours_of(cid):
+        return engine.row_items(C, cid)
+else:
+    print("🔁  Building co‑occurrence matrix …")
+    cooc = {}    # pair_key(char, neighbour) → count
+
+    for ids in works:
+        for c1 in ids:
+            if c1 not in popular_ids:
+                continue          # only count from “source” popular characters
+            for c2 in ids:
+                if c2 == c1:
+                    continue
+                key = pair_key(c1, c2)
+                cooc[key] = cooc.get(key, 0) + 1
+
+    grouped = group_pairs(cooc)
+
+    def neighbours_of(cid):
+        return grouped.get(cid, ())
+
+# ─── 3. Write output ─────────────────────────────────────────────────────────
 os.makedirs(os.path.dirname(OUTPUT_FILE), exist_ok=True)
+names = vocab.names
 with open(OUTPUT_FILE, "w", encoding="utf-8") as fout:
     for char in sorted(popular_chars):
         json.dump({
             "character":      char,
-            "co_occurs_with": dict(cooc[char])   # may be empty
+            "co_occurs_with": {names[c2]: n for c2, n in neighbours_of(vocab.get(char))}   # may be empty
         }, fout)
         fout.write("\n")
 
 print(f"📦  Saved co‑occurrence data → {OUTPUT_FILE}")
+
+if args.engine == "sparse":
+    engine.save_npz(NPZ_FILE, C, len(vocab))
+    save_vocab(vocab, "characters")
+    print(f"📦  Saved sparse matrix → {NPZ_FILE}")
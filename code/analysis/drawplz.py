@@ -5,17 +5,29 @@ plot_character_graph.py
 Plot AO3 character co-occurrence graph:
 - label = character name
 - size ∝ appearance count
-- color = community
-- prevents overlap (via sfdp or adjustText)
+- color = community (communities.py: leiden / louvain when installed, else a
+  NumPy parallel Louvain), cached next to the GraphML and shared with
+  lightgraph.py
+- labels culled where they would overlap (render.py; --classic uses adjustText)
+- PNG, SVG or interactive HTML canvas, plus an optional zoomable tile pyramid
+- layout: NumPy Barnes–Hut force layout (layout.py) by default, or sfdp /
+  spring_layout; positions are cached per GraphML content hash and
+  warm-started from the previous layout when the graph changes
+- prints the time spent per stage (load, community, layout, draw)
 
 Outputs:
-  • character_light.png
+  • character_light.png (or .svg / .html with --format)
+  • <dir>/<z>/<x>/<y>.png + index.html with --tiles <dir>
 """
 
-import os, json, math, random
+import os, json, math, random, time, argparse
 import networkx as nx
 import matplotlib.pyplot as plt
 
+from communities import METHODS, cached_partition, summary
+from layout import cached_layout
+from render import graph_arrays, render_html, render_static, render_tiles
+
 # Optional extras
 try:
     from networkx.drawing.nx_agraph import graphviz_layout
@@ -23,12 +35,6 @@ try:
 except ImportError:
     HAVE_PYGRAPHVIZ = False
 
-try:
-    import community as community_louvain
-    HAVE_LOUVAIN = True
-except ImportError:
-    HAVE_LOUVAIN = False
-
 try:
     from adjustText import adjust_text
     HAVE_ADJUSTTEXT = True
@@ -40,6 +46,41 @@ GRAPHML_PATH = "../../files/character_light.graphml"
 CHAR_COUNT_PATH = "../../files/characters_list.jsonl"
 PNG_OUT = "../../files/character_light.png"
 MAX_NODES = 3000
+LAYOUT_ENGINE = "force"   # force (NumPy Barnes–Hut), sfdp (pygraphviz), spring (networkx)
+
+parser = argparse.ArgumentParser(description="Plot the light character graph")
+parser.add_argument("--engine", choices=("force", "sfdp", "spring"), default=LAYOUT_ENGINE)
+parser.add_argument("--no-layout-cache", dest="layout_cache", action="store_false",
+                    help="recompute positions even if this graph was laid out before")
+parser.add_argument("--communities", choices=METHODS, default="auto",
+                    help="community detection method (auto: leiden > louvain > plm)")
+parser.add_argument("--no-community-cache", dest="community_cache", action="store_false",
+                    help="recompute communities even if this graph was partitioned before")
+parser.add_argument("--max-nodes", type=int, default=MAX_NODES,
+                    help="keep the highest-degree nodes only (0 = the full graph)")
+parser.add_argument("--format", choices=("png", "svg", "html"), default="png",
+                    help="single image (png/svg) or an interactive HTML canvas")
+parser.add_argument("--tiles", metavar="DIR", help="also write a zoomable tile pyramid here")
+parser.add_argument("--zoom-levels", type=int, default=4, help="deepest tile zoom level")
+parser.add_argument("--classic", action="store_true",
+                    help="old networkx drawing with adjust_text (slow above a few hundred labels)")
+args = parser.parse_args()
+MAX_NODES = args.max_nodes
+OUT_PATH = os.path.splitext(PNG_OUT)[0] + "." + args.format
+if args.engine == "sfdp" and not HAVE_PYGRAPHVIZ:
+    print("⚠️  pygraphviz not found → using the NumPy force layout")
+    args.engine = "force"
+
+# ─── Stage timing ──────────────────────────────────────────────────
+timings = {}
+_lap_start = time.perf_counter()
+
+def lap(stage):
+    """Record the time since the previous lap under *stage*."""
+    global _lap_start
+    now = time.perf_counter()
+    timings[stage] = now - _lap_start
+    _lap_start = now
 
 # ─── Load appearance counts ────────────────────────────────────────
 print("📚 Loading appearance counts…")
@@ -53,20 +94,21 @@ with open(CHAR_COUNT_PATH, encoding="utf-8") as f:
 print("📚 Loading graph…")
 G = nx.read_graphml(GRAPHML_PATH)
 print(f"   Loaded {G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges")
+G_full = G
 
 # ─── Optional trimming ─────────────────────────────────────────────
 if MAX_NODES and G.number_of_nodes() > MAX_NODES:
     top_nodes = sorted(G.degree, key=lambda x: x[1], reverse=True)[:MAX_NODES]
     G = G.subgraph([n for n, _ in top_nodes]).copy()
     print(f"   Trimmed to top {MAX_NODES} nodes by degree.")
+lap("load")
 
 # ─── Community detection ───────────────────────────────────────────
 print("🧩 Detecting communities…")
-if HAVE_LOUVAIN:
-    part = community_louvain.best_partition(G)
-else:
-    comms = nx.algorithms.community.greedy_modularity_communities(G)
-    part = {n: idx for idx, c in enumerate(comms) for n in c}
+# On the full graph, so the partition matches the one cached for this GraphML
+part, source = cached_partition(G_full, GRAPHML_PATH, args.communities, args.community_cache)
+print(f"   {summary(G_full, part)} ({source})")
+part = {n: part[n] for n in G}
 
 # Assign pastel colors
 palette = {}
@@ -77,39 +119,67 @@ for cid in set(part.values()):
                     random.random()*0.6+0.4)
 
 node_color = [palette[part[n]] for n in G.nodes()]
+lap("community")
 
 # ─── Size by appearance count ──────────────────────────────────────
 def size_fn(count): return 50 + math.sqrt(count) * 2
 node_size = [size_fn(appearance.get(n, 1)) for n in G.nodes()]
 
 # ─── Layout ────────────────────────────────────────────────────────
-print("🎨 Computing layout…")
-if HAVE_PYGRAPHVIZ:
-    pos = graphviz_layout(G, prog="sfdp")
+print(f"🎨 Computing layout ({args.engine})…")
+
+def sfdp(G, init, warm):
+    return graphviz_layout(G, prog="sfdp")
+
+def spring(G, init, warm):
+    nodes = list(G.nodes())
+    start = dict(zip(nodes, map(tuple, init))) if init is not None else None
+    return nx.spring_layout(G, k=0.15, iterations=30 if warm else 100, seed=42, pos=start)
+
+engines = {"force": None, "sfdp": sfdp, "spring": spring}
+pos, source = cached_layout(G, GRAPHML_PATH, compute=engines[args.engine], use_cache=args.layout_cache,
+                            engine=args.engine, max_nodes=MAX_NODES)
+print(f"   positions: {source}")
+lap("layout")
+
+# ─── Draw ──────────────────────────────────────────────────────────
+if args.classic:
+    print(f"🖼️  Saving PNG to {PNG_OUT}")
+    plt.figure(figsize=(18, 14))
+    nx.draw_networkx_edges(G, pos, width=0.3, alpha=0.3, edge_color="grey")
+    nx.draw_networkx_nodes(G, pos,
+                           node_color=node_color,
+                           node_size=node_size,
+                           linewidths=0.2,
+                           edgecolors="black")
+
+    # Labels
+    labels = {n: n for n in G.nodes()}
+    texts = nx.draw_networkx_labels(G, pos, labels, font_size=6)
+
+    if HAVE_ADJUSTTEXT:
+        print("📐 Adjusting label positions to reduce overlap…")
+        adjust_text(texts.values(), arrowprops=dict(arrowstyle="-", color='grey', lw=0.2))
+
+    plt.axis("off")
+    plt.tight_layout()
+    plt.savefig(PNG_OUT, dpi=300)
+    plt.close()
 else:
-    print("⚠️  pygraphviz not found → using spring_layout")
-    pos = nx.spring_layout(G, k=0.15, iterations=100, seed=42)
-
-# ─── Draw PNG ──────────────────────────────────────────────────────
-print(f"🖼️  Saving PNG to {PNG_OUT}")
-plt.figure(figsize=(18, 14))
-nx.draw_networkx_edges(G, pos, width=0.3, alpha=0.3, edge_color="grey")
-nx.draw_networkx_nodes(G, pos,
-                       node_color=node_color,
-                       node_size=node_size,
-                       linewidths=0.2,
-                       edgecolors="black")
-
-# Labels
-labels = {n: n for n in G.nodes()}
-texts = nx.draw_networkx_labels(G, pos, labels, font_size=6)
-
-if HAVE_ADJUSTTEXT:
-    print("📐 Adjusting label positions to reduce overlap…")
-    adjust_text(texts.values(), arrowprops=dict(arrowstyle="-", color='grey', lw=0.2))
-
-plt.axis("off")
-plt.tight_layout()
-plt.savefig(PNG_OUT, dpi=300)
-plt.close()
+    nodes, xy, edges = graph_arrays(G, pos)
+    priority = [appearance.get(n, 0) for n in nodes]
+    if args.format == "html":
+        render_html(OUT_PATH, xy, edges, node_color, node_size, nodes, priority)
+        print(f"🌐 Saved interactive canvas to {OUT_PATH}")
+    else:
+        shown = render_static(OUT_PATH, xy, edges, node_color, node_size, nodes, priority)
+        print(f"🖼️  Saved {OUT_PATH} ({shown:,} of {len(nodes):,} labels fit)")
+    if args.tiles:
+        n_tiles = render_tiles(args.tiles, xy, edges, node_color, node_size, nodes, priority,
+                               levels=args.zoom_levels)
+        print(f"🗺️  Wrote {n_tiles:,} tiles to {args.tiles} (open index.html)")
+lap("draw")
+
+print("⏱️  " + ", ".join(f"{name} {secs:,.1f}s" for name, secs in timings.items())
+      + f" (total {sum(timings.values()):,.1f}s)")
 print("✅ Done.")
@@ -1,26 +1,30 @@
-import os
-import zstandard as zstd
+import os, sys
 import json
 
-def iter_jsonl_zst(folder_path):
-    for filename in sorted(os.listdir(folder_path)):
-        if filename.endswith(".jsonl.zst"):
-            path = os.path.join(folder_path, filename)
-            with open(path, "rb") as compressed:
-                dctx = zstd.ZstdDecompressor()
-                with dctx.stream_reader(compressed) as reader:
-                    buffer = b""
-                    while True:
-                        chunk = reader.read(65536)
-                        if not chunk:
-                            break
-                        buffer += chunk
-                        while b"\n" in buffer:
-                            line, buffer = buffer.split(b"\n", 1)
-                            try:
-                                yield json.loads(line.decode("utf-8"))
-                            except json.JSONDecodeError:
-                                continue
+# The shard reader lives in code/common so every script shares one copy.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.jsonl_zst import (  # noqa: E402
+    iter_jsonl_zst, iter_jsonl_zst_file, iter_zst_lines, iter_lines, list_shards, ReadStats,
+    SHARD_SUFFIX, split_shard,
+)
+from common.fields import LIST_FIELDS, split_field  # noqa: E402
+
+
+def iter_field(folder_path, column, store=None):
+    """
+    One split list per work for *column* (``"characters"``, ``"relationships"``…).
+
+    Reads the ``.jsonl.zst`` shards in *folder_path*, or, when *store* is set,
+    memory-maps just that column from the Arrow metadata store instead.
+    """
+    if store:
+        from common.metadata_store import iter_store_columns
+        for (values,) in iter_store_columns(store, [column]):
+            yield values
+        return
+    key = LIST_FIELDS[column]
+    for entry in iter_jsonl_zst(folder_path):
+        yield split_field(entry.get("metadata", {}), key)
 
 
 def get_top_fandoms(fandoms_file, threshold_ratio=0.9):
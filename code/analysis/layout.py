@@ -0,0 +1,264 @@
+"""
+layout.py
+─────────
+Force-directed graph layout in NumPy, plus an on-disk position cache.
+
+``force_layout`` is Fruchterman–Reingold (attraction d²/k along edges,
+repulsion k²/d between all nodes, linearly cooling step size) with the
+all-pairs repulsion approximated Barnes–Hut style on a hierarchy of grids
+instead of a quadtree, which keeps every step a handful of vectorized
+operations:
+
+  * level l splits the bounding square into 2^l × 2^l cells;
+  * at each level a node feels the cells that are children of its parent's
+    neighbours but not its own neighbours, through their centroid and
+    node count (every far cell is counted exactly once over all levels);
+  * at the finest level (≈ 2 nodes per cell) the remaining 3 × 3
+    neighbourhood is summed exactly.
+
+That is O(n log n) per iteration instead of spring_layout's O(n²).
+
+``cached_layout`` stores positions under ``files/.layout_cache/`` keyed by
+the GraphML content hash and the layout parameters.  On a miss, the most
+recent cached layout from the same engine (engines differ in units, e.g.
+sfdp's graphviz points) seeds the nodes it knows (new nodes start next to
+their placed neighbours) and only a short, cool refinement is run.
+"""
+
+import hashlib, json, math, os, time
+
+import numpy as np
+
+CACHE_DIR  = os.path.join("..", "..", "files", ".layout_cache")
+KEEP_CACHED = 8          # layouts kept on disk
+ITERATIONS = 200
+WARM_ITERATIONS = 50     # refinement when most nodes are warm-started
+WARM_TEMPERATURE = 0.02  # starting step (fraction of the layout size) for a warm start
+GRAVITY    = 0.05        # pull towards the centre, keeps components together
+
+
+# ─── Repulsion ────────────────────────────────────────────────────────────────
+_BLOCK_X, _BLOCK_Y = (a.reshape(1, -1) for a in np.meshgrid(np.arange(6), np.arange(6), indexing="ij"))
+
+
+def _cell_coords(pos, origin, size, cells):
+    c = ((pos - origin) / size * cells).astype(np.int64)
+    return np.clip(c, 0, cells - 1)
+
+
+def _far_field(pos, origin, size, level, k2, force):
+    """Repulsion from the interaction-list cells of *level* (centroid approximation)."""
+    cells = 1 << level
+    c = _cell_coords(pos, origin, size, cells)
+    flat = c[:, 0] * cells + c[:, 1]
+    mass = np.bincount(flat, minlength=cells * cells).astype(float)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        cx = np.bincount(flat, pos[:, 0], cells * cells) / mass
+        cy = np.bincount(flat, pos[:, 1], cells * cells) / mass
+    base = (c // 2) * 2 - 2                 # the 6 × 6 children of the parent's 3 × 3 neighbours
+    ncx = base[:, :1] + _BLOCK_X            # (n, 36)
+    ncy = base[:, 1:] + _BLOCK_Y
+    ok = ((ncx >= 0) & (ncx < cells) & (ncy >= 0) & (ncy < cells)
+          & ((np.abs(ncx - c[:, :1]) > 1) | (np.abs(ncy - c[:, 1:]) > 1)))
+    row, col = np.nonzero(ok)
+    idx = ncx[row, col] * cells + ncy[row, col]
+    m = mass[idx]
+    live = m > 0
+    row, idx, m = row[live], idx[live], m[live]
+    ddx = pos[row, 0] - cx[idx]
+    ddy = pos[row, 1] - cy[idx]
+    f = m * k2 / np.maximum(ddx * ddx + ddy * ddy, 1e-12)
+    force[:, 0] += np.bincount(row, f * ddx, len(pos))
+    force[:, 1] += np.bincount(row, f * ddy, len(pos))
+
+
+def _near_field(pos, origin, size, level, k2, force):
+    """Exact repulsion between nodes in neighbouring cells of the finest level."""
+    n = len(pos)
+    cells = 1 << level
+    c = _cell_coords(pos, origin, size, cells)
+    flat = c[:, 0] * cells + c[:, 1]
+    order = np.argsort(flat, kind="stable")
+    starts = np.searchsorted(flat[order], np.arange(cells * cells + 1))
+    nodes = np.arange(n)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            ncx, ncy = c[:, 0] + dx, c[:, 1] + dy
+            ok = (ncx >= 0) & (ncx < cells) & (ncy >= 0) & (ncy < cells)
+            cell = np.where(ok, ncx * cells + ncy, 0)
+            lo = np.where(ok, starts[cell], 0)
+            counts = np.where(ok, starts[cell + 1] - lo, 0)
+            total = int(counts.sum())
+            if not total:
+                continue
+            i = np.repeat(nodes, counts)
+            first = np.repeat(np.cumsum(counts) - counts, counts)
+            j = order[np.repeat(lo, counts) + np.arange(total) - first]
+            keep = i != j
+            i, j = i[keep], j[keep]
+            ddx = pos[i, 0] - pos[j, 0]
+            ddy = pos[i, 1] - pos[j, 1]
+            d2 = np.maximum(ddx * ddx + ddy * ddy, 1e-12)
+            f = k2 / d2
+            force[:, 0] += np.bincount(i, f * ddx, n)
+            force[:, 1] += np.bincount(i, f * ddy, n)
+
+
+# ─── Layout ───────────────────────────────────────────────────────────────────
+def force_layout(n, src, dst, weight=None, init=None, iterations=ITERATIONS,
+                 temperature=0.1, seed=42):
+    """
+    ``(n, 2)`` positions for nodes ``0..n-1`` with edges ``src[i]–dst[i]``.
+
+    *weight* scales edge attraction (log-damped, mean 1). *init* seeds the
+    positions (a warm start); *temperature* is the first step size as a
+    fraction of the layout's extent.
+    """
+    rng = np.random.default_rng(seed)
+    pos = rng.random((n, 2)) if init is None else np.array(init, dtype=float)
+    if n < 2:
+        return pos
+    src, dst = np.asarray(src, dtype=np.int64), np.asarray(dst, dtype=np.int64)
+    w = np.ones(len(src)) if weight is None else np.log1p(np.asarray(weight, dtype=float))
+    if len(w) and w.mean() > 0:
+        w = w / w.mean()
+    k = 1 / math.sqrt(n)
+    k2 = k * k
+    finest = max(2, math.ceil(math.log(n / 2, 4)))
+
+    for it in range(iterations):
+        lo, hi = pos.min(axis=0), pos.max(axis=0)
+        size = max(float((hi - lo).max()), 1e-9) * (1 + 1e-9)
+        force = np.zeros_like(pos)
+        for level in range(2, finest + 1):
+            _far_field(pos, lo, size, level, k2, force)
+        _near_field(pos, lo, size, finest, k2, force)
+
+        delta = pos[src] - pos[dst]
+        dist = np.sqrt((delta ** 2).sum(axis=1)) + 1e-12
+        pull = (dist * w / k)[:, None] * delta          # d²/k along the edge
+        force[:, 0] -= np.bincount(src, pull[:, 0], n) - np.bincount(dst, pull[:, 0], n)
+        force[:, 1] -= np.bincount(src, pull[:, 1], n) - np.bincount(dst, pull[:, 1], n)
+        force -= GRAVITY * (pos - pos.mean(axis=0)) / k
+
+        step = temperature * size * (1 - it / iterations)
+        length = np.sqrt((force ** 2).sum(axis=1)) + 1e-12
+        pos += force / length[:, None] * np.minimum(length, step)[:, None]
+    return pos
+
+
+# ─── Cache ────────────────────────────────────────────────────────────────────
+def graph_key(graphml_path, **params):
+    """Hash of the GraphML bytes plus every parameter that shapes the layout."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(graphml_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    h.update(json.dumps(params, sort_keys=True).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _read(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _positions(data):
+    return {n: tuple(p) for n, p in zip(data["nodes"], data["pos"])}
+
+
+def _save(path, pos, params):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"params": params, "nodes": list(pos),
+                   "pos": [[float(x), float(y)] for x, y in pos.values()]}, f)
+    os.replace(tmp, path)
+    cached = sorted((os.path.join(CACHE_DIR, p) for p in os.listdir(CACHE_DIR) if p.endswith(".json")),
+                    key=os.path.getmtime, reverse=True)
+    for old in cached[KEEP_CACHED:]:
+        os.remove(old)
+
+
+def _latest_cached(engine):
+    """Positions of the most recent cached layout made by *engine*, or ``None``."""
+    if not os.path.isdir(CACHE_DIR):
+        return None
+    cached = sorted((os.path.join(CACHE_DIR, p) for p in os.listdir(CACHE_DIR) if p.endswith(".json")),
+                    key=os.path.getmtime, reverse=True)
+    for path in cached:
+        data = _read(path)
+        if data.get("params", {}).get("engine") == engine:
+            return _positions(data)
+    return None
+
+
+def warm_start(G, nodes, previous, seed=42):
+    """
+    Initial positions from a previous layout: known nodes keep theirs, new
+    nodes go next to the mean of their placed neighbours (or anywhere).
+    Returns ``(init, fraction of nodes that were known)``.
+    """
+    rng = np.random.default_rng(seed)
+    pts = np.array(list(previous.values()), dtype=float)
+    lo, hi = pts.min(axis=0), pts.max(axis=0)
+    jitter = 0.01 * float((hi - lo).max() or 1.0)
+    init = np.empty((len(nodes), 2))
+    known = 0
+    missing = []
+    for i, n in enumerate(nodes):
+        if n in previous:
+            init[i] = previous[n]
+            known += 1
+        else:
+            missing.append(i)
+    for i in missing:
+        placed = [previous[m] for m in G.neighbors(nodes[i]) if m in previous]
+        centre = np.mean(placed, axis=0) if placed else lo + rng.random(2) * (hi - lo)
+        init[i] = centre + rng.normal(0, jitter, 2)
+    return init, known / len(nodes)
+
+
+def cached_layout(G, graphml_path, compute=None, use_cache=True, **params):
+    """
+    ``{node: (x, y)}`` for *G* from the cache, or computed and cached.
+
+    *compute(G, init, warm)* overrides the NumPy engine (e.g. graphviz sfdp).
+    Returns ``(pos, source)`` with *source* one of ``"cache"``, ``"warm"``,
+    ``"cold"``.
+    """
+    key = graph_key(graphml_path, nodes=G.number_of_nodes(), **params)
+    path = os.path.join(CACHE_DIR, key + ".json")
+    if use_cache and os.path.exists(path):
+        os.utime(path)
+        return _positions(_read(path)), "cache"
+
+    nodes = list(G.nodes())
+    init, warm = None, False
+    previous = _latest_cached(params.get("engine")) if use_cache else None
+    if previous:
+        init, known = warm_start(G, nodes, previous)
+        warm = known >= 0.5
+        if not warm:
+            init = None
+
+    if compute is not None:
+        pos = compute(G, init, warm)
+    else:
+        index = {n: i for i, n in enumerate(nodes)}
+        edges = list(G.edges(data="weight", default=1))
+        src = [index[u] for u, _, _ in edges]
+        dst = [index[v] for _, v, _ in edges]
+        wts = [float(w) for _, _, w in edges]
+        started = time.perf_counter()
+        if warm:
+            xy = force_layout(len(nodes), src, dst, wts, init=init,
+                              iterations=WARM_ITERATIONS, temperature=WARM_TEMPERATURE)
+        else:
+            xy = force_layout(len(nodes), src, dst, wts)
+        print(f"   force layout: {len(nodes):,} nodes in {time.perf_counter() - started:,.1f}s"
+              f"{' (warm start)' if warm else ''}")
+        pos = {n: (float(x), float(y)) for n, (x, y) in zip(nodes, xy)}
+    if use_cache:
+        _save(path, pos, params)
+    return pos, "warm" if warm else "cold"
@@ -4,18 +4,23 @@ make_light_character_graph.py
 ─────────────────────────────
 Read files/character_cooccurrence.jsonl and produce a smaller sub‑graph
 for Gephi by filtering on character frequency, edge weight, and capping
-node degree.
+node degree.  Communities are detected on the result (communities.py) and
+cached next to the GraphML, warm-started from the previous run's partition.
 
 Outputs:
   • files/character_light.graphml
-  • files/character_light_nodes.csv
+  • files/character_light.communities.json
+  • files/character_light_nodes.csv  (id,label,count,community)
   • files/character_light_edges.csv
 """
 
 import os, json, csv
-from collections import defaultdict
+from array import array
+import numpy as np
 import networkx as nx
 
+from communities import cached_partition, summary
+
 # ─── Tunable parameters ─────────────────────────────────────────────────────
 MIN_APPEARANCES = 100   # keep characters that appear ≥ this many works
 MIN_EDGE_W      = 10    # keep edges with weight ≥ this many works
@@ -41,9 +46,19 @@ with open(CHAR_LIST, encoding="utf-8") as f:
 popular = {c for c, n in appears.items() if n >= MIN_APPEARANCES}
 print(f"✅  {len(popular):,} characters appear ≥ {MIN_APPEARANCES} times.")
 
-# ─── 2. Build filtered graph ────────────────────────────────────────────────
-print("🔗  Building filtered graph …")
-G = nx.Graph()
+# ─── 2. Stream the filtered edge list into arrays ────────────────────────────
+# Characters get IDs in the order networkx would have added them as nodes
+# (source, then target, on their first kept edge).
+print("🔗  Reading filtered edges …")
+names, ids = [], {}
+src_ids, tgt_ids, weights = array("q"), array("q"), array("q")
+
+def node_id(name):
+    i = ids.get(name)
+    if i is None:
+        i = ids[name] = len(names)
+        names.append(name)
+    return i
 
 with open(COOC_FILE, encoding="utf-8") as f:
     for line in f:
@@ -54,27 +69,58 @@ with open(COOC_FILE, encoding="utf-8") as f:
         for tgt, w in obj["co_occurs_with"].items():
             if w < MIN_EDGE_W or tgt not in popular:
                 continue
-            G.add_edge(src, tgt, weight=w)
-
+            src_ids.append(node_id(src))
+            tgt_ids.append(node_id(tgt))
+            weights.append(w)
+
+def dedup_edges(u, v, w, n_nodes):
+    """
+    Undirected edges ``(a, b, weight)``: one row per node pair, in the order
+    the pairs were first seen (networkx's adjacency order), with the last
+    weight seen (``add_edge`` overwrites).
+    """
+    a, b = np.minimum(u, v), np.maximum(u, v)
+    key = a * n_nodes + b
+    uniq, first = np.unique(key, return_index=True)
+    _, last_rev = np.unique(key[::-1], return_index=True)
+    last = len(key) - 1 - last_rev
+    order = np.argsort(first, kind="stable")
+    return uniq[order] // n_nodes, uniq[order] % n_nodes, w[last[order]]
+
+u = np.frombuffer(src_ids, dtype=np.int64)
+v = np.frombuffer(tgt_ids, dtype=np.int64)
+a, b, w = dedup_edges(u, v, np.frombuffer(weights, dtype=np.int64), max(len(names), 1))
 print(f"   After weight & popularity filters: "
-      f"{G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges.")
+      f"{len(names):,} nodes, {len(a):,} edges.")
 
 # ─── 3. Cap each node’s degree to top‑k edges ───────────────────────────────
-def cap_degree(graph: nx.Graph, k: int) -> nx.Graph:
-    keep = set()
-    for node in graph.nodes():
-        incident = sorted(
-            ((node, nbr, d["weight"]) for nbr, d in graph[node].items()),
-            key=lambda x: x[2], reverse=True
-        )
-        for u, v, _ in incident[:k]:
-            keep.add(tuple(sorted((u, v))))
-    H = nx.Graph()
-    for u, v in keep:
-        H.add_edge(u, v, weight=graph[u][v]["weight"])
-    return H
-
-G = cap_degree(G, DEGREE_CAP)
+def cap_degree(a, b, w, k):
+    """
+    Mask of edges that are among the *k* strongest of either endpoint.
+
+    Every edge is listed under both endpoints (self-loops once), each
+    node's list is ordered by weight descending and then by first-seen
+    order (edge rows are in that order already), and the first *k* of
+    each list are kept.
+    """
+    edge = np.arange(len(a))
+    loop = a == b
+    node = np.concatenate([a, b[~loop]])
+    edge = np.concatenate([edge, edge[~loop]])
+    order = np.lexsort((edge, -w[edge], node))
+    node, edge = node[order], edge[order]
+    starts = np.flatnonzero(np.r_[True, node[1:] != node[:-1]])
+    rank = np.arange(len(node)) - np.repeat(starts, np.diff(np.r_[starts, len(node)]))
+    keep = np.zeros(len(a), dtype=bool)
+    keep[edge[rank < k]] = True
+    return keep
+
+kept = cap_degree(a, b, w, DEGREE_CAP)
+
+# only the capped subgraph goes through networkx
+G = nx.Graph()
+for x, y, weight in zip(a[kept].tolist(), b[kept].tolist(), w[kept].tolist()):
+    G.add_edge(*sorted((names[x], names[y])), weight=weight)
 print(f"✂️  After capping degree ({DEGREE_CAP}): "
       f"{G.number_of_nodes():,} nodes, {G.number_of_edges():,} edges.")
 
@@ -85,12 +131,16 @@ if not G:
 nx.write_graphml(G, GRAPHML_OUT)
 print(f"🗂️  Saved GraphML → {GRAPHML_OUT}")
 
+print("🧩  Detecting communities …")
+partition, source = cached_partition(G, GRAPHML_OUT)
+print(f"   {summary(G, partition)} ({source})")
+
 # ─── 5. Also save Gephi‑friendly CSVs (optional) ────────────────────────────
 with open(NODES_CSV, "w", newline="", encoding="utf-8") as f_nodes:
     writer = csv.writer(f_nodes)
-    writer.writerow(["id", "label", "count"])
+    writer.writerow(["id", "label", "count", "community"])
     for n in G.nodes():
-        writer.writerow([n, n, appears.get(n, "")])
+        writer.writerow([n, n, appears.get(n, ""), partition[n]])
 
 with open(EDGES_CSV, "w", newline="", encoding="utf-8") as f_edges:
     writer = csv.writer(f_edges)
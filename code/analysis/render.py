@@ -0,0 +1,255 @@
+"""
+render.py
+─────────
+Batch rendering for large character graphs (drawplz.py's default backend).
+
+  * edges are one ``LineCollection`` and nodes one ``scatter`` call, so a
+    draw costs a few artists however big the graph is;
+  * labels are culled instead of pushed around (adjust_text is quadratic):
+    in priority order (appearance count) a label is placed only if its box
+    doesn't overlap one already placed, checked against a uniform grid of
+    placed boxes, so culling is ~O(n);
+  * outputs: a single PNG or SVG (``render_static``), a self-contained
+    HTML canvas with pan/zoom and live label culling (``render_html``), or
+    a zoomable tile pyramid ``<dir>/<z>/<x>/<y>.png`` with a small viewer
+    (``render_tiles``).
+"""
+
+import json, os
+
+import numpy as np
+import matplotlib.pyplot as plt
+from matplotlib.collections import LineCollection
+
+EDGE_COLOR = (0.5, 0.5, 0.5, 0.3)
+EDGE_WIDTH = 0.3
+FONT_SIZE  = 6
+CHAR_WIDTH = 0.6          # average glyph width as a fraction of the font size
+TILE_PX    = 256
+
+
+# ─── Geometry ─────────────────────────────────────────────────────────────────
+def graph_arrays(G, pos):
+    """``(nodes, xy, edge index pairs)`` of *G* with positions *pos*."""
+    nodes = list(G.nodes())
+    index = {n: i for i, n in enumerate(nodes)}
+    xy = np.array([pos[n] for n in nodes], dtype=float)
+    edges = np.array([(index[u], index[v]) for u, v in G.edges()], dtype=np.int64).reshape(-1, 2)
+    return nodes, xy, edges
+
+
+def cull_labels(centres, labels, priority, font_px, pad_px=1.0):
+    """
+    Indices of labels that can be drawn without overlapping, best first.
+
+    *centres* are label centres in pixels; a label's box is estimated from
+    its length and *font_px*.
+    """
+    half_w = np.array([len(t) for t in labels]) * font_px * CHAR_WIDTH / 2 + pad_px
+    half_h = font_px / 2 + pad_px
+    cell = max(float(np.median(half_w)) * 2, half_h * 2, 1.0)
+    grid = {}
+    kept = []
+    for i in np.argsort(-np.asarray(priority), kind="stable"):
+        x, y = centres[i]
+        x0, x1, y0, y1 = x - half_w[i], x + half_w[i], y - half_h, y + half_h
+        cells = [(cx, cy) for cx in range(int(x0 // cell), int(x1 // cell) + 1)
+                 for cy in range(int(y0 // cell), int(y1 // cell) + 1)]
+        if any(bx0 < x1 and x0 < bx1 and by0 < y1 and y0 < by1
+               for c in cells for bx0, bx1, by0, by1 in grid.get(c, ())):
+            continue
+        box = (x0, x1, y0, y1)
+        for c in cells:
+            grid.setdefault(c, []).append(box)
+        kept.append(i)
+    return kept
+
+
+# ─── Matplotlib ───────────────────────────────────────────────────────────────
+def _draw(ax, xy, edges, colors, sizes, edge_width=EDGE_WIDTH):
+    segments = xy[edges] if len(edges) else np.empty((0, 2, 2))
+    lines = LineCollection(segments, colors=[EDGE_COLOR], linewidths=edge_width, zorder=1)
+    ax.add_collection(lines)
+    dots = ax.scatter(xy[:, 0], xy[:, 1], s=sizes, c=colors, linewidths=0.2,
+                      edgecolors="black", zorder=2)
+    return lines, dots
+
+
+def _draw_labels(ax, xy, labels, keep, font_size=FONT_SIZE):
+    return [ax.text(xy[i, 0], xy[i, 1], labels[i], fontsize=font_size, ha="center",
+                    va="center", zorder=3) for i in keep]
+
+
+def render_static(path, xy, edges, colors, sizes, labels, priority,
+                  figsize=(18, 14), dpi=300, font_size=FONT_SIZE):
+    """One PNG / SVG (by extension) with culled labels; returns the labels drawn."""
+    fig = plt.figure(figsize=figsize)
+    ax = fig.add_axes([0.01, 0.01, 0.98, 0.98])
+    _draw(ax, xy, edges, colors, sizes)
+    ax.autoscale_view()
+    ax.set_axis_off()
+    # cull in display space of the saved image
+    fig.set_dpi(dpi)
+    centres = ax.transData.transform(xy)
+    keep = cull_labels(centres, labels, priority, font_size * dpi / 72)
+    _draw_labels(ax, xy, labels, keep, font_size)
+    fig.savefig(path, dpi=dpi)
+    plt.close(fig)
+    return len(keep)
+
+
+def render_tiles(out_dir, xy, edges, colors, sizes, labels, priority, levels=4,
+                 tile_px=TILE_PX, font_size=FONT_SIZE):
+    """
+    Tile pyramid ``out_dir/<z>/<x>/<y>.png`` for zoom 0..*levels* (tile 0/0/0
+    is the whole graph, y counts from the top) plus ``index.html``.  Labels
+    are culled per zoom level over the whole graph, so they agree across
+    tile borders; node markers grow with the zoom.
+    """
+    lo = xy.min(axis=0)
+    span = float((xy.max(axis=0) - lo).max()) or 1.0
+    lo = lo - span * 0.02
+    span *= 1.04
+    dpi = 100
+    fig = plt.figure(figsize=(tile_px / dpi, tile_px / dpi), dpi=dpi)
+    ax = fig.add_axes([0, 0, 1, 1])
+    ax.set_axis_off()
+    lines, dots = _draw(ax, xy, edges, colors, sizes)
+    seg = xy[edges] if len(edges) else np.empty((0, 2, 2))
+    seg_lo, seg_hi = seg.min(axis=1), seg.max(axis=1)
+    sizes = np.broadcast_to(np.asarray(sizes, dtype=float), (len(xy),))
+    colors = np.asarray(colors)
+    n_tiles = 0
+
+    for z in range(levels + 1):
+        tiles = 1 << z
+        tile_span = span / tiles
+        scale = 2.0 ** (z - levels)          # marker size relative to the deepest level
+        px_per_unit = tile_px / tile_span
+        keep = np.array(cull_labels((xy - lo) * px_per_unit, labels, priority,
+                                    font_size * dpi / 72), dtype=np.int64)
+        margin = tile_span * 0.05
+        for tx in range(tiles):
+            x0 = lo[0] + tx * tile_span
+            for ty in range(tiles):
+                y1 = lo[1] + span - ty * tile_span
+                y0 = y1 - tile_span
+                inside = ((xy[:, 0] >= x0 - margin) & (xy[:, 0] <= x0 + tile_span + margin)
+                          & (xy[:, 1] >= y0 - margin) & (xy[:, 1] <= y1 + margin))
+                crosses = ((seg_hi[:, 0] >= x0) & (seg_lo[:, 0] <= x0 + tile_span)
+                           & (seg_hi[:, 1] >= y0) & (seg_lo[:, 1] <= y1))
+                lines.set_segments(seg[crosses])
+                dots.set_offsets(xy[inside])
+                dots.set_sizes(np.maximum(sizes[inside] * scale * scale, 1.0))
+                dots.set_facecolors(colors[inside] if colors.ndim > 1 else colors)
+                ax.set_xlim(x0, x0 + tile_span)
+                ax.set_ylim(y0, y1)
+                texts = _draw_labels(ax, xy, labels, keep[inside[keep]], font_size)
+                path = os.path.join(out_dir, str(z), str(tx), f"{ty}.png")
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                fig.savefig(path, dpi=dpi, transparent=False)
+                for t in texts:
+                    t.remove()
+                n_tiles += 1
+    plt.close(fig)
+
+    with open(os.path.join(out_dir, "index.html"), "w", encoding="utf-8") as f:
+        f.write(_TILE_VIEWER.replace("__MAXZOOM__", str(levels)).replace("__TILE__", str(tile_px)))
+    return n_tiles
+
+
+# ─── HTML canvas ──────────────────────────────────────────────────────────────
+def _hex(color):
+    r, g, b = (int(round(c * 255)) for c in color[:3])
+    return f"#{r:02x}{g:02x}{b:02x}"
+
+
+def render_html(path, xy, edges, colors, sizes, labels, priority, title="Character graph"):
+    """Self-contained HTML page drawing the graph on a canvas (drag to pan, wheel to zoom)."""
+    order = np.argsort(-np.asarray(priority), kind="stable")
+    data = {
+        "x": np.round(xy[:, 0], 5).tolist(),
+        "y": np.round(xy[:, 1], 5).tolist(),
+        "r": np.round(np.sqrt(np.asarray(sizes, dtype=float)) / 2, 2).tolist(),
+        "color": [_hex(c) for c in colors],
+        "label": list(labels),
+        "order": order.tolist(),                # label priority, best first
+        "edges": edges.ravel().tolist(),
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(_CANVAS_PAGE.replace("__TITLE__", title)
+                .replace("__DATA__", json.dumps(data, ensure_ascii=False).replace("</", "<\\/")))
+
+
+_CANVAS_PAGE = """<!doctype html>
+<html><head><meta charset="utf-8"><title>__TITLE__</title>
+<style>html,body{margin:0;height:100%;overflow:hidden;background:#fff}canvas{display:block}</style>
+</head><body><canvas id="c"></canvas><script>
+const D = __DATA__;
+const cv = document.getElementById("c"), ctx = cv.getContext("2d");
+const n = D.x.length;
+let minX = Math.min(...D.x), maxX = Math.max(...D.x), minY = Math.min(...D.y), maxY = Math.max(...D.y);
+let scale = 1, ox = 0, oy = 0;
+function fit() {
+  cv.width = innerWidth * devicePixelRatio; cv.height = innerHeight * devicePixelRatio;
+  scale = 0.95 * Math.min(cv.width / (maxX - minX || 1), cv.height / (maxY - minY || 1));
+  ox = (cv.width - scale * (maxX + minX)) / 2; oy = (cv.height + scale * (maxY + minY)) / 2;
+}
+const sx = i => ox + scale * D.x[i], sy = i => oy - scale * D.y[i];
+function draw() {
+  ctx.clearRect(0, 0, cv.width, cv.height);
+  ctx.strokeStyle = "rgba(128,128,128,0.3)"; ctx.lineWidth = 0.5 * devicePixelRatio;
+  ctx.beginPath();
+  for (let e = 0; e < D.edges.length; e += 2) {
+    const a = D.edges[e], b = D.edges[e + 1];
+    ctx.moveTo(sx(a), sy(a)); ctx.lineTo(sx(b), sy(b));
+  }
+  ctx.stroke();
+  ctx.strokeStyle = "#000"; ctx.lineWidth = 0.3 * devicePixelRatio;
+  for (let i = 0; i < n; i++) {
+    const x = sx(i), y = sy(i);
+    if (x < -20 || y < -20 || x > cv.width + 20 || y > cv.height + 20) continue;
+    ctx.beginPath(); ctx.arc(x, y, D.r[i] * devicePixelRatio, 0, 6.2832);
+    ctx.fillStyle = D.color[i]; ctx.fill(); ctx.stroke();
+  }
+  // labels: best first, skipped when they'd overlap one already drawn (grid of placed boxes)
+  const fs = 11 * devicePixelRatio, cell = 80 * devicePixelRatio, grid = new Map();
+  ctx.font = fs + "px sans-serif"; ctx.fillStyle = "#111"; ctx.textAlign = "center"; ctx.textBaseline = "middle";
+  for (const i of D.order) {
+    const x = sx(i), y = sy(i);
+    if (x < 0 || y < 0 || x > cv.width || y > cv.height) continue;
+    const w = ctx.measureText(D.label[i]).width / 2 + 2, h = fs / 2 + 1;
+    const b = [x - w, x + w, y - h, y + h], keys = [];
+    for (let gx = Math.floor(b[0] / cell); gx <= Math.floor(b[1] / cell); gx++)
+      for (let gy = Math.floor(b[2] / cell); gy <= Math.floor(b[3] / cell); gy++) keys.push(gx + "," + gy);
+    if (keys.some(k => (grid.get(k) || []).some(o => o[0] < b[1] && b[0] < o[1] && o[2] < b[3] && b[2] < o[3]))) continue;
+    keys.forEach(k => { if (!grid.has(k)) grid.set(k, []); grid.get(k).push(b); });
+    ctx.fillText(D.label[i], x, y);
+  }
+}
+let drag = null;
+cv.onmousedown = e => drag = [e.clientX, e.clientY];
+onmouseup = () => drag = null;
+onmousemove = e => { if (!drag) return;
+  ox += (e.clientX - drag[0]) * devicePixelRatio; oy += (e.clientY - drag[1]) * devicePixelRatio;
+  drag = [e.clientX, e.clientY]; requestAnimationFrame(draw); };
+cv.onwheel = e => { e.preventDefault();
+  const f = Math.exp(-e.deltaY * 0.002), mx = e.clientX * devicePixelRatio, my = e.clientY * devicePixelRatio;
+  ox = mx - (mx - ox) * f; oy = my - (my - oy) * f; scale *= f; requestAnimationFrame(draw); };
+onresize = () => { fit(); draw(); };
+fit(); draw();
+</script></body></html>
+"""
+
+_TILE_VIEWER = """<!doctype html>
+<html><head><meta charset="utf-8"><title>Character graph tiles</title>
+<link rel="stylesheet" href="https://unpkg.com/leaflet@1.9.4/dist/leaflet.css">
+<script src="https://unpkg.com/leaflet@1.9.4/dist/leaflet.js"></script>
+<style>html,body,#map{margin:0;height:100%;background:#fff}</style>
+</head><body><div id="map"></div><script>
+const map = L.map("map", {crs: L.CRS.Simple, minZoom: 0, maxZoom: __MAXZOOM__});
+L.tileLayer("{z}/{x}/{y}.png", {tileSize: __TILE__, noWrap: true, maxNativeZoom: __MAXZOOM__,
+  bounds: [[-__TILE__, 0], [0, __TILE__]]}).addTo(map);
+map.fitBounds([[-__TILE__, 0], [0, __TILE__]]);
+</script></body></html>
+"""
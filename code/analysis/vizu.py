@@ -6,66 +6,237 @@ Convert character_cooccurrence.jsonl into Gephi‑friendly CSV files.
 
   • character_nodes.csv  (id,label,count)
   • character_edges.csv  (Source,Target,Weight)
+
+``--external`` exports the edges in bounded memory for the unfiltered
+co‑occurrence file: characters get integer IDs, each edge becomes one
+``uint64`` key, and key/weight records are sorted, summed and spilled to
+disk in runs of at most ``--memory-mb`` before a k‑way merge writes the
+CSV. Same edges and weights as the in‑memory export, ordered by character
+ID (first appearance) instead of by first occurrence of the edge.
 """
 
-import os, json, csv, sys
+import os, json, csv, sys, argparse, heapq, tempfile
+from array import array
 from collections import defaultdict
 
+import numpy as np
+
 # ─── Paths ───────────────────────────────────────────────────────────────────
 BASE_DIR   = os.path.join("..", "..")
 COOC_FILE  = os.path.join(BASE_DIR, "files", "character_cooccurrence.jsonl")
 NODES_CSV  = os.path.join(BASE_DIR, "files", "character_nodes.csv")
 EDGES_CSV  = os.path.join(BASE_DIR, "files", "character_edges.csv")
+CHAR_LIST  = os.path.join(BASE_DIR, "files", "characters_list.jsonl")
 MIN_EDGE_W = 5     # skip very weak links (change as you like)
 
-# ─── 1. Gather node counts & edge weights ────────────────────────────────────
-print("📚  Loading co‑occurrence data …")
-node_count   = {}                 # character → appearance count
-edge_weight  = defaultdict(int)   # (u,v) sorted tuple → w
-
-with open(COOC_FILE, encoding="utf-8") as f:
-    for line in f:
-        obj   = json.loads(line)
-        char  = obj["character"]
-        coocc = obj["co_occurs_with"]
-
-        node_count[char] = node_count.get(char, 0) + 0  # will fill later
-
-        for tgt, w in coocc.items():
-            if w < MIN_EDGE_W:
-                continue
-            edge = tuple(sorted((char, tgt)))
-            edge_weight[edge] += w
-
-# fill missing node counts from characters_list.jsonl if available
-CHAR_LIST = os.path.join(BASE_DIR, "files", "characters_list.jsonl")
-if os.path.isfile(CHAR_LIST):
-    with open(CHAR_LIST, encoding="utf-8") as f:
+# ─── External-memory settings ────────────────────────────────────────────────
+MEMORY_MB    = 512                                   # edge buffer budget per run
+RECORD       = np.dtype([("key", "<u8"), ("w", "<i8")])
+BYTES_PER_EDGE = 3 * RECORD.itemsize                 # buffers + sort/reduce copies
+MERGE_FANIN  = 64                                    # runs open at once while merging
+MERGE_CHUNK  = 1 << 16                               # records read per run at a time
+
+
+# ─── In-memory export ────────────────────────────────────────────────────────
+def gather_in_memory():
+    print("📚  Loading co‑occurrence data …")
+    node_count   = {}                 # character → appearance count
+    edge_weight  = defaultdict(int)   # (u,v) sorted tuple → w
+
+    with open(COOC_FILE, encoding="utf-8") as f:
+        for line in f:
+            obj   = json.loads(line)
+            char  = obj["character"]
+            coocc = obj["co_occurs_with"]
+
+            node_count[char] = node_count.get(char, 0) + 0  # will fill later
+
+            for tgt, w in coocc.items():
+                if w < MIN_EDGE_W:
+                    continue
+                edge = tuple(sorted((char, tgt)))
+                edge_weight[edge] += w
+    return node_count, edge_weight
+
+
+# ─── External-memory export ──────────────────────────────────────────────────
+def reduce_run(keys, weights):
+    """Sort one buffer of edge records and sum duplicate keys."""
+    if not keys:
+        return np.empty(0, dtype=RECORD)
+    records = np.empty(len(keys), dtype=RECORD)
+    records["key"] = np.frombuffer(keys, dtype=np.uint64)
+    records["w"] = np.frombuffer(weights, dtype=np.int64)
+    records.sort(order="key", kind="stable")
+    starts = np.flatnonzero(np.r_[True, records["key"][1:] != records["key"][:-1]])
+    out = np.empty(len(starts), dtype=RECORD)
+    out["key"] = records["key"][starts]
+    out["w"] = np.add.reduceat(records["w"], starts)
+    return out
+
+
+def iter_run(path):
+    """``(key, weight)`` records of a run file, read in chunks."""
+    run = np.memmap(path, dtype=RECORD, mode="r") if os.path.getsize(path) else []
+    for i in range(0, len(run), MERGE_CHUNK):
+        chunk = run[i:i + MERGE_CHUNK]
+        yield from zip(chunk["key"].tolist(), chunk["w"].tolist())
+
+
+def merge_runs(paths):
+    """k‑way merge of sorted runs, summing the weights of equal keys."""
+    key, total = None, 0
+    for k, w in heapq.merge(*(iter_run(p) for p in paths)):
+        if k != key:
+            if key is not None:
+                yield key, total
+            key, total = k, 0
+        total += w
+    if key is not None:
+        yield key, total
+
+
+def write_run(records, tmp_dir):
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as fh:
+        records.tofile(fh)
+    return path
+
+
+def merge_to_run(paths, tmp_dir):
+    """Merge *paths* into one new run file (and delete them)."""
+    fd, path = tempfile.mkstemp(suffix=".run", dir=tmp_dir)
+    with os.fdopen(fd, "wb") as fh:
+        buf = []
+        for rec in merge_runs(paths):
+            buf.append(rec)
+            if len(buf) >= MERGE_CHUNK:
+                np.array(buf, dtype=RECORD).tofile(fh)
+                buf = []
+        if buf:
+            np.array(buf, dtype=RECORD).tofile(fh)
+    for p in paths:
+        os.remove(p)
+    return path
+
+
+def gather_external(memory_mb, tmp_dir):
+    """Character IDs / counts and the spilled, sorted edge runs."""
+    print(f"📚  Streaming co‑occurrence data (≤ {memory_mb:,} MB per run) …")
+    ids, node_count = {}, {}
+    keys, weights = array("Q"), array("q")
+    max_edges = max(1, (memory_mb << 20) // BYTES_PER_EDGE)
+    runs = []
+
+    def spill():
+        runs.append(write_run(reduce_run(keys, weights), tmp_dir))
+        del keys[:], weights[:]
+
+    def char_id(name):
+        i = ids.get(name)
+        if i is None:
+            i = ids[name] = len(ids)
+        return i
+
+    with open(COOC_FILE, encoding="utf-8") as f:
         for line in f:
-            obj = json.loads(line)
-            node_count[obj["name"]] = obj["count"]
-
-print(f"✅  {len(node_count):,} nodes, {len(edge_weight):,} edges (w ≥ {MIN_EDGE_W}).")
-
-if not edge_weight:
-    sys.exit("⚠️  No edges after filtering – lower MIN_EDGE_W and retry.")
-
-# ─── 2. Write nodes CSV ─────────────────────────────────────────────────────
-print("📝  Writing nodes CSV …")
-with open(NODES_CSV, "w", newline="", encoding="utf-8") as f_nodes:
-    writer = csv.writer(f_nodes)
-    writer.writerow(["id", "label", "count"])
-    for char, cnt in sorted(node_count.items(), key=lambda x: -x[1]):
-        writer.writerow([char, char, cnt])
-
-# ─── 3. Write edges CSV ─────────────────────────────────────────────────────
-print("📝  Writing edges CSV …")
-with open(EDGES_CSV, "w", newline="", encoding="utf-8") as f_edges:
-    writer = csv.writer(f_edges)
-    writer.writerow(["Source", "Target", "Weight"])
-    for (u, v), w in edge_weight.items():
-        writer.writerow([u, v, w])
-
-print("🎉  Done!  Files saved to:")
-print(f"      {NODES_CSV}")
-print(f"      {EDGES_CSV}")
+            obj  = json.loads(line)
+            char = obj["character"]
+            node_count.setdefault(char, 0)
+            src  = char_id(char)
+            for tgt, w in obj["co_occurs_with"].items():
+                if w < MIN_EDGE_W:
+                    continue
+                dst = char_id(tgt)
+                a, b = (src, dst) if src <= dst else (dst, src)
+                keys.append(a << 32 | b)
+                weights.append(w)
+            if len(keys) >= max_edges:
+                spill()
+    if keys or not runs:
+        spill()
+
+    while len(runs) > MERGE_FANIN:      # keep the number of open runs bounded
+        print(f"   merging {len(runs):,} runs …")
+        groups = [runs[i:i + MERGE_FANIN] for i in range(0, len(runs), MERGE_FANIN)]
+        runs = [merge_to_run(g, tmp_dir) if len(g) > 1 else g[0] for g in groups]
+    return ids, node_count, runs
+
+
+def write_edges_external(ids, runs):
+    """Merge the runs into EDGES_CSV; returns the number of edges written."""
+    names = list(ids)
+    n_edges = 0
+    with open(EDGES_CSV, "w", newline="", encoding="utf-8") as f_edges:
+        writer = csv.writer(f_edges)
+        writer.writerow(["Source", "Target", "Weight"])
+        for key, w in merge_runs(runs):
+            u, v = names[key >> 32], names[key & 0xFFFFFFFF]
+            if v < u:                   # same orientation as tuple(sorted((u, v)))
+                u, v = v, u
+            writer.writerow([u, v, w])
+            n_edges += 1
+    return n_edges
+
+
+def fill_counts(node_count):
+    # fill missing node counts from characters_list.jsonl if available
+    if os.path.isfile(CHAR_LIST):
+        with open(CHAR_LIST, encoding="utf-8") as f:
+            for line in f:
+                obj = json.loads(line)
+                node_count[obj["name"]] = obj["count"]
+
+
+def write_nodes(node_count):
+    print("📝  Writing nodes CSV …")
+    with open(NODES_CSV, "w", newline="", encoding="utf-8") as f_nodes:
+        writer = csv.writer(f_nodes)
+        writer.writerow(["id", "label", "count"])
+        for char, cnt in sorted(node_count.items(), key=lambda x: -x[1]):
+            writer.writerow([char, char, cnt])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export the character graph as Gephi CSVs")
+    parser.add_argument("--external", action="store_true",
+                        help="bounded-memory edge export (sorted runs on disk + k-way merge)")
+    parser.add_argument("--memory-mb", type=int, default=MEMORY_MB,
+                        help="edge buffer per sorted run in --external mode")
+    parser.add_argument("--tmp-dir", help="where --external spills its runs (default: system temp)")
+    args = parser.parse_args()
+
+    if args.external:
+        with tempfile.TemporaryDirectory(dir=args.tmp_dir, prefix="vizu-") as tmp_dir:
+            ids, node_count, runs = gather_external(args.memory_mb, tmp_dir)
+            fill_counts(node_count)
+            write_nodes(node_count)
+            print("📝  Merging runs into edges CSV …")
+            n_edges = write_edges_external(ids, runs)
+        print(f"✅  {len(node_count):,} nodes, {n_edges:,} edges (w ≥ {MIN_EDGE_W}).")
+        if not n_edges:
+            sys.exit("⚠️  No edges after filtering – lower MIN_EDGE_W and retry.")
+    else:
+        # ─── 1. Gather node counts & edge weights ─────────────────────────────
+        node_count, edge_weight = gather_in_memory()
+        fill_counts(node_count)
+
+        print(f"✅  {len(node_count):,} nodes, {len(edge_weight):,} edges (w ≥ {MIN_EDGE_W}).")
+
+        if not edge_weight:
+            sys.exit("⚠️  No edges after filtering – lower MIN_EDGE_W and retry.")
+
+        # ─── 2. Write nodes CSV ───────────────────────────────────────────────
+        write_nodes(node_count)
+
+        # ─── 3. Write edges CSV ───────────────────────────────────────────────
+        print("📝  Writing edges CSV …")
+        with open(EDGES_CSV, "w", newline="", encoding="utf-8") as f_edges:
+            writer = csv.writer(f_edges)
+            writer.writerow(["Source", "Target", "Weight"])
+            for (u, v), w in edge_weight.items():
+                writer.writerow([u, v, w])
+
+    print("🎉  Done!  Files saved to:")
+    print(f"      {NODES_CSV}")
+    print(f"      {EDGES_CSV}")
@@ -0,0 +1 @@
+"""Helpers shared by the pre-process, analysis and training scripts."""
@@ -0,0 +1,21 @@
+"""AO3 metadata fields and how the scripts split them."""
+
+# store column → metadata key; all of these are comma-separated lists
+LIST_FIELDS = {
+    "fandoms":       "Fandom",
+    "characters":    "Characters",
+    "relationships": "Relationship",
+    "tags":          "Additional Tags",
+    "warnings":      "Archive Warning",
+}
+
+# store column → metadata key; single values
+SCALAR_FIELDS = {
+    "rating":   "Rating",
+    "language": "Language",
+}
+
+
+def split_field(meta, key):
+    """``"A, B,, C"`` → ``["A", "B", "C"]``; a missing key gives ``[]``."""
+    return [v.strip() for v in meta.get(key, "").split(",") if v.strip()]
@@ -0,0 +1,75 @@
+"""
+id_cache.py
+───────────
+Compact append-only cache of per-work tag-ID lists.
+
+Used to replay a corpus a second time without decompressing and parsing it
+again.  IDs are int32 in one flat ``array('i')`` plus one length per work;
+with ``spill=True`` the IDs go to an anonymous temp file instead of RAM and
+are read back in blocks.
+"""
+
+import os, tempfile
+from array import array
+
+SPILL_BUFFER_IDS = 1 << 20      # IDs buffered in RAM before each write
+READ_BLOCK_IDS   = 1 << 20      # IDs read back per block when replaying
+
+
+class IdListCache:
+    def __init__(self, spill=False, spill_dir=None):
+        self.lengths = array("i")
+        self.ids = array("i")
+        self.total_ids = 0
+        self._file = tempfile.TemporaryFile(dir=spill_dir) if spill else None
+
+    def __len__(self):
+        return len(self.lengths)
+
+    def append(self, ids):
+        self.ids.extend(ids)
+        self.lengths.append(len(ids))
+        self.total_ids += len(ids)
+        if self._file is not None and len(self.ids) >= SPILL_BUFFER_IDS:
+            self._flush()
+
+    def _flush(self):
+        self.ids.tofile(self._file)
+        self.ids = array("i")
+
+    def __iter__(self):
+        """Yield each cached list (as an ``array('i')``) in insertion order."""
+        if self._file is None:
+            ids, pos = self.ids, 0
+            for n in self.lengths:
+                yield ids[pos:pos + n]
+                pos += n
+            return
+
+        self._flush()
+        self._file.seek(0)
+        buf, pos = array("i"), 0
+        for n in self.lengths:
+            if pos + n > len(buf):
+                buf = buf[pos:]
+                pos = 0
+                want = max(n - len(buf), READ_BLOCK_IDS)
+                buf.frombytes(self._file.read(want * buf.itemsize))
+            yield buf[pos:pos + n]
+            pos += n
+        self._file.seek(0, os.SEEK_END)
+
+    @property
+    def nbytes(self):
+        return (self.total_ids + len(self.lengths)) * self.ids.itemsize
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,158 @@
+"""
+json_spans.py
+─────────────
+Byte-span scanning of one-object-per-line JSON without decoding it.
+
+``iter_members`` walks the top-level members of a line and reports where
+each key and value sit in the raw bytes, and ``drop_last_member`` cuts the
+trailing ``text`` member off a work without ever decoding its (multi-MB)
+value.  Anything the scanner does not understand raises ``ValueError``;
+callers fall back to ``json.loads``.
+"""
+
+import json, re
+
+_WS     = re.compile(rb"[ \t\r\n]*")
+# a complete JSON string (strict: valid escapes, no raw control characters)
+_STRING = re.compile(rb'"[^"\\\x00-\x1f]*(?:\\(?:["\\/bfnrt]|u[0-9a-fA-F]{4})[^"\\\x00-\x1f]*)*"')
+_SCALAR = re.compile(rb"-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?|true|false|null")
+_NESTED = re.compile(rb'["{}\[\]]')
+_NON_ASCII = re.compile(rb"[\x80-\xff]")
+
+
+def _skip_ws(buf, pos):
+    return _WS.match(buf, pos).end()
+
+
+def skip_value(buf, pos):
+    """End offset of the JSON value starting at *pos*."""
+    c = buf[pos:pos + 1]
+    if c == b'"':
+        m = _STRING.match(buf, pos)
+        if m is None:
+            raise ValueError(f"bad string at {pos}")
+        return m.end()
+    if c in (b"{", b"["):
+        depth = 0
+        while True:
+            m = _NESTED.search(buf, pos)
+            if m is None:
+                raise ValueError("unterminated object/array")
+            if m.group() == b'"':
+                s = _STRING.match(buf, m.start())
+                if s is None:
+                    raise ValueError(f"bad string at {m.start()}")
+                pos = s.end()
+                continue
+            depth += 1 if m.group() in (b"{", b"[") else -1
+            pos = m.end()
+            if depth == 0:
+                return pos
+    m = _SCALAR.match(buf, pos)
+    if m is None:
+        raise ValueError(f"bad value at {pos}")
+    return m.end()
+
+
+def iter_members(buf, stop_at=None):
+    """
+    Yield ``(raw_key, member_start, value_start, value_end)`` per top-level member.
+
+    When the raw key equals *stop_at* that member is yielded with
+    ``value_end=None`` and the scan ends without skipping its value.
+    """
+    pos = _skip_ws(buf, 0)
+    if buf[pos:pos + 1] != b"{":
+        raise ValueError("not a JSON object")
+    pos = _skip_ws(buf, pos + 1)
+    if buf[pos:pos + 1] == b"}":
+        return
+    while True:
+        m = _STRING.match(buf, pos)
+        if m is None:
+            raise ValueError(f"bad key at {pos}")
+        start = pos
+        pos = _skip_ws(buf, m.end())
+        if buf[pos:pos + 1] != b":":
+            raise ValueError(f"missing ':' at {pos}")
+        value_start = _skip_ws(buf, pos + 1)
+        if m.group() == stop_at:
+            yield m.group(), start, value_start, None
+            return
+        value_end = skip_value(buf, value_start)
+        yield m.group(), start, value_start, value_end
+
+        pos = _skip_ws(buf, value_end)
+        c = buf[pos:pos + 1]
+        if c == b",":
+            pos = _skip_ws(buf, pos + 1)
+        elif c == b"}":
+            return
+        else:
+            raise ValueError(f"expected ',' or '}}' at {pos}")
+
+
+def key_bytes(name):
+    """Raw form of a plain key as it appears in the line, e.g. ``b'"text"'``."""
+    return json.dumps(name).encode("utf-8")
+
+
+def value_span(buf, name):
+    """``(start, end)`` of the raw value of top-level member *name*, or ``None``."""
+    raw = key_bytes(name)
+    for key, _, start, end in iter_members(buf):
+        if key == raw:
+            return start, end
+    return None
+
+
+def _is_single_string(buf, start, end):
+    """
+    True if ``buf[start:end]`` is exactly one valid JSON string in UTF-8.
+
+    ``_STRING`` rejects bad escapes and raw control characters; the bytes
+    are only UTF-8 decoded (never JSON-decoded) when they aren't ASCII.
+    """
+    if _STRING.fullmatch(buf, start, end) is None:
+        return False
+    if _NON_ASCII.search(buf, start, end) is None:
+        return True
+    try:
+        str(memoryview(buf)[start:end], "utf-8")
+    except UnicodeDecodeError:
+        return False
+    return True
+
+
+def drop_last_member(buf, name):
+    """
+    *buf* without top-level member *name*, which must be the last one and a string.
+
+    Only the members before it are scanned; the value itself is only
+    validated with ``_is_single_string``, never JSON-decoded.  What is left
+    is small and is verified with ``json.loads``, so only valid JSON is ever
+    passed on.  A line without the member comes back unchanged.  Raises
+    ``ValueError`` whenever that shape doesn't hold (including a key spelled
+    with escapes) so the caller can fall back.
+    """
+    raw = key_bytes(name)
+    for key, start, value_start, value_end in iter_members(buf, stop_at=raw):
+        if value_end is not None:
+            continue
+        end = len(buf.rstrip(b" \t\r\n"))
+        if buf[end - 1:end] != b"}":
+            raise ValueError("not a JSON object")
+        end -= 1
+        while end > value_start and buf[end - 1] in b" \t\r\n":
+            end -= 1
+        if not _is_single_string(buf, value_start, end):
+            raise ValueError(f"{name!r} is not the last member or not a plain string")
+        head = buf[:start].rstrip(b" \t\r\n")
+        if head.endswith(b","):
+            head = head[:-1]
+        out = head + b"}"
+        json.loads(out)
+        return out
+    if name in json.loads(buf):
+        raise ValueError(f"{name!r} key is escaped")
+    return buf
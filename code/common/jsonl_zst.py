@@ -0,0 +1,145 @@
+"""
+jsonl_zst.py
+────────────
+Streaming reader for the AO3 ``*.jsonl.zst`` shards.
+
+Lines are cut straight out of each decompressed chunk with ``bytes.find``
+so every byte is copied once, no matter how long the ``text`` field is.
+The old ``buffer += chunk`` / ``buffer.split(b"\\n", 1)`` loop recopied the
+whole buffer for every line, which is quadratic per chunk.
+
+    from common.jsonl_zst import iter_jsonl_zst, ReadStats
+
+    stats = ReadStats()
+    for work in iter_jsonl_zst("../../ao3_slimmed", stats=stats):
+        ...
+    print(stats.summary())
+
+Shards written in the seekable format (see seekable_zst.py) can also be
+read in pieces: ``split_shard(path, n)`` gives byte ranges that separate
+worker processes pass as ``span=`` to read one big shard in parallel.
+"""
+
+import os, sys, json, time
+import zstandard as zstd
+
+from common.seekable_zst import iter_range_lines, split_shard  # noqa: F401  (re-export)
+
+DEFAULT_READ_SIZE = 1 << 20     # 1 MiB of decompressed data per read()
+SHARD_SUFFIX      = ".jsonl.zst"
+
+
+class ReadStats:
+    """Running byte/record counters with a throughput summary."""
+
+    def __init__(self):
+        self.bytes   = 0        # decompressed bytes consumed
+        self.records = 0        # JSON records successfully parsed
+        self.skipped = 0        # lines that failed to parse
+        self.started = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return max(time.perf_counter() - self.started, 1e-9)
+
+    def merge(self, other):
+        self.bytes   += other.bytes
+        self.records += other.records
+        self.skipped += other.skipped
+        return self
+
+    def summary(self):
+        secs = self.elapsed
+        return (f"{self.records:,} records, {self.bytes / 1e6:,.1f} MB in {secs:,.1f}s "
+                f"({self.bytes / 1e6 / secs:,.1f} MB/s, {self.records / secs:,.0f} rec/s"
+                f"{f', {self.skipped:,} bad lines' if self.skipped else ''})")
+
+
+def list_shards(folder_path, suffix=SHARD_SUFFIX):
+    """Sorted paths of every ``*.jsonl.zst`` (or *suffix*) file in *folder_path*."""
+    return [os.path.join(folder_path, name)
+            for name in sorted(os.listdir(folder_path))
+            if name.endswith(suffix)]
+
+
+def iter_lines(stream, read_size=DEFAULT_READ_SIZE, stats=None):
+    """
+    Yield newline-terminated lines (without the ``\\n``) from a binary stream.
+
+    A final line with no trailing newline is dropped, exactly like the old
+    per-script readers did.
+    """
+    pending = []                         # pieces of a line spanning chunks
+    while True:
+        chunk = stream.read(read_size)
+        if not chunk:
+            break
+        if stats is not None:
+            stats.bytes += len(chunk)
+
+        nl = chunk.find(b"\n")
+        if nl == -1:
+            pending.append(chunk)
+            continue
+        if pending:
+            pending.append(chunk[:nl])
+            yield b"".join(pending)
+            pending = []
+        else:
+            yield chunk[:nl]
+
+        start = nl + 1
+        nl = chunk.find(b"\n", start)
+        while nl != -1:
+            yield chunk[start:nl]
+            start = nl + 1
+            nl = chunk.find(b"\n", start)
+        if start < len(chunk):
+            pending.append(chunk[start:])
+
+
+def iter_zst_lines(path, read_size=DEFAULT_READ_SIZE, stats=None, span=None):
+    """
+    Raw decompressed lines of one ``.jsonl.zst`` shard, or only of the
+    ``(start, end)`` byte range *span* from ``split_shard``.
+    """
+    if span is not None:
+        for line in iter_range_lines(path, *span, read_size=read_size):
+            if stats is not None:
+                stats.bytes += len(line) + 1
+            yield line
+        return
+    with open(path, "rb") as compressed:
+        dctx = zstd.ZstdDecompressor()
+        with dctx.stream_reader(compressed, read_size=read_size) as reader:
+            yield from iter_lines(reader, read_size, stats)
+
+
+def iter_jsonl_zst_file(path, read_size=DEFAULT_READ_SIZE, stats=None, span=None):
+    """Parsed records of one shard (or *span* of it); undecodable lines are skipped."""
+    for line in iter_zst_lines(path, read_size, stats, span):
+        try:
+            obj = json.loads(line.decode("utf-8"))
+        except json.JSONDecodeError:
+            if stats is not None:
+                stats.skipped += 1
+            continue
+        if stats is not None:
+            stats.records += 1
+        yield obj
+
+
+def iter_jsonl_zst(folder_path, read_size=DEFAULT_READ_SIZE, stats=None, verbose=False):
+    """
+    Parsed records of every shard in *folder_path*, in filename order.
+
+    With ``verbose=True`` a throughput line is printed to stderr after each
+    shard; pass a ``ReadStats`` to collect totals for the whole folder.
+    """
+    for path in list_shards(folder_path):
+        shard_stats = ReadStats()
+        yield from iter_jsonl_zst_file(path, read_size, shard_stats)
+        if verbose:
+            print(f"   {os.path.basename(path)}: {shard_stats.summary()}", file=sys.stderr)
+        if stats is not None:
+            stats.merge(shard_stats)
@@ -0,0 +1,117 @@
+"""
+manifest.py
+───────────
+Per-shard manifests so pre-processing reruns only touch changed shards.
+
+A manifest is a JSON file mapping each input shard name to its size, mtime
+and content hash, the outputs it produced (with their own size, mtime and
+hash) and any extra fields a stage wants to keep (e.g. the path of a cached
+partial aggregate).  A shard is *current* when its input and every recorded
+output are unchanged; size+mtime is checked first and the hash is only
+recomputed when those differ, so a ``touch`` doesn't force a rebuild.
+
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME))
+    if not manifest.is_current(shard, [out_path]):
+        ...rebuild out_path...
+        manifest.record(shard, [out_path])
+    manifest.save()
+"""
+
+import contextlib, hashlib, json, os
+
+MANIFEST_NAME = ".manifest.json"
+HASH_BLOCK    = 1 << 20
+
+
+def file_digest(path):
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(HASH_BLOCK), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def file_signature(path, digest=True):
+    st = os.stat(path)
+    sig = {"size": st.st_size, "mtime": st.st_mtime_ns}
+    if digest:
+        sig["hash"] = file_digest(path)
+    return sig
+
+
+def _unchanged(path, recorded):
+    """Does *path* still match its recorded signature?  Refreshes a stale mtime."""
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return False
+    if st.st_size != recorded["size"]:
+        return False
+    if st.st_mtime_ns == recorded["mtime"]:
+        return True
+    if file_digest(path) != recorded["hash"]:
+        return False
+    recorded["mtime"] = st.st_mtime_ns
+    return True
+
+
+@contextlib.contextmanager
+def atomic_open(path, mode="w", **kwargs):
+    """``open()`` that writes ``path.tmp`` and renames it over *path* on success."""
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, mode, **kwargs) as f:
+            yield f
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+class Manifest:
+    def __init__(self, path, stage=None):
+        """*stage* (e.g. the transform name) invalidates every entry when it changes."""
+        self.path = path
+        self.stage = stage
+        self.shards = {}
+        if os.path.isfile(path):
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+            if data.get("stage") == stage:
+                self.shards = data.get("shards", {})
+
+    def get(self, shard_path):
+        return self.shards.get(os.path.basename(shard_path))
+
+    def _key(self, out):
+        """Outputs are recorded relative to the manifest, not the current directory."""
+        return os.path.relpath(out, os.path.dirname(os.path.abspath(self.path)))
+
+    def is_current(self, shard_path, outputs=()):
+        entry = self.get(shard_path)
+        if entry is None or not _unchanged(shard_path, entry["input"]):
+            return False
+        recorded = entry.get("outputs", {})
+        return all(self._key(out) in recorded and _unchanged(out, recorded[self._key(out)])
+                   for out in outputs)
+
+    def record(self, shard_path, outputs=(), **extra):
+        self.shards[os.path.basename(shard_path)] = {
+            "input":   file_signature(shard_path),
+            "outputs": {self._key(out): file_signature(out) for out in outputs},
+            **extra,
+        }
+
+    def prune(self, shard_paths):
+        """Forget shards that are gone; returns their entries."""
+        keep = {os.path.basename(p) for p in shard_paths}
+        dropped = {name: e for name, e in self.shards.items() if name not in keep}
+        for name in dropped:
+            del self.shards[name]
+        return dropped
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        with atomic_open(self.path, encoding="utf-8") as f:
+            json.dump({"stage": self.stage, "shards": self.shards}, f, indent=1)
@@ -0,0 +1,148 @@
+"""
+metadata_store.py
+─────────────────
+Columnar copy of the AO3 metadata (Arrow IPC files, one per shard).
+
+Each work is one row.  The comma-separated fields are stored already split
+as ``list<string>`` columns, so analysis scripts never touch JSON again and
+can memory-map just the columns they need:
+
+    line           int64         line number of the work in its source file
+    frame          int64         ┐ where the line sits in the source file, see
+    offset         int64         │ common/seekable_zst.py; lets a subset be
+    length         int64         ┘ read back without parsing anything else
+    id             string
+    fandoms        list<string>
+    characters     list<string>
+    relationships  list<string>
+    tags           list<string>
+    warnings       list<string>
+    rating         string
+    language       string
+
+Each file records its source shard's name in the schema metadata, so a
+store built from the raw dump doubles as a work index: ``select_locations``
+resolves a metadata query to byte locations and ``read_selected`` seeks
+straight to those records.
+
+Build with ``code/pre process/build_metadata_store.py``.
+"""
+
+import os
+import pyarrow as pa
+
+from common.fields import LIST_FIELDS, SCALAR_FIELDS, split_field
+from common.seekable_zst import read_spans
+
+STORE_SUFFIX = ".arrow"
+BATCH_ROWS   = 65536
+
+LOCATION_COLUMNS = ["frame", "offset", "length"]
+
+SCHEMA = pa.schema(
+    [("line", pa.int64())]
+    + [(col, pa.int64()) for col in LOCATION_COLUMNS]
+    + [("id", pa.string())]
+    + [(col, pa.list_(pa.string())) for col in LIST_FIELDS]
+    + [(col, pa.string()) for col in SCALAR_FIELDS]
+)
+
+
+def store_name(source_path):
+    """``ao3_1-100000.jsonl.zst`` → ``ao3_1-100000.arrow``."""
+    name = os.path.basename(source_path)
+    for ext in (".zst", ".jsonl"):
+        if name.endswith(ext):
+            name = name[: -len(ext)]
+    return name + STORE_SUFFIX
+
+
+def record_to_row(line_no, location, entry):
+    meta = entry.get("metadata", {})
+    row = {"line": line_no, "id": entry.get("id")}
+    row.update(zip(LOCATION_COLUMNS, location))
+    for col, key in LIST_FIELDS.items():
+        row[col] = split_field(meta, key)
+    for col, key in SCALAR_FIELDS.items():
+        row[col] = meta.get(key)
+    return row
+
+
+def write_store_file(numbered_records, out_path, source=None):
+    """
+    Write ``(line_no, (frame, offset, length), entry)`` rows to one Arrow file.
+
+    *source* (the shard's file name) is kept in the schema metadata.  The
+    file is written next to *out_path* and renamed into place, so a crash
+    never leaves a half-written store behind.  Returns the row count.
+    """
+    tmp_path = out_path + ".tmp"
+    rows = 0
+    schema = SCHEMA.with_metadata({"source": os.path.basename(source)}) if source else SCHEMA
+    with pa.OSFile(tmp_path, "wb") as sink, pa.ipc.new_file(sink, schema) as writer:
+        batch = []
+        for line_no, location, entry in numbered_records:
+            batch.append(record_to_row(line_no, location, entry))
+            if len(batch) >= BATCH_ROWS:
+                writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+                rows += len(batch)
+                batch = []
+        if batch:
+            writer.write_batch(pa.RecordBatch.from_pylist(batch, schema=schema))
+            rows += len(batch)
+    os.replace(tmp_path, out_path)
+    return rows
+
+
+def list_store_files(store_path):
+    """A single ``.arrow`` file, or every one in a store directory (sorted)."""
+    if os.path.isfile(store_path):
+        return [store_path]
+    return [os.path.join(store_path, name)
+            for name in sorted(os.listdir(store_path))
+            if name.endswith(STORE_SUFFIX)]
+
+
+def iter_store_columns(store_path, columns):
+    """Yield one tuple per work holding the requested column values."""
+    for path in list_store_files(store_path):
+        with pa.memory_map(path, "r") as source:
+            table = pa.ipc.open_file(source).read_all().select(columns)
+            for batch in table.to_batches(max_chunksize=BATCH_ROWS):
+                values = [batch.column(i).to_pylist() for i in range(batch.num_columns)]
+                yield from zip(*values)
+
+
+def store_source(path):
+    """Name of the shard a store file was built from (None for older stores)."""
+    with pa.memory_map(path, "r") as source:
+        meta = pa.ipc.open_file(source).schema.metadata or {}
+    name = meta.get(b"source")
+    return name.decode("utf-8") if name else None
+
+
+def select_locations(store_file, columns, predicate):
+    """
+    Sorted ``(frame, offset, length)`` of the works in one store file for which
+    ``predicate(*values)`` holds, *values* being the requested *columns*.
+    """
+    n = len(columns)
+    return sorted(
+        tuple(row[n:])
+        for row in iter_store_columns(store_file, list(columns) + LOCATION_COLUMNS)
+        if predicate(*row[:n])
+    )
+
+
+def read_selected(store_path, source_dir, columns, predicate):
+    """
+    Yield ``(source_path, raw_line)`` for every matching work in the store,
+    seeking into the shards under *source_dir* the store was built from.
+    """
+    for store_file in list_store_files(store_path):
+        name = store_source(store_file)
+        if name is None:
+            raise ValueError(f"{store_file} has no source shard recorded; rebuild the store")
+        source_path = os.path.join(source_dir, name)
+        for line in read_spans(source_path, select_locations(store_file, columns, predicate)):
+            yield source_path, line
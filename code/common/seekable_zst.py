@@ -0,0 +1,263 @@
+"""
+seekable_zst.py
+───────────────
+Byte-addressed access to ``.jsonl.zst`` shards (and plain ``.jsonl`` files).
+
+A record's location is ``(frame, offset, length)``:
+
+    frame   compressed byte offset of the zstd frame the line starts in
+            (always 0 for a single-frame shard or an uncompressed file)
+    offset  where the line starts in that frame's decompressed bytes
+    length  length of the line in bytes, without the ``\\n``
+
+``iter_indexed_lines`` yields every line with its location while streaming
+a shard once (this is what the metadata store / work index records), and
+``read_spans`` reads a sorted batch of locations back.  Decompression
+restarts at the frame holding each record, so with a multi-frame shard the
+frames in between are never touched; a single-frame shard is decompressed
+sequentially up to the last wanted record but nothing is JSON-decoded.
+
+Writing
+───────
+``SeekableWriter`` produces the zstd *seekable format*: independent frames
+of about ``frame_size`` decompressed bytes, always cut after a ``\n``, then
+a skippable frame holding the seek table (compressed / decompressed size of
+every frame).  Any zstd tool still reads the file as one stream.  With the
+table, ``split_shard`` cuts one shard into byte ranges of whole frames that
+separate processes can read with ``iter_range_lines``.
+"""
+
+import itertools, os, struct
+
+import zstandard as zstd
+
+DEFAULT_READ_SIZE  = 1 << 20
+DEFAULT_FRAME_SIZE = 4 << 20     # decompressed bytes per frame
+
+SKIPPABLE_MAGIC = 0x184D2A5E
+SEEKABLE_MAGIC  = 0x8F92EAB1
+_FOOTER = struct.Struct("<IBI")  # number of frames, descriptor, seekable magic
+_ENTRY  = struct.Struct("<II")   # compressed size, decompressed size
+
+
+def is_compressed(path):
+    return path.endswith(".zst")
+
+
+def iter_frames(fh, read_size=DEFAULT_READ_SIZE, end=None):
+    """
+    Yield ``(frame, data)`` decompressed pieces of a (multi-)frame zstd stream,
+    *frame* being the compressed offset at which the piece's frame starts.
+    Reading starts at the current position and stops at byte *end*.
+    """
+    dctx = zstd.ZstdDecompressor()
+    dobj = dctx.decompressobj()
+    frame = consumed = fh.tell()
+    while True:
+        want = read_size if end is None else min(read_size, end - fh.tell())
+        data = fh.read(want) if want > 0 else b""
+        if not data:
+            return
+        while data:
+            out = dobj.decompress(data)
+            if out:
+                yield frame, out
+            if not dobj.eof:
+                consumed += len(data)
+                break
+            unused = dobj.unused_data
+            consumed += len(data) - len(unused)
+            frame = consumed
+            dobj = dctx.decompressobj()
+            data = unused
+
+
+def _iter_plain_chunks(fh, read_size):
+    while True:
+        data = fh.read(read_size)
+        if not data:
+            return
+        yield 0, data
+
+
+def _iter_located_lines(chunks):
+    pending = []            # pieces of a line spanning chunks
+    start = None            # (frame, offset) of the pending line
+    current, pos = None, 0  # frame of the current chunk, its bytes seen so far
+    for frame, data in chunks:
+        if frame != current:
+            current, pos = frame, 0
+        i, n = 0, len(data)
+        while i < n:
+            if start is None:
+                start = (frame, pos + i)
+            nl = data.find(b"\n", i)
+            if nl == -1:
+                pending.append(data[i:])
+                break
+            if pending:
+                pending.append(data[i:nl])
+                line = b"".join(pending)
+                pending = []
+            else:
+                line = data[i:nl]
+            yield start[0], start[1], line
+            start = None
+            i = nl + 1
+        pos += n
+
+
+def iter_indexed_lines(path, read_size=DEFAULT_READ_SIZE):
+    """
+    Yield ``(frame, offset, line)`` for every newline-terminated line.
+
+    A final line without ``\\n`` is dropped, like ``jsonl_zst.iter_lines``.
+    """
+    with open(path, "rb") as fh:
+        chunks = iter_frames(fh, read_size) if is_compressed(path) else _iter_plain_chunks(fh, read_size)
+        yield from _iter_located_lines(chunks)
+
+
+def iter_range_lines(path, start, end, read_size=DEFAULT_READ_SIZE):
+    """Lines of the frames in compressed bytes ``[start, end)`` (see ``split_shard``)."""
+    with open(path, "rb") as fh:
+        fh.seek(start)
+        for _, _, line in _iter_located_lines(iter_frames(fh, read_size, end)):
+            yield line
+
+
+def _read_exact(reader, n):
+    parts = []
+    while n > 0:
+        data = reader.read(n)
+        if not data:
+            raise EOFError("record runs past the end of the shard")
+        parts.append(data)
+        n -= len(data)
+    return b"".join(parts)
+
+
+def read_spans(path, locations):
+    """
+    Yield the raw line for each ``(frame, offset, length)`` in *locations*.
+
+    *locations* must be sorted (as the store rows of one shard are); each
+    frame is opened once and read forward.
+    """
+    with open(path, "rb") as fh:
+        if not is_compressed(path):
+            for _, offset, length in locations:
+                fh.seek(offset)
+                yield _read_exact(fh, length)
+            return
+
+        dctx = zstd.ZstdDecompressor()
+        for frame, group in itertools.groupby(locations, key=lambda loc: loc[0]):
+            fh.seek(frame)
+            with dctx.stream_reader(fh, read_across_frames=True, closefd=False) as reader:
+                pos = 0
+                for _, offset, length in group:
+                    if offset < pos:
+                        raise ValueError("locations must be sorted")
+                    if offset > pos:
+                        reader.seek(offset - pos, os.SEEK_CUR)
+                    yield _read_exact(reader, length)
+                    pos = offset + length
+
+
+# ─── Seekable format ──────────────────────────────────────────────────────────
+class SeekableWriter:
+    """
+    File-like writer for the zstd seekable format.
+
+    ``write`` takes newline-terminated bytes; frames are closed at the first
+    ``\n`` past ``frame_size`` so no line ever spans two frames.  ``close``
+    (or leaving the ``with`` block) writes the last frame and the seek table;
+    it does not close *fh*.
+    """
+
+    def __init__(self, fh, level=3, threads=0, frame_size=DEFAULT_FRAME_SIZE):
+        self.fh = fh
+        self.frame_size = frame_size
+        self.cctx = zstd.ZstdCompressor(level=level, threads=threads)
+        self.frames = []                # (compressed size, decompressed size)
+        self._buf = bytearray()
+
+    def write(self, data):
+        self._buf += data
+        while len(self._buf) >= self.frame_size:
+            nl = self._buf.find(b"\n", self.frame_size - 1)
+            if nl == -1:
+                break
+            self._write_frame(nl + 1)
+        return len(data)
+
+    def _write_frame(self, n):
+        chunk = bytes(self._buf[:n])
+        del self._buf[:n]
+        compressed = self.cctx.compress(chunk)
+        self.fh.write(compressed)
+        self.frames.append((len(compressed), len(chunk)))
+
+    def close(self):
+        if self._buf:
+            self._write_frame(len(self._buf))
+        table = b"".join(_ENTRY.pack(c, d) for c, d in self.frames)
+        table += _FOOTER.pack(len(self.frames), 0, SEEKABLE_MAGIC)
+        self.fh.write(struct.pack("<II", SKIPPABLE_MAGIC, len(table)) + table)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+
+
+def read_seek_table(path):
+    """
+    ``[(compressed offset, decompressed offset, compressed size, decompressed size)]``
+    per frame, or None if *path* has no seek table.
+    """
+    with open(path, "rb") as fh:
+        size = fh.seek(0, os.SEEK_END)
+        if size < _FOOTER.size + 8:
+            return None
+        fh.seek(size - _FOOTER.size)
+        n, descriptor, magic = _FOOTER.unpack(fh.read(_FOOTER.size))
+        if magic != SEEKABLE_MAGIC:
+            return None
+        entry_size = _ENTRY.size + (4 if descriptor & 0x80 else 0)   # optional checksums
+        table_size = n * entry_size + _FOOTER.size
+        fh.seek(size - table_size - 8)
+        header = fh.read(8 + n * entry_size)
+    if struct.unpack_from("<I", header)[0] != SKIPPABLE_MAGIC:
+        return None
+    frames, c_off, d_off = [], 0, 0
+    for i in range(n):
+        c, d = _ENTRY.unpack_from(header, 8 + i * entry_size)
+        frames.append((c_off, d_off, c, d))
+        c_off += c
+        d_off += d
+    return frames
+
+
+def split_shard(path, parts):
+    """
+    Cut a shard into at most *parts* ``(start, end)`` compressed byte ranges of
+    whole frames with about the same decompressed size each, for
+    ``iter_range_lines``.  Shards without a seek table come back whole.
+    """
+    frames = read_seek_table(path) if is_compressed(path) else None
+    if not frames or parts <= 1:
+        return [(0, os.path.getsize(path))]
+    total = frames[-1][1] + frames[-1][3]
+    ranges, start, target = [], 0, total / parts
+    for c_off, d_off, c, d in frames:
+        if d_off + d >= target * (len(ranges) + 1) and len(ranges) < parts - 1:
+            ranges.append((start, c_off + c))
+            start = c_off + c
+    end = frames[-1][0] + frames[-1][2]
+    if start < end:
+        ranges.append((start, end))
+    return ranges
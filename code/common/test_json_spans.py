@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+from common.json_spans import drop_last_member
+
+
+def test_drops_trailing_text():
+    line = json.dumps({"id": "1", "metadata": {"Fandom": "X"}, "text": 'a "b"\n\\ — ü'}).encode()
+    assert drop_last_member(line, "text") == b'{"id": "1", "metadata": {"Fandom": "X"}}'
+
+
+def test_keeps_raw_utf8_text():
+    line = json.dumps({"id": "1", "text": "naïve — “quoted”"}, ensure_ascii=False).encode()
+    assert drop_last_member(line, "text") == b'{"id": "1"}'
+
+
+def test_line_without_member_is_unchanged():
+    line = b'{"id": "1"}'
+    assert drop_last_member(line, "text") is line
+
+
+@pytest.mark.parametrize("line", [
+    b'{"id": "1", "\\u0074ext": "abc"}',     # escaped key
+    b'{"id": "1", "text": "a\\qb"}',         # invalid escape
+    b'{"id": "1", "text": "a\tb"}',          # raw control character
+    b'{"id": "1", "text": "a\xffb"}',        # invalid UTF-8
+    b'{"id": "1", "text": "abc", "x": 1}',   # text not last
+    b'{"id": "1", "text": "a"b"}',           # unescaped quote
+    b'{"id": "1", "text": "ab\\"}',          # escaped closing quote
+])
+def test_malformed_lines_fall_back(line):
+    with pytest.raises(ValueError):
+        drop_last_member(line, "text")
@@ -0,0 +1,111 @@
+"""
+vocab.py
+────────
+Dense integer IDs for AO3 tag strings (one vocabulary per tag type).
+
+Counting loops key their tables by these IDs, or by two of them packed into
+one int with ``pair_key``, instead of by full tag strings; names are only
+decoded when the output is written.  Vocabularies are saved as a JSON array
+(index = ID) under ``files/vocab/`` and only ever grow, so IDs stay stable
+between runs:
+
+    files/vocab/fandoms.json
+    files/vocab/characters.json
+    files/vocab/relationships.json
+    files/vocab/tags.json
+"""
+
+import os, json
+
+VOCAB_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "files", "vocab")
+KINDS = ("fandoms", "characters", "relationships", "tags")
+
+_PAIR_SHIFT = 32
+_PAIR_MASK  = (1 << _PAIR_SHIFT) - 1
+
+
+class Vocab:
+    """Bidirectional ``name <-> id`` map with IDs assigned in first-seen order."""
+
+    def __init__(self, names=()):
+        self.names = list(names)
+        self.ids = {name: i for i, name in enumerate(self.names)}
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return name in self.ids
+
+    def add(self, name):
+        """ID of *name*, assigning the next free one if it is new."""
+        i = self.ids.get(name)
+        if i is None:
+            i = self.ids[name] = len(self.names)
+            self.names.append(name)
+        return i
+
+    def get(self, name, default=-1):
+        return self.ids.get(name, default)
+
+    def encode(self, names):
+        """IDs for *names*, adding unseen ones."""
+        add = self.add
+        return [add(n) for n in names]
+
+    def decode(self, ids):
+        names = self.names
+        return [names[i] for i in ids]
+
+    def save(self, path):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.names, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+
+def vocab_path(kind, vocab_dir=VOCAB_DIR):
+    return os.path.join(vocab_dir, f"{kind}.json")
+
+
+def load_vocab(kind, vocab_dir=VOCAB_DIR):
+    """The saved vocabulary for *kind*, or an empty one if none exists yet."""
+    path = vocab_path(kind, vocab_dir)
+    return Vocab.load(path) if os.path.isfile(path) else Vocab()
+
+
+def save_vocab(vocab, kind, vocab_dir=VOCAB_DIR):
+    vocab.save(vocab_path(kind, vocab_dir))
+
+
+# ─── Packed ID pairs ────────────────────────────────────────────────────────
+def pair_key(a, b):
+    """Two int32 IDs → one int key, so ``a → b → count`` fits in a flat dict."""
+    return (a << _PAIR_SHIFT) | b
+
+
+def unpack_pair(key):
+    return key >> _PAIR_SHIFT, key & _PAIR_MASK
+
+
+def group_pairs(pair_counts):
+    """
+    ``{pair_key(a, b): n}`` → ``{a: [(b, n), ...]}``.
+
+    Both levels keep the flat dict's insertion order, i.e. the order a
+    nested ``defaultdict`` would have had.
+    """
+    grouped = {}
+    for key, n in pair_counts.items():
+        a, b = key >> _PAIR_SHIFT, key & _PAIR_MASK
+        inner = grouped.get(a)
+        if inner is None:
+            inner = grouped[a] = []
+        inner.append((b, n))
+    return grouped
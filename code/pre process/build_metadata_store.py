@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+build_metadata_store.py
+───────────────────────
+Run after strip_text_and_recompress.py.  Writes the slimmed corpus to a
+columnar Arrow store (one ``.arrow`` file per shard, one row per work) so
+the count and co-occurrence scripts can memory-map only the columns they
+need instead of decompressing and JSON-parsing every shard again.
+
+INPUT  :  ../../ao3_slimmed/*.jsonl.zst   (or any folder / single .jsonl(.zst) file)
+OUTPUT :  ../../ao3_slimmed_meta/*.arrow
+
+Every row also records where its line sits in the source file, so a store
+built from the raw dump (``--input ../../ao3 --output ../../ao3_meta``) is
+a work index: subset selection (filter_hp.py --store, build_train_set.py
+--index) runs on the metadata columns and then seeks straight to the
+matching records.
+
+Shards already in the store and unchanged since (see .manifest.json in the
+output folder) are skipped; ``--force`` rebuilds them all.
+
+    python build_metadata_store.py --workers 16
+    python build_metadata_store.py --input ../../ao3_filtered --output ../../ao3_filtered_meta
+"""
+
+import argparse, functools, json, os
+
+from extract_utils import list_shards, Manifest, MANIFEST_NAME
+from shard_runner import add_workers_arg, map_shards
+from common.metadata_store import store_name, write_store_file
+from common.seekable_zst import iter_indexed_lines
+
+INPUT_DIR  = "../../ao3_slimmed"
+OUTPUT_DIR = "../../ao3_slimmed_meta"
+
+
+def parse_metadata(line):
+    """The record without its ``text`` member."""
+    entry = json.loads(line)
+    entry.pop("text", None)
+    return entry
+
+
+def iter_numbered_records(path):
+    """``(line_no, (frame, offset, length), entry)`` per parseable line; bad lines keep their number."""
+    for line_no, (frame, offset, line) in enumerate(iter_indexed_lines(path)):
+        try:
+            entry = parse_metadata(line)
+        except (ValueError, UnicodeDecodeError):
+            continue
+        yield line_no, (frame, offset, len(line)), entry
+
+
+def build_shard(path, output_dir):
+    out_path = os.path.join(output_dir, store_name(path))
+    rows = write_store_file(iter_numbered_records(path), out_path, source=path)
+    print(f"🗃️  {os.path.basename(path)} → {os.path.basename(out_path)} ({rows:,} works)")
+    return rows
+
+
+if __name__ == "__main__":
+    parser = add_workers_arg(argparse.ArgumentParser(description="Build the columnar metadata store."))
+    parser.add_argument("--input", default=INPUT_DIR, help="shard folder or single .jsonl(.zst) file")
+    parser.add_argument("--output", default=OUTPUT_DIR, help="store folder")
+    parser.add_argument("--force", action="store_true", help="rebuild unchanged shards too")
+    args = parser.parse_args()
+
+    os.makedirs(args.output, exist_ok=True)
+    sources = [args.input] if os.path.isfile(args.input) else list_shards(args.input)
+    manifest = Manifest(os.path.join(args.output, MANIFEST_NAME), stage="metadata_store/2")
+
+    def out_path(src):
+        return os.path.join(args.output, store_name(src))
+
+    todo = [src for src in sources
+            if args.force or not manifest.is_current(src, [out_path(src)])]
+    print(f"⏭️  {len(sources) - len(todo)} of {len(sources)} file(s) unchanged")
+
+    total = 0
+    for src, rows in zip(todo, map_shards(functools.partial(build_shard, output_dir=args.output),
+                                          todo, args.workers)):
+        total += rows
+        manifest.record(src, [out_path(src)], rows=rows)
+        manifest.save()
+    manifest.prune(sources)
+    manifest.save()
+    print(f"✅ Done. Stored {total:,} works from {len(todo)} file(s) in {args.output}")
@@ -0,0 +1,5 @@
+# Single pass over ao3_slimmed → fandom, character, relationship and tag tables.
+from metadata_counts import KINDS, main
+
+if __name__ == "__main__":
+    main(KINDS)
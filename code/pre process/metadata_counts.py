@@ -0,0 +1,269 @@
+"""
+metadata_counts.py
+──────────────────
+Fandom / character / relationship / tag count tables from ao3_slimmed.
+
+All four tables are filled from a single pass: each record is decompressed,
+parsed and its comma-separated fields split exactly once, then every
+requested aggregator is updated.  ``extract_all.py`` builds all four; the
+single-table scripts are thin wrappers that ask for just their own table
+(or for all of them with ``--all``).
+
+Each shard's partial tables are cached under files/.partials/ with a
+manifest, so a rerun only re-reads shards that are new or changed (e.g. a
+freshly added dump slice) and merges them with the cached partials of the
+rest; ``--force`` recounts everything.
+
+Internally every table is keyed by integer tag IDs (see common/vocab.py):
+``fandom → count`` is ``{fandom_id: n}`` and ``char → fandom → count`` is a
+flat ``{pair_key(char_id, fandom_id): n}``.  Names are decoded only when the
+outputs are written, and the vocabularies are saved to files/vocab/.
+
+OUTPUTS :  ../../files/fandom_counts.jsonl
+           ../../files/characters_list.jsonl
+           ../../files/relationships_list.jsonl
+           ../../files/tags_list.jsonl
+"""
+
+import argparse, functools, json, os, pickle, time
+
+from extract_utils import (
+    iter_jsonl_zst_file, split_field, list_shards, SHARD_SUFFIX, Manifest, MANIFEST_NAME, atomic_open,
+)
+from shard_runner import add_workers_arg, map_shards
+from common.vocab import Vocab, load_vocab, save_vocab, pair_key, unpack_pair, group_pairs
+
+INPUT_FOLDER = "../../ao3_slimmed"
+CACHE_DIR    = "../../files/.partials"
+
+KINDS = ("fandoms", "characters", "relationships", "tags")
+
+OUTPUT_FILES = {
+    "fandoms":       "../../files/fandom_counts.jsonl",
+    "characters":    "../../files/characters_list.jsonl",
+    "relationships": "../../files/relationships_list.jsonl",
+    "tags":          "../../files/tags_list.jsonl",
+}
+
+# store columns in the order count_fields() unpacks them
+STORE_COLUMNS = ("fandoms", "characters", "relationships", "tags")
+
+# tables keyed by pair_key(name_id, fandom_id) rather than a single id
+PAIR_KINDS = {"characters", "relationships"}
+
+
+def _count_per_fandom(table, ids, fandom_ids):
+    for i in ids:
+        for f in fandom_ids:
+            key = pair_key(i, f)
+            table[key] = table.get(key, 0) + 1
+
+
+def count_fields(rows, kinds=KINDS):
+    """
+    Fill the requested tables from ``(fandoms, characters, relationships, tags)``
+    lists.  Returns the ID-keyed tables plus the shard-local vocabularies
+    (``{"names": {kind: [name, ...]}, "tables": {kind: table}}``).
+    """
+    vocabs = {kind: Vocab() for kind in KINDS}
+    tables = {kind: {} for kind in kinds}
+    fandom_t = tables.get("fandoms")
+    char_t   = tables.get("characters")
+    rel_t    = tables.get("relationships")
+    tag_t    = tables.get("tags")
+    fandom_v, char_v, rel_v, tag_v = (vocabs[kind] for kind in KINDS)
+
+    for fandoms, chars, rels, tags in rows:
+        fandom_ids = fandom_v.encode(fandoms)
+        if fandom_t is not None:
+            for f in fandom_ids:
+                fandom_t[f] = fandom_t.get(f, 0) + 1
+        # a character/relationship only gets a row once it is seen with a fandom
+        if fandom_ids and char_t is not None:
+            _count_per_fandom(char_t, char_v.encode(chars), fandom_ids)
+        if fandom_ids and rel_t is not None:
+            _count_per_fandom(rel_t, rel_v.encode(rels), fandom_ids)
+        if tag_t is not None:
+            for t in tag_v.encode(tags):
+                tag_t[t] = tag_t.get(t, 0) + 1
+
+    return {"names": {kind: v.names for kind, v in vocabs.items()}, "tables": tables}
+
+
+def count_records(records, kinds=KINDS):
+    """Fill the requested tables from an iterable of parsed works."""
+    def fields(entry):
+        meta = entry.get("metadata", {})
+        return (split_field(meta, "Fandom"),
+                split_field(meta, "Characters") if "characters" in kinds else (),
+                split_field(meta, "Relationship") if "relationships" in kinds else (),
+                split_field(meta, "Additional Tags") if "tags" in kinds else ())
+    return count_fields(map(fields, records), kinds)
+
+
+def count_shard(path, kinds=KINDS):
+    return count_records(iter_jsonl_zst_file(path), kinds)
+
+
+def count_store_file(path, kinds=KINDS):
+    from common.metadata_store import iter_store_columns
+    return count_fields(iter_store_columns(path, list(STORE_COLUMNS)), kinds)
+
+
+def count_shard_cached(item, store=False):
+    """
+    Worker for incremental runs: *item* is ``(path, cache_path, reuse)``.
+
+    Reuses the pickled partial when the manifest says the shard is unchanged,
+    otherwise counts every kind (so any script can reuse it) and caches it.
+    """
+    path, cache_path, reuse = item
+    if reuse:
+        with open(cache_path, "rb") as f:
+            return pickle.load(f)
+    partial = count_store_file(path) if store else count_shard(path)
+    with atomic_open(cache_path, "wb") as f:
+        pickle.dump(partial, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return partial
+
+
+def merge_tables(total, partial, vocabs, kinds=KINDS):
+    """Fold one shard's tables into *total*, translating its local IDs via *vocabs*."""
+    needed = set(kinds) | {"fandoms"}
+    remap = {kind: vocabs[kind].encode(names)
+             for kind, names in partial["names"].items() if kind in needed}
+    fandom_map = remap["fandoms"]
+    for kind, table in partial["tables"].items():
+        if kind not in kinds:
+            continue
+        out = total.setdefault(kind, {})
+        id_map = remap[kind]
+        if kind in PAIR_KINDS:
+            for key, n in table.items():
+                i, f = unpack_pair(key)
+                key = pair_key(id_map[i], fandom_map[f])
+                out[key] = out.get(key, 0) + n
+        else:
+            for i, n in table.items():
+                i = id_map[i]
+                out[i] = out.get(i, 0) + n
+    return total
+
+
+def extract(kinds=KINDS, input_folder=INPUT_FOLDER, workers=1, store=None, vocabs=None,
+            force=False):
+    """
+    One pass over every shard → ``({kind: table}, {kind: Vocab})``.
+
+    With *store* set, the split fields are read from the Arrow metadata store
+    (see build_metadata_store.py) instead of the ``.jsonl.zst`` shards.
+    Unchanged shards come from the partial cache unless *force* is set.
+    New names are appended to *vocabs* (default: the saved files/vocab/ ones).
+    """
+    if vocabs is None:
+        vocabs = {kind: load_vocab(kind) for kind in KINDS}
+    if store:
+        from common.metadata_store import STORE_SUFFIX
+        shards = list_shards(store, STORE_SUFFIX)
+    else:
+        shards = list_shards(input_folder, SHARD_SUFFIX)
+
+    cache_dir = os.path.join(CACHE_DIR, "store" if store else "shards")
+    os.makedirs(cache_dir, exist_ok=True)
+    manifest = Manifest(os.path.join(cache_dir, MANIFEST_NAME), stage="metadata_counts")
+    for name in manifest.prune(shards):
+        cached = os.path.join(cache_dir, name + ".pkl")
+        if os.path.exists(cached):
+            os.remove(cached)
+
+    items = []
+    for path in shards:
+        cache_path = os.path.join(cache_dir, os.path.basename(path) + ".pkl")
+        items.append((path, cache_path, not force and manifest.is_current(path, [cache_path])))
+    reused = sum(reuse for _, _, reuse in items)
+    print(f"⏭️  {reused} of {len(items)} shards unchanged (cached partial counts)")
+
+    started = time.perf_counter()
+    tables = {}
+    partials = map_shards(functools.partial(count_shard_cached, store=bool(store)), items, workers)
+    for (path, cache_path, reuse), partial in zip(items, partials):
+        merge_tables(tables, partial, vocabs, kinds)
+        if not reuse:
+            manifest.record(path, [cache_path])
+            manifest.save()
+    manifest.save()
+    print(f"📊 {len(items) - reused} shards counted in {time.perf_counter() - started:,.1f}s "
+          f"({max(1, min(workers, len(items)))} worker(s))")
+    return {kind: tables.get(kind, {}) for kind in kinds}, vocabs
+
+
+# ─── Writers ────────────────────────────────────────────────────────────────
+def write_fandom_counts(table, path, names):
+    with atomic_open(path, "w", encoding="utf-8") as f_out:
+        for idx, (fandom, count) in enumerate(table.items(), 1):
+            json.dump({"id": idx, "fandom": names[fandom], "count": count}, f_out)
+            f_out.write("\n")
+    return len(table)
+
+
+def write_top_fandom_list(table, path, names, fandom_names):
+    # Save top fandoms (max 2) for each character / relationship
+    grouped = group_pairs(table)
+    with atomic_open(path, "w", encoding="utf-8") as out:
+        for idx, (name_id, fan_counts) in enumerate(grouped.items(), 1):
+            sorted_fandoms = sorted(fan_counts, key=lambda x: x[1], reverse=True)
+            top_fandoms = [fandom_names[sorted_fandoms[0][0]]]
+            if len(sorted_fandoms) > 1:
+                ratio = sorted_fandoms[1][1] / sorted_fandoms[0][1]
+                if ratio >= 0.9:
+                    top_fandoms.append(fandom_names[sorted_fandoms[1][0]])
+            total_count = sum(n for _, n in fan_counts)
+            json.dump({"id": idx, "name": names[name_id], "fandom": top_fandoms, "count": total_count}, out)
+            out.write("\n")
+    return len(grouped)
+
+
+def write_tag_counts(table, path, names):
+    with atomic_open(path, "w", encoding="utf-8") as out:
+        for idx, (tag, count) in enumerate(table.items(), 1):
+            json.dump({"id": idx, "name": names[tag], "count": count}, out)
+            out.write("\n")
+    return len(table)
+
+
+WRITERS = {
+    "fandoms":       write_fandom_counts,
+    "characters":    write_top_fandom_list,
+    "relationships": write_top_fandom_list,
+    "tags":          write_tag_counts,
+}
+
+
+def write_tables(tables, vocabs, output_files=OUTPUT_FILES):
+    for kind, table in tables.items():
+        write = WRITERS[kind]
+        if write is write_top_fandom_list:
+            write = functools.partial(write, fandom_names=vocabs["fandoms"].names)
+        rows = write(table, output_files[kind], vocabs[kind].names)
+        print(f"✅ Saved {rows} {kind} to {output_files[kind]}")
+
+
+def main(kinds=KINDS, argv=None):
+    parser = add_workers_arg(argparse.ArgumentParser(
+        description="Build the AO3 metadata count tables from ao3_slimmed."))
+    parser.add_argument("--all", action="store_true",
+                        help="fused pass: write all four count tables from one read")
+    parser.add_argument("--store", metavar="DIR",
+                        help="read the Arrow metadata store in DIR instead of the shards")
+    parser.add_argument("--force", action="store_true",
+                        help="recount every shard instead of reusing cached partials")
+    args = parser.parse_args(argv)
+    if args.all:
+        kinds = KINDS
+
+    print(f"🔍 Counting {', '.join(kinds)} in {args.store or INPUT_FOLDER}...")
+    tables, vocabs = extract(kinds, INPUT_FOLDER, args.workers, args.store, force=args.force)
+    write_tables(tables, vocabs)
+    for kind, vocab in vocabs.items():
+        if vocab.names:
+            save_vocab(vocab, kind)
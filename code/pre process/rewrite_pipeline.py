@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+rewrite_pipeline.py
+───────────────────
+Pipelined decompress → transform → recompress for whole shard folders.
+
+Three stages run at once for each shard:
+
+  reader   (main thread)   decompresses and cuts lines into batches
+  workers  (process pool)  ``json.loads`` → transform → ``json.dumps``
+  writer   (thread)        zstd-compresses finished batches with ``threads``
+                           compressor threads, strictly in input order
+
+Output is in the zstd seekable format (common/seekable_zst.py): a new
+independent frame every ``--frame-mb`` MB, always at a line boundary, plus a
+seek table at the end.  Every zstd reader still sees one stream, but the
+outputs can be split across processes (``split_shard``) and records can be
+reached without decompressing from the start.  ``--frame-mb 0`` writes a
+single frame as before.
+
+Transforms with a raw-bytes path (see transforms.py) can skip the JSON
+round trip with ``--fast-path``: kept lines are written byte for byte and
+the text body is never built as a str.  It is off by default because
+validating the text value in Python is slower than ``json.loads`` itself.
+At most ``2 × workers`` batches are in flight, so memory stays bounded.
+Each shard is written to ``<name>.tmp`` and renamed into place when done,
+so a crash never leaves a truncated output behind.  ``.manifest.json`` in
+the output folder records every finished shard; reruns skip shards whose
+input and output are unchanged (``--force`` rebuilds everything).
+
+    python rewrite_pipeline.py ../../ao3 ../../ao3_slimmed --transform strip-text --workers 8 --threads 4
+    python rewrite_pipeline.py IN OUT --transform mymodule:my_transform
+"""
+
+import argparse, json, os, queue, threading, time
+from concurrent.futures import ProcessPoolExecutor
+
+import zstandard as zstd
+
+from extract_utils import iter_zst_lines, list_shards, ReadStats, Manifest, MANIFEST_NAME
+from transforms import RAW_TRANSFORMS, resolve_transform
+from common.seekable_zst import SeekableWriter
+
+BATCH_LINES = 2000
+ZSTD_LEVEL  = 3
+FRAME_MB    = 4
+
+
+def add_pipeline_args(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="parse/transform processes (1 = everything in this process)")
+    parser.add_argument("--threads", type=int, default=0,
+                        help="zstd compression threads (0 = compress on the writer thread)")
+    parser.add_argument("--fast-path", action="store_true",
+                        help="raw-bytes path for transforms that have one (less memory, "
+                             "verbatim output, but slower than json.loads/json.dumps)")
+    parser.add_argument("--frame-mb", type=float, default=FRAME_MB,
+                        help="decompressed MB per seekable zstd frame (0 = one frame per file)")
+    parser.add_argument("--force", action="store_true",
+                        help="rebuild every shard, even ones the manifest says are current")
+    return parser
+
+
+def transform_lines(transform, lines, raw=None):
+    """One batch: raw lines in, newline-terminated output bytes out."""
+    out = []
+    for line in lines:
+        if raw is not None:
+            try:
+                kept = raw(line)
+            except ValueError:
+                pass                    # unusual or malformed: full parse below
+            else:
+                if kept is not None:
+                    out.append(kept + b"\n")
+                continue
+        try:
+            obj = json.loads(line.decode("utf-8"))
+        except json.JSONDecodeError:
+            continue
+        obj = transform(obj)
+        if obj is not None:
+            out.append(json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n")
+    return b"".join(out)
+
+
+def _iter_batches(path, stats):
+    batch = []
+    for line in iter_zst_lines(path, stats=stats):
+        batch.append(line)
+        if len(batch) >= BATCH_LINES:
+            stats.records += len(batch)
+            yield batch
+            batch = []
+    if batch:
+        stats.records += len(batch)
+        yield batch
+
+
+class _Done:
+    """Inline 'future' for the single-process path."""
+
+    def __init__(self, value):
+        self.value = value
+
+    def result(self):
+        return self.value
+
+
+def _write_results(pending, writer, errors):
+    """Writer stage: drain futures in submission order into the zstd stream."""
+    try:
+        while True:
+            fut = pending.get()
+            if fut is None:
+                return
+            writer.write(fut.result())
+    except BaseException as exc:           # surfaced by rewrite_shard
+        errors.append(exc)
+        while pending.get() is not None:   # keep the reader unblocked
+            pass
+
+
+def _open_writer(fout, threads, frame_mb):
+    """``(writer, finish)`` for a seekable (``frame_mb`` > 0) or single-frame output."""
+    if frame_mb > 0:
+        writer = SeekableWriter(fout, ZSTD_LEVEL, threads, frame_size=int(frame_mb * (1 << 20)))
+        return writer, writer.close
+    writer = zstd.ZstdCompressor(level=ZSTD_LEVEL, threads=threads).stream_writer(fout)
+    return writer, lambda: writer.flush(zstd.FLUSH_FRAME)
+
+
+def rewrite_shard(input_path, output_path, transform, pool=None, workers=1, threads=0, raw=None,
+                  frame_mb=FRAME_MB):
+    """Rewrite one shard through the pipeline; returns the reader's ReadStats."""
+    stats = ReadStats()
+    tmp_path = output_path + ".tmp"
+    pending = queue.Queue(maxsize=max(2, 2 * workers))
+    errors = []
+
+    try:
+        with open(tmp_path, "wb") as fout:
+            writer, finish = _open_writer(fout, threads, frame_mb)
+            writer_thread = threading.Thread(target=_write_results, args=(pending, writer, errors))
+            writer_thread.start()
+            try:
+                for batch in _iter_batches(input_path, stats):
+                    if errors:
+                        break
+                    if pool is None:
+                        pending.put(_Done(transform_lines(transform, batch, raw)))
+                    else:
+                        pending.put(pool.submit(transform_lines, transform, batch, raw))
+            finally:
+                pending.put(None)
+                writer_thread.join()
+            if errors:
+                raise errors[0]
+            finish()
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+    os.replace(tmp_path, output_path)
+    return stats
+
+
+def rewrite_folder(input_dir, output_dir, transform, workers=1, threads=0,
+                   label="🔧 Rewriting", fast_path=False, force=False, frame_mb=FRAME_MB):
+    """Run *transform* over every changed shard of *input_dir*, writing to *output_dir*."""
+    os.makedirs(output_dir, exist_ok=True)
+    raw = RAW_TRANSFORMS.get(transform) if fast_path else None
+    shards = list_shards(input_dir)
+    manifest = Manifest(os.path.join(output_dir, MANIFEST_NAME),
+                        stage=f"{transform.__module__}.{transform.__qualname__}/frame_mb={frame_mb:g}")
+    manifest.prune(shards)
+    pool = ProcessPoolExecutor(max_workers=workers) if workers > 1 else None
+    try:
+        for input_path in shards:
+            filename = os.path.basename(input_path)
+            output_path = os.path.join(output_dir, filename)
+            if not force and manifest.is_current(input_path, [output_path]):
+                print(f"⏭️  {filename} unchanged, skipping")
+                continue
+            print(f"{label} {filename}...")
+            stats = rewrite_shard(input_path, output_path, transform, pool, workers, threads, raw,
+                                  frame_mb)
+            print(f"   {stats.summary()}")
+            manifest.record(input_path, [output_path])
+            manifest.save()
+    finally:
+        if pool is not None:
+            pool.shutdown()
+        manifest.save()
+
+
+if __name__ == "__main__":
+    parser = add_pipeline_args(argparse.ArgumentParser(description="Rewrite .jsonl.zst shards."))
+    parser.add_argument("input_dir")
+    parser.add_argument("output_dir")
+    parser.add_argument("--transform", required=True,
+                        help="strip-text, exclude-original-reader or module:function")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rewrite_folder(args.input_dir, args.output_dir, resolve_transform(args.transform),
+                   args.workers, args.threads, fast_path=args.fast_path, force=args.force,
+                   frame_mb=args.frame_mb)
+    print(f"✅ Done in {time.perf_counter() - started:,.1f}s. Files saved to: {args.output_dir}")
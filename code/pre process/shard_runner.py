@@ -0,0 +1,57 @@
+"""
+shard_runner.py
+───────────────
+Map-reduce over ``*.jsonl.zst`` shards.
+
+Every shard goes to its own worker process, which returns a partial count
+table (plain dicts, so it pickles).  The partials are merged back in shard
+order, so keys keep their first-seen order and the output files come out
+byte-identical to a single-process run.
+"""
+
+import argparse, time
+from concurrent.futures import ProcessPoolExecutor
+
+from extract_utils import list_shards, SHARD_SUFFIX
+
+
+def add_workers_arg(parser: argparse.ArgumentParser) -> argparse.ArgumentParser:
+    parser.add_argument("--workers", type=int, default=1,
+                        help="worker processes, one shard each (default: 1 = serial)")
+    return parser
+
+
+def map_shards(map_fn, shards, workers=1):
+    """Yield ``map_fn(shard)`` for every shard, in shard order."""
+    if workers <= 1 or len(shards) <= 1:
+        for shard in shards:
+            yield map_fn(shard)
+        return
+    with ProcessPoolExecutor(max_workers=min(workers, len(shards))) as pool:
+        yield from pool.map(map_fn, shards)
+
+
+def merge_counts(total, partial):
+    """``total[k] += partial[k]`` keeping first-seen key order."""
+    for key, n in partial.items():
+        total[key] = total.get(key, 0) + n
+    return total
+
+
+def merge_nested_counts(total, partial):
+    """Same as ``merge_counts`` for ``key -> sub-key -> count`` tables."""
+    for key, inner in partial.items():
+        merge_counts(total.setdefault(key, {}), inner)
+    return total
+
+
+def run_sharded(folder_path, map_fn, merge_fn, workers=1, suffix=SHARD_SUFFIX):
+    """Run *map_fn* on every shard in *folder_path* and fold with *merge_fn*."""
+    shards = list_shards(folder_path, suffix)
+    started = time.perf_counter()
+    total = {}
+    for partial in map_shards(map_fn, shards, workers):
+        merge_fn(total, partial)
+    print(f"📊 {len(shards)} shards in {time.perf_counter() - started:,.1f}s "
+          f"({max(1, min(workers, len(shards)))} worker(s))")
+    return total
@@ -0,0 +1,80 @@
+"""
+transforms.py
+─────────────
+Per-record transforms for rewrite_pipeline.py.
+
+A transform takes one parsed work and returns the (possibly modified) work
+to keep, or ``None`` to drop it.  They run in worker processes, so they
+must be plain module-level functions.
+
+A transform may also have a raw-bytes path in ``RAW_TRANSFORMS``, used
+with ``--fast-path``: it gets the undecoded line and returns the bytes to
+write (or ``None``), or raises ``ValueError`` to have that line go through
+the normal ``json.loads`` → transform → ``json.dumps`` route instead.
+"""
+
+import importlib, json, os, sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from common.json_spans import drop_last_member  # noqa: E402
+
+
+def strip_text(obj):
+    """Drop the full ``text`` body (ao3 → ao3_slimmed)."""
+    if "text" in obj:
+        del obj["text"]
+    return obj
+
+
+def should_exclude(entry):
+    meta = entry.get("metadata", {})
+    # Exclude if "Original Work" is one of the fandoms
+    fandoms = [f.strip() for f in meta.get("Fandom", "").split(",")]
+    if "Original Work" in fandoms:
+        return True
+    # Exclude if "Reader" is one of the characters
+    characters = [c.strip() for c in meta.get("Characters", "").split(",")]
+    if "Reader" in characters:
+        return True
+    return False
+
+
+def exclude_original_and_reader(obj):
+    """Drop Original Work and Reader-insert works (ao3_slimmed → ao3_filtered)."""
+    return None if should_exclude(obj) else obj
+
+
+def strip_text_raw(line):
+    """Cut the trailing ``text`` member off the raw line without decoding it."""
+    return drop_last_member(line, "text")
+
+
+def exclude_original_and_reader_raw(line):
+    """Decide on the parsed (text-free) work, but pass kept lines through verbatim."""
+    try:
+        obj = json.loads(line)
+    except json.JSONDecodeError:
+        return None
+    return None if should_exclude(obj) else line
+
+
+TRANSFORMS = {
+    "strip-text":              strip_text,
+    "exclude-original-reader": exclude_original_and_reader,
+}
+
+
+RAW_TRANSFORMS = {
+    strip_text:                  strip_text_raw,
+    exclude_original_and_reader: exclude_original_and_reader_raw,
+}
+
+
+def resolve_transform(spec):
+    """A registered name, or ``"module:function"`` for a user transform."""
+    if spec in TRANSFORMS:
+        return TRANSFORMS[spec]
+    module_name, sep, attr = spec.partition(":")
+    if not sep:
+        raise ValueError(f"unknown transform {spec!r}; use one of {sorted(TRANSFORMS)} or module:function")
+    return getattr(importlib.import_module(module_name), attr)